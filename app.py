@@ -1,20 +1,55 @@
 import os
 import dotenv
+import time
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Header
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from src.agent.router_agent import initialize_routing_agent
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from src.agent.router_agent import load_routing_agents, initialize_dispatch_router, stream_sub_agent, stream_dispatch, run_sub_agent_once, ROUTING_MODE
 from pydantic_ai.messages import ModelMessage 
-from src.utils.load_utils import BasicConfig
-from typing import Dict, List
+from src.utils.load_utils import BasicConfig, http_clients
+from src.utils.hedged_model import HedgedModel
+from src.utils.usage_budget import metered, usage_totals
+from pydantic_ai.exceptions import UsageLimitExceeded
+from src.utils.columnar import receive_table, table_store, ColumnarFormatError, UploadTooLargeError
+from src.utils.block_store import block_store, read_block, MissingBlocksError
+from src.utils.response_cache import ResponseCache, PROMPT_VERSION, cache_bypassed, calls_tool, normalize_message
+from src.utils.search_cache import search_cache
+from src.utils.search_fanout import fanout_stats
+from src.utils.passage_ranking import ranking_stats
+from src.utils.map_reduce import summary_stats
+from src.utils.pre_router import PreRouter, PRE_ROUTER_ENABLED
+from src.utils.history import HistoryManager
+from src.utils.session_store import create_session_store, SessionLockTimeout
+from src.agent.research_agent import generate_summary_agent
+from src.utils.streaming import stream_run, sse_event
+from src.utils.ws_sessions import SocketSession, ws_stats
+from src.utils.single_flight import single_flight, single_flight_stats
+from src.utils.admission import AdmissionRejected, admission, admission_stats
+from typing import Dict, List, Literal
 
 dotenv.load_dotenv()
 
+# Rows one /chat/batch request may carry, and how many of them run at the same time
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "120"))
+
 API_KEY = os.getenv("API_KEY", "default_api_key")
 assert API_KEY != "default_api_key", "Please set a secure API key in the .env file."
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # finish background history compaction, then close the upstream connection pools
+    await conversation_histories.drain()
+    await http_clients.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "https://localhost:3000",
@@ -32,46 +67,404 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Map from user_id → list of ModelMessage
-conversation_histories: Dict[str, List[ModelMessage]] = {}
-
 class ChatRequest(BaseModel):
     message: str
     user_id: str | None = None
+    # Handles returned by /tables for ranges uploaded in binary form
+    table_handles: List[str] | None = None
+
+class BatchChatRequest(BaseModel):
+    # One prompt per row; `instructions` is put in front of each of them
+    messages: List[str] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+    instructions: str = ""
+    # Agent for every row; routed once for the whole batch when not given
+    target: Literal["excel", "research"] | None = None
+    user_id: str | None = None
+    table_handles: List[str] | None = None
+
+class BlockQuery(BaseModel):
+    hashes: List[str]
+
+class ManifestColumn(BaseModel):
+    name: str
+    blocks: List[str]
+
+class TableManifest(BaseModel):
+    columns: List[ManifestColumn]
 
 BasicConfig = BasicConfig()
-router_agent = initialize_routing_agent(BasicConfig)
+router_agent, research_agent, excel_agent = load_routing_agents(BasicConfig)
+# Obvious requests go straight to a sub-agent, the routing LLM only sees the ambiguous ones
+pre_router = PreRouter.load() if PRE_ROUTER_ENABLED else None
+dispatch_router = initialize_dispatch_router(BasicConfig) if ROUTING_MODE == "dispatch" else None
+summary_agent = generate_summary_agent(BasicConfig.llm_model, langfuse=BasicConfig.langfuse, logger=BasicConfig.logger)
+
+async def summarize_history(transcript: str) -> str:
+    result = await summary_agent.run(transcript)
+    return result.output
+
+# Per-user history under a token budget, in the SESSION_STORE backend; older turns are summarized in the background
+conversation_histories = HistoryManager(summarizer=summarize_history, store=create_session_store())
+# Answers are only reused while the model and prompts stay the same
+response_cache = ResponseCache(version=f"{BasicConfig.llm_model.model_name}:{PROMPT_VERSION}")
+answer_flight = single_flight("answers")
 
 @app.post("/chat")
-async def chat(body: ChatRequest, x_api_key: str = Header(...)):
+async def chat(body: ChatRequest, request: Request, x_api_key: str = Header(...)):
     if x_api_key != API_KEY:
         return {"error": "Unauthorized"}, 401
-    
-    user_id = 0
+
+    user_id = body.user_id or "0"
+    try:
+        # bounded number of requests in progress; past that, a short queue, then 429/503
+        async with admission.slot():
+            # one request per user at a time, across all workers
+            async with conversation_histories.lock(user_id):
+                return await answer(user_id, body, use_cache=not cache_bypassed(request.headers))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+    except SessionLockTimeout as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except UsageLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+@app.post("/chat/stream")
+async def chat_stream(body: ChatRequest, request: Request, x_api_key: str = Header(...)):
+    """Same as /chat, sent as server-sent events: status/tool progress, report outline and sections as they are
+    written, answer tokens, then "done" with the reply."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user_id = body.user_id or "0"
+    use_cache = not cache_bypassed(request.headers)
+    # admitted before the response starts, so a rejection is still a plain 429/503
+    try:
+        slot = await admission.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+
+    async def events():
+        try:
+            async with conversation_histories.lock(user_id):
+                async for kind, data in stream_answer(user_id, body, use_cache):
+                    yield sse_event(kind, data)
+        except SessionLockTimeout as e:
+            yield sse_event("error", {"detail": str(e)})
+        except Exception as e:
+            BasicConfig.logger.exception("Streaming chat failed")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            slot.release()
+
+    # the background task frees the slot if the client left before the stream started
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(slot.release))
+
+
+@app.post("/chat/batch")
+async def chat_batch(body: BatchChatRequest, x_api_key: str = Header(...)):
+    """Run one prompt per row through a single agent, as server-sent events.
+
+    One "item" event per row, in row order, each with the reply or the error and the usage,
+    then "done" with the totals. Rows do not go through the router or the chat history.
+    """
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    # the whole batch is one request for admission control; its rows still share the upstream limits
+    try:
+        slot = await admission.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+
+    async def events():
+        try:
+            async for kind, data in stream_batch(body):
+                yield sse_event(kind, data)
+        except Exception as e:
+            BasicConfig.logger.exception("Batch chat failed")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            slot.release()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(slot.release))
+
+
+async def route_batch(body: BatchChatRequest) -> str:
+    """One agent for all rows: the requested one, else routed on the instructions and the first row."""
+    if body.target:
+        return body.target
+    sample = f"{body.instructions}\n\n{body.messages[0]}".strip()
+    decision = pre_router.classify(sample) if pre_router else None
+    if decision and decision.fast_path:
+        return decision.target
+    if dispatch_router:
+        return (await dispatch_router.run(sample)).output.target
+    # the batch feature is used from the spreadsheet add-in
+    return "excel"
+
+
+async def stream_batch(body: BatchChatRequest):
+    user_id = body.user_id or "0"
+    target = await route_batch(body)
+    tables = table_store.describe(body.table_handles) if body.table_handles else None
+    yield "route", {"target": target, "items": len(body.messages)}
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    # identical rows are answered once; excel rows only within the user's own workbook
+    flight = single_flight("batch")
+    # excel rows change the user's session workbook: one row at a time, never during one of the user's chat turns
+    workbook_lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def workbook_turn():
+        if target != "excel":
+            yield
+            return
+        async with workbook_lock, conversation_histories.lock(user_id):
+            yield
+
+    async def run_item(index: int, message: str) -> dict:
+        prompt = f"{body.instructions}\n\n{message}" if body.instructions else message
+        if tables:
+            prompt += "\n\nUploaded tables available to the excel tools (pass the handle as table_handle):\n" + tables
+        key = "\x1f".join((target, user_id if target == "excel" else "", tables or "", normalize_message(prompt)))
+        ran = []
+
+        async def call():
+            ran.append(True)
+            # each row gets the user's budget, and its usage includes the agents its tools ran
+            async with workbook_turn():
+                with metered(user_id) as meter:
+                    reply, _ = await asyncio.wait_for(run_sub_agent_once(target, prompt, user_id, research_agent, excel_agent), BATCH_ITEM_TIMEOUT)
+            return reply, meter.report()
+
+        started = time.perf_counter()
+        async with semaphore:
+            try:
+                reply, usage = await flight.do(key, call)
+            except asyncio.TimeoutError:
+                return {"index": index, "error": f"timed out after {BATCH_ITEM_TIMEOUT:g}s", "seconds": round(time.perf_counter() - started, 3)}
+            except Exception as e:
+                return {"index": index, "error": str(e) or type(e).__name__, "seconds": round(time.perf_counter() - started, 3)}
+        item = {"index": index, "reply": reply, "usage": usage, "seconds": round(time.perf_counter() - started, 3)}
+        if not ran:
+            item["shared"] = True
+        return item
+
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(run_item(index, message)) for index, message in enumerate(body.messages)]
+    totals, failed = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0}, 0
+    try:
+        for task in tasks:
+            item = await task
+            if "error" in item:
+                failed += 1
+            elif not item.get("shared"):
+                totals = {name: totals[name] + item["usage"][name] for name in totals}
+            yield "item", item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    yield "done", {"items": len(tasks), "succeeded": len(tasks) - failed, "failed": failed, "usage": totals,
+                   "seconds": round(time.perf_counter() - started, 3)}
+
+
+async def answer(user_id: str, body: ChatRequest, use_cache: bool = True) -> dict:
+    """Route one message and record the exchange; the caller holds the user's session lock."""
+    async for kind, data in stream_answer(user_id, body, use_cache):
+        if kind == "done":
+            return data
+
+
+async def stream_answer(user_id: str, body: ChatRequest, use_cache: bool = True):
+    """Events of answering one message, ending with ("done", response body) once history is updated.
+
+    Every model call it makes, nested agents included, counts against the user's tier budget;
+    the totals are in the "usage" of the "done" event.
+    """
+    with metered(user_id) as meter:
+        async for kind, data in answer_events(user_id, body, use_cache):
+            if kind == "done":
+                data = {**data, "usage": meter.report()}
+            yield kind, data
+
+
+async def answer_events(user_id: str, body: ChatRequest, use_cache: bool = True):
     user_msg = body.message
+    if body.table_handles:
+        user_msg += "\n\nUploaded tables available to the excel tools (pass the handle as table_handle):\n" + table_store.describe(body.table_handles)
 
     # Load existing history or initialize
-    history = conversation_histories.get(user_id, [])
+    history = await conversation_histories.get(user_id)
+
+    # Answers about uploaded tables depend on their data, never reuse them; excel answers are never stored (below)
+    cache_key = None
+    if response_cache.enabled and not body.table_handles and use_cache:
+        cache_key = response_cache.key(user_msg, history)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            output, new_msgs = cached
+            await conversation_histories.append(user_id, new_msgs)
+            yield "done", {"reply": output, "cached": True}
+            return
 
-    reply = await router_agent.run(user_msg, message_history=history)
+    decision = pre_router.classify(body.message, history) if pre_router else None
+    fast_path = decision is not None and decision.fast_path
+
+    # The same question in the same context, asked while it is being answered, waits for that answer.
+    # Only for questions going straight to research: that run uses no per-user state (the excel agent works
+    # on the user's workbook) and records the same exchange in every user's history.
+    flight_key = None
+    if fast_path and decision.target == "research" and not body.table_handles:
+        flight_key = cache_key or response_cache.key(user_msg, history)
+    shared = answer_flight.follower(flight_key) if flight_key else None
+    if shared is not None:
+        yield "status", {"stage": "waiting for an identical request"}
+        try:
+            output, new_msgs = await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            if not shared.cancelled():
+                raise
+            # the other request failed or was dropped: answer this one normally
+        else:
+            await conversation_histories.append(user_id, new_msgs)
+            yield "done", {"reply": output, "coalesced": True}
+            return
+
+    if fast_path:
+        events = stream_sub_agent(decision.target, user_msg, user_id, research_agent, excel_agent)
+    elif dispatch_router:
+        events = stream_dispatch(dispatch_router, user_msg, history, user_id, research_agent, excel_agent)
+    else:
+        events = stream_run(router_agent, user_msg, message_history=history, deps=user_id)
+
+    output, new_msgs = None, []
+    with answer_flight.leading(flight_key) if flight_key else nullcontext() as publish:
+        async for kind, data in events:
+            if kind == "route":
+                decision = data
+                yield kind, data.model_dump()
+            elif kind == "result":
+                output, new_msgs = data if isinstance(data, tuple) else (data.output, data.new_messages())
+            else:
+                yield kind, data
+        if publish and new_msgs:
+            publish((output, new_msgs))
 
     # Append the new messages into history
-    new_msgs = reply.new_messages()
     if new_msgs:
-        updated_history = history + new_msgs
-        conversation_histories[user_id] = updated_history
+        await conversation_histories.append(user_id, new_msgs)
+    # The key has no user in it, so answers from the excel agent (built on the user's own workbook) are not cached
+    per_user = getattr(decision, "target", None) == "excel" or calls_tool(new_msgs, "excel_queries")
+    if cache_key is not None and not per_user:
+        response_cache.set(cache_key, (output, new_msgs))
+
+    print(f"Reply:{output}")
+    print(f"UserID: {user_id}, Message: {body.message}, Route: {decision}")
+    yield "done", {"reply": output}
+
+
+@app.get("/metrics")
+async def metrics(x_api_key: str = Header(...)):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return {
+        "response_cache": {"enabled": response_cache.enabled, **response_cache.stats()},
+        "search_cache": search_cache.stats(),
+        "search_fanout": fanout_stats,
+        "passage_ranking": ranking_stats,
+        "summaries": summary_stats,
+        "http_pool": http_clients.stats(),
+        "models": BasicConfig.llm_model.stats() if isinstance(BasicConfig.llm_model.wrapped, HedgedModel) else {"hedging": False},
+        "pre_router": pre_router.stats() if pre_router else {"enabled": False},
+        "websocket": ws_stats,
+        "single_flight": single_flight_stats(),
+        "admission": admission_stats(),
+        "usage": usage_totals,
+        "history": {"conversations": await conversation_histories.count(), **conversation_histories.stats},
+    }
+
+
+@app.post("/tables")
+async def upload_table(request: Request, x_api_key: str = Header(...)):
+    """Upload a range in the columnar binary format (or Arrow IPC) and get back a handle for /chat."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        handle, table = await receive_table(request.stream(), request.headers.get("content-type"))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ColumnarFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"handle": handle, "rows": table.rows, "columns": list(table.columns)}
+
+
+@app.post("/blocks/query")
+async def query_blocks(body: BlockQuery, x_api_key: str = Header(...)):
+    """Tell the client which content-addressed blocks it still has to upload."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return {"missing": block_store.missing(body.hashes)}
+
+
+@app.put("/blocks/{digest}")
+async def upload_block(digest: str, request: Request, x_api_key: str = Header(...)):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        rows = block_store.put(digest, await read_block(request.stream()))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ColumnarFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"hash": digest, "rows": rows}
 
-    print(f"Reply:{reply.output}")
-    print(f"UserID: {body.user_id}, Message: {body.message}, Reply: {reply}")
-    return {"reply": reply.output}
+
+@app.post("/tables/manifest")
+async def table_from_manifest(body: TableManifest, x_api_key: str = Header(...)):
+    """Assemble a table from previously uploaded blocks; answers 409 with the missing hashes if any were evicted."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        handle, table = block_store.assemble(body.model_dump())
+    except MissingBlocksError as e:
+        raise HTTPException(status_code=409, detail={"missing": e.missing})
+    return {"handle": handle, "rows": table.rows, "columns": list(table.columns)}
+
+
+@app.delete("/tables/{handle}")
+async def delete_table(handle: str, x_api_key: str = Header(...)):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    table_store.remove(handle)
+    return {"deleted": handle}
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """Multiplexed chat: concurrent requests tagged by id, streamed events, {"type": "cancel", "id": ...} to stop one."""
+    # browsers cannot set headers on WebSocket handshakes, so the key may also come as ?api_key=
+    if (websocket.headers.get("x-api-key") or websocket.query_params.get("api_key")) != API_KEY:
+        await websocket.close(code=1008)
+        return
     await websocket.accept()
-    try:
-        while True:
-            data = await websocket.receive_text()
-            await websocket.send_text(f"Echo: {data}")
-    except WebSocketDisconnect:
-        print("Client disconnected")
+
+    async def handle(message: dict):
+        body = ChatRequest.model_validate(message)
+        user_id = body.user_id or "0"
+        try:
+            slot = await admission.acquire()
+        except AdmissionRejected as e:
+            yield "error", {"detail": str(e), "status": e.status_code, "retry_after": round(e.retry_after, 1)}
+            return
+        try:
+            async with conversation_histories.lock(user_id):
+                async for event in stream_answer(user_id, body, use_cache=not message.get("no_cache")):
+                    yield event
+        finally:
+            slot.release()
+
+    await SocketSession(websocket, handle).serve()
@@ -3,15 +3,41 @@ import dotenv
 import logging
 import asyncio
 import yaml
+import threading
 
+from collections import OrderedDict
 from src.utils.load_utils import BasicConfig
-from pydantic_ai import Agent, RunContext, UsageLimits
+from src.utils.formula_engine import compile_formula, to_output, FormulaSyntaxError
+from src.utils.formula_vector import compile_vector_formula, summarize_vector, COLUMN_RESULT_LIMIT
+from src.utils.workbook import Workbook, CircularReferenceError
+from src.utils.table_stats import Table, TableError, describe, group_by, pivot
+from src.utils.columnar import table_store
+from pydantic_ai import Agent, RunContext, UsageLimits, ModelRetry
 from pydantic import BaseModel
+from typing import Literal
 
 class ExcelOutput(BaseModel):
     description: str
     instructions: str
 
+class TableResult(BaseModel):
+    columns: list
+    rows: list[list]
+    total_groups: int
+    truncated: bool
+
+Aggregation = Literal["sum", "mean", "count", "min", "max", "median", "std"]
+
+# Number of per-session workbooks kept in memory before the least recently used is dropped
+MAX_WORKBOOKS = int(os.getenv('MAX_WORKBOOKS', '256'))
+
+class ColumnFormulaResult(BaseModel):
+    rows: int
+    values: list
+    truncated: bool
+    summary: dict[str, float]
+    error_counts: dict[str, int]
+
 
 ## Initalize the Agent
 def generate_excel_agent(llm_model, langfuse=None, logger=None):
@@ -30,25 +56,186 @@ def generate_excel_agent(llm_model, langfuse=None, logger=None):
     excel_agent = Agent(llm_model, instructions=excel_agent_instructions, instrument=True, output_type=ExcelOutput)
     logger.info("Excel Agent Initialization successful")
 
+    # One workbook per session, keyed by the run's deps (the user id); sync tools run on worker threads
+    workbooks: OrderedDict[str, Workbook] = OrderedDict()
+    workbooks_lock = threading.Lock()
+
+    def session_workbook(ctx: RunContext[str]) -> Workbook:
+        key = str(ctx.deps) if ctx.deps is not None else "default"
+        with workbooks_lock:
+            workbook = workbooks.get(key)
+            if workbook is None:
+                workbook = workbooks[key] = Workbook()
+                if len(workbooks) > MAX_WORKBOOKS:
+                    workbooks.popitem(last=False)
+            workbooks.move_to_end(key)
+            return workbook
+
+    def resolve_table(table: list[list] | None, table_handle: str | None) -> Table:
+        if table_handle:
+            try:
+                return table_store.get(table_handle)
+            except KeyError:
+                raise ModelRetry(f"Unknown or expired table handle {table_handle!r}")
+        if table is None:
+            raise ModelRetry("Provide either the table rows or a table_handle of an uploaded table")
+        return Table.from_rows(table)
+
+    @excel_agent.tool
+    def compute_formula(ctx: RunContext[str], formula: str, inputs: dict[str, float | str | bool | list]) -> float | str | bool | list:
+        """
+        Compute an Excel formula using given inputs.
+
+        arguments:
+        formula: Excel-style formula, e.g. "SUM(a, b, c)", "IF(A1 > 10, \"High\", \"Low\")" or "SUMIFS(amounts, region, \"West\")"
+        inputs: mapping of variable names or cell references (e.g. "A1") to values; lists are treated as ranges
+            (a list of rows for tables used by VLOOKUP/INDEX, a flat list for single columns)
+
+        returns:
+        the result, or an Excel error code such as "#DIV/0!"
+        """
+        try:
+            compiled = compile_formula(formula)
+        except FormulaSyntaxError as e:
+            raise ModelRetry(f"Could not parse formula: {e}")
+        return to_output(compiled.evaluate(inputs))
+
+    @excel_agent.tool
+    def compute_formula_column(ctx: RunContext[str], formula: str, columns: dict[str, list[float | str | bool | None]] | None = None, constants: dict[str, float | str | bool | list] | None = None, table_handle: str | None = None) -> ColumnFormulaResult:
+        """
+        Apply one Excel formula to every row of one or more columns in a single call.
+
+        arguments:
+        formula: Excel-style formula written for a single row, e.g. "IF(price > 100, price * 0.9, price)"
+        columns: mapping of variable names to column values (one entry per row, null for blank cells)
+        constants: optional mapping of names to values shared by every row (lists are treated as ranges, e.g. a lookup table)
+        table_handle: use the columns of an uploaded table instead of passing them inline
+
+        returns:
+        per-row results (or the first rows when the column is large), a numeric summary and a count of Excel errors
+        """
+        if table_handle:
+            columns = {**resolve_table(None, table_handle).columns, **(columns or {})}
+        try:
+            vector = compile_vector_formula(formula).evaluate(columns or {}, constants)
+        except (FormulaSyntaxError, ValueError) as e:
+            raise ModelRetry(f"Could not evaluate formula over columns: {e}")
+        summary, error_counts = summarize_vector(vector)
+        values = vector.to_list()
+        truncated = len(values) > COLUMN_RESULT_LIMIT
+        return ColumnFormulaResult(rows=len(values), values=values[:COLUMN_RESULT_LIMIT], truncated=truncated,
+                                   summary=summary, error_counts=error_counts)
+
+    @excel_agent.tool
+    def set_cells(ctx: RunContext[str], cells: dict[str, float | str | bool | None]) -> dict[str, float | str | bool | list]:
+        """
+        Store values or formulas in the user's workbook and recalculate only the cells that depend on them.
+
+        arguments:
+        cells: mapping of cell references or names to values, or to formulas starting with "=", e.g. {"A2": 120, "B2": "=A2*1.2"}
+
+        returns:
+        the new value of every cell that was recalculated
+        """
+        workbook = session_workbook(ctx)
+        # the reported values are the ones this call computed
+        with workbook.lock:
+            try:
+                recalculated = workbook.set_cells(cells)
+            except (FormulaSyntaxError, CircularReferenceError) as e:
+                raise ModelRetry(str(e))
+            return workbook.snapshot(recalculated)
+
+    @excel_agent.tool
+    def get_cells(ctx: RunContext[str], names: list[str]) -> dict[str, float | str | bool | list]:
+        """
+        Read the current values of cells from the user's workbook.
+
+        arguments:
+        names: cell references or names, e.g. ["B2", "total"]
+
+        returns:
+        mapping of each name to its value
+        """
+        return session_workbook(ctx).snapshot(names)
+
+    @excel_agent.tool
+    def what_if(ctx: RunContext[str], changes: dict[str, float | str | bool | None], targets: list[str]) -> dict[str, dict[str, float | str | bool | list]]:
+        """
+        Evaluate a scenario: temporarily apply changes to the user's workbook and report how target cells move.
+        The workbook is left unchanged afterwards.
+
+        arguments:
+        changes: mapping of cell references or names to the scenario values or formulas, e.g. {"B2": 0.07}
+        targets: cells to report, e.g. ["D10"]
+
+        returns:
+        for each target, its value before and after the change
+        """
+        workbook = session_workbook(ctx)
+        try:
+            results = workbook.what_if(changes, targets)
+        except (FormulaSyntaxError, CircularReferenceError) as e:
+            raise ModelRetry(str(e))
+        return {target: {"before": to_output(before), "after": to_output(after)} for target, (before, after) in results.items()}
+
+    @excel_agent.tool
+    def describe_table(ctx: RunContext[str], table: list[list[float | str | bool | None]] | None = None, columns: list[str] | None = None, table_handle: str | None = None) -> dict[str, dict]:
+        """
+        Compute summary statistics for a pasted range instead of reasoning about the numbers.
+
+        arguments:
+        table: the range as a list of rows, the first row holding the column names
+        columns: optional subset of columns to describe
+        table_handle: use an uploaded table instead of passing the rows inline
+
+        returns:
+        per column: count, blanks, and sum/mean/std/min/quartiles/max for numbers or unique/top value for text
+        """
+        try:
+            return describe(resolve_table(table, table_handle), columns)
+        except TableError as e:
+            raise ModelRetry(str(e))
+
+    @excel_agent.tool
+    def aggregate_table(ctx: RunContext[str], table: list[list[float | str | bool | None]] | None, group_by_columns: list[str], aggregations: dict[str, list[Aggregation]], table_handle: str | None = None) -> TableResult:
+        """
+        Group the rows of a pasted range and aggregate columns per group, like a SUMIFS / pivot breakdown.
+
+        arguments:
+        table: the range as a list of rows, the first row holding the column names
+        group_by_columns: columns to group by, e.g. ["Region"]; an empty list aggregates the whole table
+        aggregations: columns to aggregate and how, e.g. {"Sales": ["sum", "mean"], "Orders": ["count"]}
+        table_handle: use an uploaded table instead of passing the rows inline
+
+        returns:
+        one row per group with the aggregated values
+        """
+        try:
+            return TableResult(**group_by(resolve_table(table, table_handle), group_by_columns, aggregations))
+        except TableError as e:
+            raise ModelRetry(str(e))
+
     @excel_agent.tool
-    def compute_formula(ctx: RunContext[str], formula: str, inputs: dict[str, float]) -> float:
+    def pivot_table(ctx: RunContext[str], table: list[list[float | str | bool | None]] | None, index: str, columns: str, values: str, aggregation: Aggregation = "sum", table_handle: str | None = None) -> TableResult:
         """
-        Compute a simple Excel formula using given inputs.
+        Build a pivot table from a pasted range.
 
         arguments:
-        formula: Excel-style formula, e.g. "SUM(a, b, c)" or "a * b + c"
-        inputs: mapping of variable names to values
+        table: the range as a list of rows, the first row holding the column names
+        index: column whose values become the pivot rows
+        columns: column whose values become the pivot columns
+        values: column to aggregate in each cell
+        aggregation: how to aggregate the values
+        table_handle: use an uploaded table instead of passing the rows inline
 
         returns:
-        numerical result
-        """
-        # You might parse the formula, or map known functions to Python
-        # For simplicity, here we replace variable names then eval
-        expr = formula
-        for var, val in inputs.items():
-            expr = expr.replace(var, str(val))
-        # Danger: eval is unsafe; in real code use proper parser
-        return eval(expr)
+        the pivot table, the first column holding the row labels
+        """
+        try:
+            return TableResult(**pivot(resolve_table(table, table_handle), index, columns, values, aggregation))
+        except TableError as e:
+            raise ModelRetry(str(e))
         
     return excel_agent
 
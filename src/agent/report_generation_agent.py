@@ -4,14 +4,33 @@ import logging
 import asyncio
 
 from src.utils.load_utils import BasicConfig
+from src.utils.streaming import emit_event, emit_progress
 from pydantic_ai import Agent, RunContext, UsageLimits
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Any
 
 class FinalReport(BaseModel):
     report: str
     next_steps: str
     agent_actions: str
 
+class OutlineSection(BaseModel):
+    heading: str
+    brief: str = Field(description="What this section covers, in one or two sentences")
+
+class ReportOutline(BaseModel):
+    title: str
+    sections: list[OutlineSection]
+
+# Write the report as an outline followed by concurrently generated sections, instead of one long generation
+REPORT_PIPELINE_ENABLED = os.getenv('REPORT_PIPELINE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+REPORT_SECTION_CONCURRENCY = int(os.getenv('REPORT_SECTION_CONCURRENCY', '4'))
+REPORT_MAX_SECTIONS = int(os.getenv('REPORT_MAX_SECTIONS', '8'))
+
+# Written alongside the report sections, they fill the other FinalReport fields
+NEXT_STEPS = OutlineSection(heading="Next steps", brief="Concrete recommended next steps, as a short list.")
+AGENT_ACTIONS = OutlineSection(heading="Agent actions", brief="What the agents did to gather the data this report is based on, as a short list.")
+
 
 
 ## Initalize the Agent
@@ -30,6 +49,86 @@ def generate_report_agent(llm_model, langfuse=None, logger=None):
 
 
 
+def generate_outline_agent(llm_model, logger=None):
+    outline_agent_instructions = "You plan executive summaries and detailed reports. Given the data provided, write the report title and " \
+        f"an outline of at most {REPORT_MAX_SECTIONS} sections, each with a heading and a brief of what it covers. " \
+        "Start with an executive summary section. Sections must not overlap."
+
+    outline_agent = Agent(llm_model, instructions=outline_agent_instructions, instrument=True, output_type=ReportOutline)
+    logger.info("Report Outline Agent Initialization successful")
+    return outline_agent
+
+
+def section_prompt(content: str, outline: ReportOutline, section: OutlineSection) -> str:
+    plan = "\n".join(f"- {item.heading}: {item.brief}" for item in outline.sections)
+    return f"Report: {outline.title}\nOutline:\n{plan}\n\n" \
+        f"Write only the section \"{section.heading}\" ({section.brief}). Do not repeat the heading or cover other sections.\n\n" \
+        f"Data:\n{content}"
+
+
+async def stream_report(outline_agent, section_agent, content: str, concurrency: int = REPORT_SECTION_CONCURRENCY,
+                        usage_limits: UsageLimits | None = None) -> AsyncIterator[tuple[str, Any]]:
+    """Outline the report, then write all its sections concurrently.
+
+    Yields ("outline", ReportOutline), then ("section", {"index", "heading", "text"}) for each section
+    in outline order as soon as it and the ones before it are done, and finally ("result", FinalReport).
+    """
+    emit_progress("outlining report")
+    outline = (await outline_agent.run(content, usage_limits=usage_limits)).output
+    outline.sections = outline.sections[:REPORT_MAX_SECTIONS]
+    yield "outline", outline
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def write(section: OutlineSection) -> str:
+        async with semaphore:
+            result = await section_agent.run(section_prompt(content, outline, section), usage_limits=usage_limits)
+            return result.output.strip()
+
+    sections = outline.sections + [NEXT_STEPS, AGENT_ACTIONS]
+    tasks = [asyncio.create_task(write(section)) for section in sections]
+    try:
+        texts = []
+        for index, (section, task) in enumerate(zip(sections, tasks)):
+            text = await task
+            texts.append(text)
+            emit_progress("writing report", section=section.heading, done=index + 1, total=len(sections))
+            yield "section", {"index": index, "heading": section.heading, "text": text}
+    finally:
+        # closed early or a section failed: stop writing the others
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    body = "\n\n".join(f"## {section.heading}\n\n{text}" for section, text in zip(outline.sections, texts))
+    yield "result", FinalReport(report=f"# {outline.title}\n\n{body}", next_steps=texts[-2], agent_actions=texts[-1])
+
+
+async def generate_report(outline_agent, section_agent, content: str, **kwargs) -> FinalReport:
+    """Run `stream_report` and return the FinalReport.
+
+    The client streaming the run gets the report as it is written: a "report_outline" event with
+    the title and headings, then a "report_section" event with the text of each section, in order.
+    """
+    async for kind, data in stream_report(outline_agent, section_agent, content, **kwargs):
+        if kind == "outline":
+            emit_event("report_outline", {"title": data.title, "sections": [section.heading for section in data.sections]})
+        elif kind == "section":
+            emit_event("report_section", data)
+        elif kind == "result":
+            return data
+
+
+def initialize_report_pipeline(BasicConfig=None):
+    """Outline and section agents for `stream_report`; sections use the final report instructions."""
+    if( BasicConfig is None):
+        BasicConfig = BasicConfig()
+    llm_model, langfuse, logger = BasicConfig.llm_model, BasicConfig.langfuse, BasicConfig.logger
+    outline_agent = generate_outline_agent(llm_model, logger=logger)
+    section_agent = generate_report_agent(llm_model, langfuse=langfuse, logger=logger)
+    return outline_agent, section_agent
+
+
 def initialize_report_agent(BasicConfig=None):
     if( BasicConfig is None):
         BasicConfig = BasicConfig()
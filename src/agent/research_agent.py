@@ -4,12 +4,21 @@ import asyncio
 from pydantic_ai import Agent, RunContext, UsageLimits
 from pydantic_ai.common_tools.tavily import tavily_search_tool
 from pydantic_ai.common_tools.duckduckgo import duckduckgo_search_tool
+from tavily import AsyncTavilyClient
 from datetime import date
-from src.agent.report_generation_agent import initialize_report_agent
-from src.utils.load_utils import BasicConfig
+from src.agent.report_generation_agent import FinalReport, REPORT_PIPELINE_ENABLED, generate_report, initialize_report_agent, initialize_report_pipeline
+from src.utils.load_utils import BasicConfig, http_clients
+from src.utils.search_cache import SEARCH_CACHE_ENABLED, cached_search_tool
+from src.utils.streaming import emit_progress
+from src.utils.search_fanout import FanOutSearch
+from src.utils.single_flight import coalesced_search_tool, single_flight
+from src.utils.admission import limited_search_tool
+from src.utils.response_cache import normalize_message
+from src.utils.map_reduce import MapReduceSummarizer
+from src.utils.passage_ranking import PASSAGE_RANKING_ENABLED, passage_index, ranked_search_tool, select_passages
 
 ## Initalize the Agent
-def generate_root_agent(llm_model, web_search_agent=None, summary_agent=None, report_generation_agent=None, langfuse=None, logger=None):
+def generate_root_agent(llm_model, web_search_agent=None, summary_agent=None, report_generation_agent=None, report_pipeline=None, fan_out_search=None, langfuse=None, logger=None):
 
     root_agent_intructions = root_agent_intructions = "You are a helpful assistant. Use the tools available to you to answer user queries effectively."
     "Use the web search tool to get up-to-date information from the web when needed." \
@@ -24,30 +33,73 @@ def generate_root_agent(llm_model, web_search_agent=None, summary_agent=None, re
 
     if web_search_agent:
         usage_limits = UsageLimits(request_limit=5)  
+        web_search_flight = single_flight("web_search")
         @root_agent.tool
         async def web_search(ctx: RunContext[str], query: str) -> str:
             """Use this tool to perform web searches and retrieve up-to-date information from the web."""
-            result = await web_search_agent.run(query, usage_limits=usage_limits)
+            emit_progress("searching", query=query)
+            # the searches of this run share one ranking index
+            with passage_index():
+                # the same query searched twice at once (parallel tool calls, other users) runs once
+                result = await web_search_flight.do(normalize_message(query), lambda: web_search_agent.run(query, usage_limits=usage_limits))
             return result.output
     
+    if fan_out_search:
+        @root_agent.tool
+        async def multi_search(ctx: RunContext[str], queries: list[str]) -> dict:
+            """
+            Use this tool to search several focused sub-queries at once on every search engine, instead of calling web_search repeatedly.
+
+            arguments:
+            queries: 2 to 6 short, distinct search queries covering the aspects of the question
+
+            returns:
+            one merged list of results without duplicates, best first, each with title, url, content and the engines that found it
+            """
+            emit_progress("searching", queries=queries)
+            result = await fan_out_search.search(queries)
+            if PASSAGE_RANKING_ENABLED:
+                result["results"] = select_passages(" ".join(queries), result["results"])
+            return result
+
     if summary_agent:
+        async def run_summary_agent(content: str) -> str:
+            result = await summary_agent.run(content)
+            return result.output
+
+        # Long content is summarized in parallel chunks, then combined
+        map_reduce_summarizer = MapReduceSummarizer(run_summary_agent)
+
         @root_agent.tool
         async def summarize(ctx: RunContext[str], content: str) -> str:
             """Use this tool to summarize lengthy content into concise summaries."""
-            result = await summary_agent.run(content)
-            return result.output
+            emit_progress("summarizing")
+            return await map_reduce_summarizer(content)
         
-    if report_generation_agent:
+    if report_pipeline:
+        usage_limits = UsageLimits(request_limit=5)
+        outline_agent, section_agent = report_pipeline
+        @root_agent.tool
+        async def generate_final_report(ctx: RunContext[str], content: str) -> FinalReport:
+            """Use this tool to write the final report, with next steps and the actions taken, from all the gathered content."""
+            return await generate_report(outline_agent, section_agent, content, usage_limits=usage_limits)
+
+    elif report_generation_agent:
         usage_limits = UsageLimits(request_limit=5)  
         @root_agent.tool
         async def generate_final_report(ctx: RunContext[str], content: str) -> str:
             """Use this tool to summarize lengthy content into concise summaries."""
+            emit_progress("writing report")
             result = await report_generation_agent.run(content, usage_limits=usage_limits)
             return result.output
 
 
     return root_agent
 
+def tavily_client(api_key: str) -> AsyncTavilyClient:
+    """Tavily client on the shared connection pool."""
+    return AsyncTavilyClient(api_key, client=http_clients.get("tavily"))
+
 def generate_web_search_agent(llm_model, langfuse=None, logger=None):
      
     web_search_instructions = "You are a web search agent. Use the Web Search tool to perform web searches and provide accurate information based on the search results."
@@ -58,13 +110,22 @@ def generate_web_search_agent(llm_model, langfuse=None, logger=None):
     tool = os.getenv('WEB_SEARCH_TOOL', 'tavily')
 
     if tool != 'tavily':
-        web_search_agent = Agent(llm_model, instructions=web_search_instructions, instrument=True,  tools=[duckduckgo_search_tool()])
-    
+        engine, search_tool = 'duckduckgo', duckduckgo_search_tool()
     else:
         # Get API key from environment
         tavily_api_key = os.getenv('TAVILY_API_KEY')
         assert tavily_api_key is not None
-        web_search_agent = Agent(llm_model, instructions=web_search_instructions, instrument=True,  tools=[tavily_search_tool(tavily_api_key)])
+        engine, search_tool = 'tavily', tavily_search_tool(client=tavily_client(tavily_api_key))
+
+    search_tool = limited_search_tool(search_tool, engine)
+    # Identical queries (retries, other users) are answered from the persistent search cache
+    if SEARCH_CACHE_ENABLED:
+        search_tool = cached_search_tool(search_tool, engine)
+    search_tool = coalesced_search_tool(search_tool, engine)
+    # Only the passages relevant to the query reach the model, not the raw pages
+    if PASSAGE_RANKING_ENABLED:
+        search_tool = ranked_search_tool(search_tool, engine)
+    web_search_agent = Agent(llm_model, instructions=web_search_instructions, instrument=True,  tools=[search_tool])
 
     @web_search_agent.instructions
     def add_the_date() -> str:  
@@ -72,6 +133,29 @@ def generate_web_search_agent(llm_model, langfuse=None, logger=None):
     
     return web_search_agent
 
+def generate_search_engines() -> dict:
+    """Search function per engine listed in SEARCH_ENGINES, for the fan-out search tool."""
+    engines = {}
+    for name in os.getenv('SEARCH_ENGINES', 'tavily,duckduckgo').split(','):
+        name = name.strip()
+        if name == 'tavily':
+            tavily_api_key = os.getenv('TAVILY_API_KEY')
+            if not tavily_api_key:
+                continue
+            search_tool = tavily_search_tool(client=tavily_client(tavily_api_key))
+        elif name == 'duckduckgo':
+            search_tool = duckduckgo_search_tool()
+        elif name:
+            raise ValueError(f"Unknown search engine {name!r} in SEARCH_ENGINES")
+        else:
+            continue
+        search_tool = limited_search_tool(search_tool, name)
+        if SEARCH_CACHE_ENABLED:
+            search_tool = cached_search_tool(search_tool, name)
+        search_tool = coalesced_search_tool(search_tool, name)
+        engines[name] = search_tool.function
+    return engines
+
 def generate_summary_agent(llm_model, langfuse=None, logger=None):
 
     summary_agent_instructions = "Summarize the following content concisely and clearly."
@@ -89,6 +173,8 @@ def load_all_agents(BasicConfig=None):
 
     llm_model, langfuse, logger = BasicConfig.llm_model, BasicConfig.langfuse, BasicConfig.logger
     report_generation_agent = initialize_report_agent(BasicConfig=BasicConfig)
+    # Outline first, then the sections written concurrently
+    report_pipeline = initialize_report_pipeline(BasicConfig=BasicConfig) if REPORT_PIPELINE_ENABLED else None
 
     logger.info("Web Search Agent...")
     web_search_agent = generate_web_search_agent(llm_model=llm_model, langfuse=langfuse, logger=logger)
@@ -96,8 +182,11 @@ def load_all_agents(BasicConfig=None):
     logger.info("Initializing Summary Agent...")
     summary_agent = generate_summary_agent(llm_model=llm_model, langfuse=langfuse, logger=logger)
 
+    # Several sub-queries on every engine concurrently, merged into one ranked list
+    fan_out_search = FanOutSearch(generate_search_engines())
+
     logger.info("Initializing Root Agent...")
-    root_agent = generate_root_agent(llm_model, web_search_agent=web_search_agent, summary_agent=summary_agent, report_generation_agent=report_generation_agent, langfuse=langfuse, logger=logger)
+    root_agent = generate_root_agent(llm_model, web_search_agent=web_search_agent, summary_agent=summary_agent, report_generation_agent=report_generation_agent, report_pipeline=report_pipeline, fan_out_search=fan_out_search, langfuse=langfuse, logger=logger)
     return root_agent, web_search_agent, summary_agent
 
 
@@ -1,10 +1,26 @@
 
+import os
 import asyncio
 
+from pydantic import BaseModel
+from typing import Literal
 from pydantic_ai import Agent, RunContext, UsageLimits
-from src.agent.excel_agent import initialize_excel_agent
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart
+from src.agent.excel_agent import initialize_excel_agent, ExcelOutput
 from src.agent.research_agent import initialize_deep_research_agent
 from src.utils.load_utils import BasicConfig
+from src.utils.streaming import emit_progress, stream_run, final_result
+from src.utils.response_cache import normalize_message
+from src.utils.single_flight import single_flight
+
+# "tools": the router calls the sub-agents as tools and restates their answer (one more LLM turn)
+# "dispatch": the router only picks the agent and rewrites the query, the server runs that agent
+ROUTING_MODE = os.getenv('ROUTING_MODE', 'tools')
+assert ROUTING_MODE in ('tools', 'dispatch'), "ROUTING_MODE must be either 'tools' or 'dispatch'"
+
+class RoutingDecision(BaseModel):
+    target: Literal["excel", "research"]
+    query: str
 
 ## Initalize the Agent
 def generate_routing_agent(llm_model, research_agent=None, excel_agent=None, langfuse=None, logger=None):
@@ -23,15 +39,17 @@ def generate_routing_agent(llm_model, research_agent=None, excel_agent=None, lan
     rooting_agent = Agent(llm_model, instructions=routing_agent_intructions, instrument=True)
     logger.info("Routing Base Initialization successful")
 
+    research_flight, excel_flight = single_flight("deep_research"), single_flight("excel_queries")
+
     if research_agent:
         usage_limits = UsageLimits(request_limit=10)  
         @rooting_agent.tool
         async def deep_research(ctx: RunContext[str], query: str) -> str:
             """Use this tool to perform deep research calls."""
             logger.info("deep_research called with query=%s", query)
-            result = await research_agent.run(query, usage_limits=usage_limits)
-            logger.info("research result attrs=%s", dir(result))
-            report = getattr(result, "output", None) or getattr(result, "text", None) or getattr(result, "content", None) or str(result)
+            emit_progress("research agent working", query=query)
+            # concurrent requests researching the same query share one run
+            result = await research_flight.do(normalize_message(query), lambda: research_agent.run(query, usage_limits=usage_limits))
             logger.info(f"Research Agent returned: \n {result.output}")
             return result.output
     
@@ -39,7 +57,10 @@ def generate_routing_agent(llm_model, research_agent=None, excel_agent=None, lan
         @rooting_agent.tool
         async def excel_queries(ctx: RunContext[str], content: str) -> str:
             """Use this tool to handle excel specific queries."""
-            result = await excel_agent.run(content)
+            emit_progress("excel agent working")
+            # the excel agent works on the user's own workbook, so only that user's duplicates are shared
+            key = f"{ctx.deps}\x1f{normalize_message(content)}"
+            result = await excel_flight.do(key, lambda: excel_agent.run(content, deps=ctx.deps))
             logger.info(f"Excel Agent returned: \n {result.output}")
             return result.output
 
@@ -47,7 +68,25 @@ def generate_routing_agent(llm_model, research_agent=None, excel_agent=None, lan
 
 
 
-def initialize_routing_agent(BasicConfig=None):
+def generate_dispatch_router(llm_model, langfuse=None, logger=None):
+
+    dispatch_router_instructions = "You are the first line regarding a user request. Decide which agent should answer it and rewrite the request for that agent." \
+    "Choose 'excel' for anything related to excel, spreadsheets, formulas or data analysis, and 'research' for general questions or anything that requires looking up information." \
+    "The rewritten query must be self-contained: resolve references to earlier messages and keep table handles, cell references and numbers verbatim." \
+    "Do not answer the request yourself."
+
+    dispatch_router = Agent(llm_model, instructions=dispatch_router_instructions, output_type=RoutingDecision)
+    logger.info("Dispatch Router Initialization successful")
+    return dispatch_router
+
+
+def initialize_dispatch_router(BasicConfig=None):
+    if BasicConfig is None:
+        BasicConfig = BasicConfig()
+    return generate_dispatch_router(BasicConfig.llm_model, langfuse=BasicConfig.langfuse, logger=BasicConfig.logger)
+
+
+def load_routing_agents(BasicConfig=None):
 
     if BasicConfig is None:
         BasicConfig = BasicConfig()
@@ -56,9 +95,80 @@ def initialize_routing_agent(BasicConfig=None):
     deep_research_agent = initialize_deep_research_agent(BasicConfig=BasicConfig)
     excel_agent = initialize_excel_agent(BasicConfig=BasicConfig)
     rooting_agent = generate_routing_agent(llm_model, research_agent=deep_research_agent, excel_agent=excel_agent, langfuse=langfuse, logger=logger)
+    return rooting_agent, deep_research_agent, excel_agent
+
+
+def initialize_routing_agent(BasicConfig=None):
+    rooting_agent, deep_research_agent, excel_agent = load_routing_agents(BasicConfig)
     return rooting_agent
 
 
+def format_agent_output(output) -> str:
+    if isinstance(output, ExcelOutput):
+        return f"{output.description}\n\n{output.instructions}"
+    return str(output)
+
+
+async def stream_sub_agent(target: str, message: str, deps: str, research_agent, excel_agent, history_prompt: str | None = None):
+    """Run the excel or research agent directly, skipping the routing LLM, streaming its events.
+
+    The final ("result", ...) event carries the reply and a user/assistant exchange (with
+    `history_prompt`, by default `message`, as the user turn) to append to the router's history,
+    so later turns that do go through the router still see this one.
+    """
+    if target == "excel":
+        yield "status", {"stage": "excel agent working"}
+        events = stream_run(excel_agent, message, deps=deps)
+    else:
+        yield "status", {"stage": "research agent working", "query": message}
+        events = stream_run(research_agent, message, usage_limits=UsageLimits(request_limit=10))
+    async for kind, data in events:
+        if kind != "result":
+            yield kind, data
+            continue
+        output = format_agent_output(data.output)
+        exchange = [
+            ModelRequest(parts=[UserPromptPart(content=history_prompt or message)]),
+            ModelResponse(parts=[TextPart(content=output)]),
+        ]
+        yield "result", (output, exchange)
+
+
+async def run_sub_agent_once(target: str, message: str, deps: str, research_agent, excel_agent):
+    """Run the excel or research agent on one message without history; returns (reply, usage)."""
+    if target == "excel":
+        result = await excel_agent.run(message, deps=deps)
+    else:
+        result = await research_agent.run(message, usage_limits=UsageLimits(request_limit=10))
+    return format_agent_output(result.output), result.usage
+
+
+async def run_sub_agent(target: str, message: str, deps: str, research_agent, excel_agent, history_prompt: str | None = None) -> tuple[str, list[ModelMessage]]:
+    return await final_result(stream_sub_agent(target, message, deps, research_agent, excel_agent, history_prompt))
+
+
+async def stream_dispatch(dispatch_router, message: str, history: list[ModelMessage], deps: str, research_agent, excel_agent):
+    """Let the router pick the agent and rewrite the query, then stream that agent's answer as-is.
+
+    Yields ("route", RoutingDecision) before the agent's events.
+    """
+    yield "status", {"stage": "routing"}
+    decision = (await dispatch_router.run(message, message_history=history)).output
+    yield "route", decision
+    async for event in stream_sub_agent(decision.target, decision.query, deps, research_agent, excel_agent, history_prompt=message):
+        yield event
+
+
+async def dispatch(dispatch_router, message: str, history: list[ModelMessage], deps: str, research_agent, excel_agent) -> tuple[str, list[ModelMessage], RoutingDecision]:
+    decision = None
+    async for kind, data in stream_dispatch(dispatch_router, message, history, deps, research_agent, excel_agent):
+        if kind == "route":
+            decision = data
+        elif kind == "result":
+            output, exchange = data
+    return output, exchange, decision
+
+
 if __name__ == "__main__":
     try:
         BasicConfig = BasicConfig()
@@ -1 +1,22 @@
-from .load_utils import *
\ No newline at end of file
+from .load_utils import *
+from .hedged_model import *
+from .admission import *
+from .usage_budget import *
+from .formula_engine import *
+from .formula_vector import *
+from .formula_lookup import *
+from .workbook import *
+from .table_stats import *
+from .columnar import *
+from .block_store import *
+from .response_cache import *
+from .search_cache import *
+from .single_flight import *
+from .search_fanout import *
+from .passage_ranking import *
+from .pre_router import *
+from .session_store import *
+from .history import *
+from .streaming import *
+from .map_reduce import *
+from .ws_sessions import *
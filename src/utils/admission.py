@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import functools
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from pydantic_ai.models import Model
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.tools import Tool
+
+# Chat requests answered at the same time; the others queue
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '16'))
+# Requests waiting for a slot before new ones are turned away with 429
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '64'))
+# Longest a request may wait in the queue; requests expected to wait longer get 503 right away
+ADMISSION_QUEUE_DEADLINE = float(os.getenv('ADMISSION_QUEUE_DEADLINE', '15'))
+# Concurrent calls per upstream service, UPSTREAM_LIMIT_<SERVICE> (e.g. UPSTREAM_LIMIT_TAVILY=4)
+UPSTREAM_DEFAULT_LIMIT = int(os.getenv('UPSTREAM_DEFAULT_LIMIT', '8'))
+# Service time assumed until requests have been measured
+INITIAL_SERVICE_SECONDS = 10.0
+# Weight of the latest request in the moving average of service times
+SERVICE_TIME_SMOOTHING = 0.1
+WAIT_WINDOW = 500
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing when a request would not get a slot in time."""
+
+    def __init__(self, status_code: int, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Retry-After": str(max(1, round(self.retry_after)))}
+
+
+@dataclass
+class Slot:
+    limiter: "ConcurrencyLimiter"
+    acquired: float
+    released: bool = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter._release(time.monotonic() - self.acquired)
+
+
+class ConcurrencyLimiter:
+    """At most `max_concurrent` holders at a time, the others wait in FIFO order.
+
+    With a `deadline`, a caller whose estimated wait (queue position x average service time /
+    slots) is longer is rejected at once with 503 instead of joining the queue, and a caller
+    still waiting at the deadline gets 503 too; past `max_queue` waiting callers, 429.
+    Without one (upstream limits), callers wait as long as their own timeouts allow.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int | None = None, deadline: float | None = None):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.active = 0
+        self.service_seconds = INITIAL_SERVICE_SECONDS
+        self._queue: deque[asyncio.Future] = deque()
+        self._waits: deque[float] = deque(maxlen=WAIT_WINDOW)
+        self.counters = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_deadline": 0, "timed_out": 0, "max_queue_depth": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def estimated_wait(self, position: int | None = None) -> float:
+        """Seconds until a caller joining the queue at `position` (default: the end) gets a slot."""
+        position = self.queue_depth if position is None else position
+        return (position + 1) * self.service_seconds / self.max_concurrent
+
+    def _reject(self, status_code: int, counter: str, retry_after: float, detail: str):
+        self.counters[counter] += 1
+        raise AdmissionRejected(status_code, retry_after, detail)
+
+    async def acquire(self) -> Slot:
+        if self.active < self.max_concurrent and not self._queue:
+            self.active += 1
+            return self._admitted(0.0)
+        if self.max_queue is not None and self.queue_depth >= self.max_queue:
+            self._reject(429, "rejected_queue_full", self.estimated_wait(), f"{self.name}: too many requests waiting")
+        if self.deadline is not None and self.estimated_wait() > self.deadline:
+            self._reject(503, "rejected_deadline", self.estimated_wait(), f"{self.name}: overloaded, try again later")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(future)
+        self.counters["queued"] += 1
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queue_depth)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.deadline)
+        except asyncio.TimeoutError:
+            self._reject(503, "timed_out", self.estimated_wait(), f"{self.name}: no capacity within {self.deadline:g}s")
+        except asyncio.CancelledError:
+            # handed the slot just as we gave up: pass it on
+            if future.done() and not future.cancelled():
+                self._release(None)
+            raise
+        finally:
+            if future in self._queue:
+                self._queue.remove(future)
+        return self._admitted(time.monotonic() - started)
+
+    def _admitted(self, waited: float) -> Slot:
+        self.counters["admitted"] += 1
+        self._waits.append(waited)
+        return Slot(self, time.monotonic())
+
+    def _release(self, held: float | None):
+        if held is not None:
+            self.service_seconds += SERVICE_TIME_SMOOTHING * (held - self.service_seconds)
+        # the slot goes straight to the next waiter still waiting
+        while self._queue:
+            future = self._queue.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        slot = await self.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def stats(self) -> dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "limit": self.max_concurrent,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            **self.counters,
+            "wait_p50": round(waits[len(waits) // 2], 3) if waits else 0.0,
+            "wait_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+            "service_seconds": round(self.service_seconds, 3),
+        }
+
+
+admission = ConcurrencyLimiter("chat", ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE, deadline=ADMISSION_QUEUE_DEADLINE)
+
+upstream_limiters: dict[str, ConcurrencyLimiter] = {}
+
+
+def upstream_limit(service: str) -> ConcurrencyLimiter:
+    """The shared limiter of one upstream service, sized by UPSTREAM_LIMIT_<SERVICE>."""
+    if service not in upstream_limiters:
+        limit = int(os.getenv(f"UPSTREAM_LIMIT_{service.upper().replace('-', '_')}", str(UPSTREAM_DEFAULT_LIMIT)))
+        upstream_limiters[service] = ConcurrencyLimiter(service, limit)
+    return upstream_limiters[service]
+
+
+def admission_stats() -> dict[str, Any]:
+    return {"requests": admission.stats(), "upstreams": {name: limiter.stats() for name, limiter in upstream_limiters.items()}}
+
+
+class LimitedModel(WrapperModel):
+    """A model whose requests (streams included, until closed) hold a slot of an upstream limiter."""
+
+    def __init__(self, wrapped: Model, limiter: ConcurrencyLimiter):
+        super().__init__(wrapped)
+        self.limiter = limiter
+
+    async def request(self, *args, **kwargs):
+        async with self.limiter.slot():
+            return await super().request(*args, **kwargs)
+
+    @asynccontextmanager
+    async def request_stream(self, *args, **kwargs) -> AsyncIterator:
+        async with self.limiter.slot():
+            async with super().request_stream(*args, **kwargs) as response:
+                yield response
+
+
+def limited_search_tool(tool: Tool, engine: str) -> Tool:
+    """Wrap a search tool so its calls hold a slot of the engine's upstream limiter.
+
+    The wrapped tool keeps the name, description and parameters the model sees.
+    """
+    search = tool.function
+    limiter = upstream_limit(engine)
+
+    @functools.wraps(search)
+    async def limited_search(query: str, **options):
+        async with limiter.slot():
+            return await search(query, **options)
+
+    return Tool(limited_search, name=tool.name, description=tool.description)
@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterable, Iterable, Mapping
+
+import numpy as np
+
+from src.utils.columnar import ColumnarFormatError, TableStore, UploadTooLargeError, decode_columnar, encode_columnar, table_store
+from src.utils.table_stats import Table
+
+# Delta uploads: the client splits every column into row blocks, encodes each block as a
+# single-column columnar payload and names it by the SHA-256 of those bytes. It asks which
+# hashes the server is missing, uploads only those, then sends a manifest listing the
+# blocks of each column in order.
+MAX_BLOCK_STORE_BYTES = int(os.getenv('MAX_BLOCK_STORE_BYTES', str(256 * 1024 * 1024)))
+MAX_MANIFESTS = int(os.getenv('MAX_MANIFESTS', '1024'))
+# Largest accepted block upload; a block of BLOCK_ROWS rows is normally far smaller
+MAX_BLOCK_BYTES = int(os.getenv('MAX_BLOCK_BYTES', str(64 * 1024 * 1024)))
+BLOCK_ROWS = 8192
+
+
+class BlockIntegrityError(ColumnarFormatError):
+    """Raised when a block's content does not match its hash or is not a single column."""
+
+
+class MissingBlocksError(KeyError):
+    """Raised when a manifest refers to blocks the server does not have (any more)."""
+
+    def __init__(self, missing: list[str]):
+        super().__init__(missing)
+        self.missing = missing
+
+
+def block_hash(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+def manifest_hash(manifest: Mapping[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def encode_blocks(columns: Mapping[str, Any], block_rows: int = BLOCK_ROWS) -> tuple[dict, dict[str, bytes]]:
+    """Split columns into content-addressed blocks (reference implementation for clients and tests).
+
+    Returns the manifest and a mapping of block hash to payload.
+    """
+    manifest = {"columns": []}
+    blocks = {}
+    for name, values in columns.items():
+        hashes = []
+        for start in range(0, len(values), block_rows):
+            payload = encode_columnar({name: values[start:start + block_rows]})
+            digest = block_hash(payload)
+            blocks[digest] = payload
+            hashes.append(digest)
+        manifest["columns"].append({"name": name, "blocks": hashes})
+    return manifest, blocks
+
+
+async def read_block(chunks: AsyncIterable[bytes], max_bytes: int = MAX_BLOCK_BYTES) -> bytes:
+    """Collect a block upload body, refusing it as soon as it passes `max_bytes`."""
+    payload = bytearray()
+    async for chunk in chunks:
+        payload.extend(chunk)
+        if len(payload) > max_bytes:
+            raise UploadTooLargeError(f"Block exceeds {max_bytes} bytes")
+    return bytes(payload)
+
+
+class BlockStore:
+    """Decoded column blocks keyed by content hash, evicted least recently used past a memory cap."""
+
+    def __init__(self, max_bytes: int = MAX_BLOCK_STORE_BYTES, tables: TableStore = table_store):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.tables = tables
+        self._blocks: OrderedDict[str, tuple[np.ndarray, int]] = OrderedDict()
+        self._manifests: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"blocks_received": 0, "bytes_received": 0, "blocks_reused": 0, "manifests_reused": 0}
+
+    def __contains__(self, digest: str):
+        return digest in self._blocks
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def missing(self, hashes: Iterable[str]) -> list[str]:
+        """The subset of `hashes` that must be uploaded; present blocks are marked as recently used."""
+        missing = []
+        with self._lock:
+            for digest in hashes:
+                if digest in self._blocks:
+                    self._blocks.move_to_end(digest)
+                    self.stats["blocks_reused"] += 1
+                else:
+                    missing.append(digest)
+        return missing
+
+    def put(self, digest: str, payload: bytes) -> int:
+        """Verify, decode and store one block; returns its row count."""
+        if block_hash(payload) != digest:
+            raise BlockIntegrityError(f"Block content does not match hash {digest}")
+        table = decode_columnar(payload)
+        if len(table.columns) != 1:
+            raise BlockIntegrityError("A block must contain exactly one column")
+        (values,) = table.columns.values()
+        with self._lock:
+            self.stats["blocks_received"] += 1
+            self.stats["bytes_received"] += len(payload)
+            if digest not in self._blocks:
+                self._blocks[digest] = (values, len(payload))
+                self.bytes += len(payload)
+                while self.bytes > self.max_bytes and len(self._blocks) > 1:
+                    _, (_, size) = self._blocks.popitem(last=False)
+                    self.bytes -= size
+        return len(values)
+
+    def assemble(self, manifest: Mapping[str, Any]) -> tuple[str, Table]:
+        """Build (or reuse) a table from a manifest {"columns": [{"name": ..., "blocks": [hash, ...]}]}."""
+        digest = manifest_hash(manifest)
+        with self._lock:
+            handle = self._manifests.get(digest)
+        if handle is not None:
+            try:
+                table = self.tables.get(handle)
+                self.stats["manifests_reused"] += 1
+                return handle, table
+            except KeyError:
+                pass
+
+        columns = {}
+        with self._lock:
+            missing = [h for column in manifest["columns"] for h in column["blocks"] if h not in self._blocks]
+            if missing:
+                raise MissingBlocksError(list(dict.fromkeys(missing)))
+            for column in manifest["columns"]:
+                blocks = [self._blocks[h][0] for h in column["blocks"]]
+                for h in column["blocks"]:
+                    self._blocks.move_to_end(h)
+                columns[column["name"]] = np.concatenate(blocks) if blocks else np.zeros(0)
+        table = Table(columns)
+        size = sum(values.nbytes for values in table.columns.values())
+        handle = self.tables.add(table, size)
+        with self._lock:
+            self._manifests[digest] = handle
+            while len(self._manifests) > MAX_MANIFESTS:
+                self._manifests.popitem(last=False)
+        return handle, table
+
+
+block_store = BlockStore()
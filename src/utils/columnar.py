@@ -0,0 +1,298 @@
+import os
+import json
+import mmap
+import uuid
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterable, Mapping
+
+import numpy as np
+
+from src.utils.table_stats import Table
+
+# Binary layout of an upload:
+#   8 bytes   magic b"XLCOL1\0\0"
+#   4 bytes   little-endian uint32 length of the JSON header
+#   header    {"rows": N, "columns": [{"name", "type", "offset", "length", "nulls"?}, ...]}
+#   padding   to an 8-byte boundary
+#   body      column buffers; offsets in the header are relative to the start of the body
+#
+# Column types: "f8", "f4", "i8", "i4", "i2", "u1", "bool" (one byte per row) and "str"
+# (N + 1 little-endian int32 byte offsets followed by the UTF-8 data). "nulls" is an
+# optional {"offset", "length"} validity bitmap, least significant bit first, 1 = present.
+MAGIC = b"XLCOL1\x00\x00"
+CONTENT_TYPE = "application/x-excel-columnar"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+_NUMERIC_TYPES = {"f8": "<f8", "f4": "<f4", "i8": "<i8", "i4": "<i4", "i2": "<i2", "u1": "u1"}
+
+# Uploads larger than this are written to a temporary file and memory-mapped instead of held in RAM
+SPILL_THRESHOLD = int(os.getenv('TABLE_SPILL_BYTES', str(32 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_TABLE_UPLOAD_BYTES', str(1024 * 1024 * 1024)))
+MAX_TABLE_STORE_BYTES = int(os.getenv('MAX_TABLE_STORE_BYTES', str(512 * 1024 * 1024)))
+
+
+class ColumnarFormatError(ValueError):
+    """Raised when an upload is not a valid columnar payload."""
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds MAX_TABLE_UPLOAD_BYTES (or a block upload MAX_BLOCK_BYTES)."""
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _column_spec(spec, size: int) -> tuple[str, str, int, int | None]:
+    """(name, type, data offset, validity offset) of a header column entry, in a payload of `size` bytes."""
+    if not isinstance(spec, dict) or "name" not in spec or "type" not in spec:
+        raise ColumnarFormatError(f"Invalid column spec {spec!r}: expected an object with a name and a type")
+    kind = spec["type"]
+    if not isinstance(kind, str) or (kind not in _NUMERIC_TYPES and kind not in ("bool", "str")):
+        raise ColumnarFormatError(f"Unsupported column type {kind!r}")
+    nulls = spec.get("nulls")
+    try:
+        offset = int(spec.get("offset", 0))
+        nulls_offset = int(nulls["offset"]) if nulls else None
+    except (ValueError, KeyError, TypeError) as e:
+        raise ColumnarFormatError(f"Invalid offsets for column {spec['name']!r}: {e}")
+    if offset < 0 or (nulls_offset is not None and nulls_offset < 0):
+        raise ColumnarFormatError(f"Negative offset for column {spec['name']!r}")
+    if offset > size or (nulls_offset is not None and nulls_offset > size):
+        raise ColumnarFormatError(f"Offset of column {spec['name']!r} is past the end of the payload")
+    return str(spec["name"]), kind, offset, nulls_offset
+
+
+def _validity(buffer, nulls_offset: int | None, body: int, rows: int) -> np.ndarray | None:
+    if nulls_offset is None:
+        return None
+    packed = np.frombuffer(buffer, dtype=np.uint8, count=(rows + 7) // 8, offset=body + nulls_offset)
+    return np.unpackbits(packed, bitorder="little")[:rows].astype(bool)
+
+
+def decode_columnar(buffer) -> Table:
+    """Parse a columnar payload. Float64 columns without nulls are zero-copy views over `buffer`."""
+    if len(buffer) < 12 or bytes(buffer[:8]) != MAGIC:
+        raise ColumnarFormatError("Missing columnar header magic")
+    (header_length,) = struct.unpack_from("<I", buffer, 8)
+    try:
+        header = json.loads(bytes(buffer[12:12 + header_length]))
+        rows = int(header["rows"])
+        specs = header["columns"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ColumnarFormatError(f"Invalid columnar header: {e}")
+    if rows < 0 or not isinstance(specs, list):
+        raise ColumnarFormatError("Invalid columnar header: rows must be >= 0 and columns a list")
+    body = _align(12 + header_length)
+
+    columns = {}
+    for spec in specs:
+        name, kind, offset, nulls_offset = _column_spec(spec, len(buffer))
+        start = body + offset
+        try:
+            valid = _validity(buffer, nulls_offset, body, rows)
+            if kind in _NUMERIC_TYPES:
+                values = np.frombuffer(buffer, dtype=_NUMERIC_TYPES[kind], count=rows, offset=start)
+                if kind != "f8" or valid is not None:
+                    values = values.astype(float)
+                if valid is not None:
+                    values[~valid] = np.nan
+            else:
+                if kind == "bool":
+                    cells = np.frombuffer(buffer, dtype=np.uint8, count=rows, offset=start).astype(bool).tolist()
+                else:
+                    offsets = np.frombuffer(buffer, dtype="<i4", count=rows + 1, offset=start).tolist()
+                    data = memoryview(buffer)[start + 4 * (rows + 1):]
+                    cells = [str(data[offsets[i]:offsets[i + 1]], "utf-8") for i in range(rows)]
+                values = np.empty(rows, dtype=object)
+                values[:] = cells
+                if valid is not None:
+                    values[~valid] = None
+        except (ValueError, IndexError, OverflowError) as e:
+            raise ColumnarFormatError(f"Column {name!r} does not fit in the payload: {e}")
+        columns[name] = values
+    return Table(columns)
+
+
+def _packed_validity(valid: np.ndarray) -> bytes:
+    return np.packbits(valid.astype(np.uint8), bitorder="little").tobytes()
+
+
+def encode_columnar(columns: Mapping[str, Any]) -> bytes:
+    """Encode columns into the upload format (reference implementation for clients and tests)."""
+    specs, chunks, offset = [], [], 0
+    rows = None
+
+    def append(data: bytes) -> int:
+        nonlocal offset
+        start = offset
+        chunks.append(data)
+        offset += len(data)
+        padding = _align(offset) - offset
+        chunks.append(b"\x00" * padding)
+        offset += padding
+        return start
+
+    for name, values in columns.items():
+        rows = len(values) if rows is None else rows
+        if len(values) != rows:
+            raise ColumnarFormatError("All columns must have the same length")
+        spec = {"name": name}
+        if isinstance(values, np.ndarray) and values.dtype.kind in "iuf":
+            spec["type"], data, present = "f8", values.astype("<f8").tobytes(), None
+        else:
+            present = np.array([v is not None for v in values], dtype=bool)
+            sample = [v for v in values if v is not None]
+            if sample and all(isinstance(v, bool) for v in sample):
+                spec["type"] = "bool"
+                data = np.array([bool(v) for v in values], dtype=np.uint8).tobytes()
+            elif all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in sample):
+                spec["type"] = "f8"
+                data = np.array([np.nan if v is None else v for v in values], dtype="<f8").tobytes()
+            else:
+                spec["type"] = "str"
+                encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+                offsets = np.zeros(rows + 1, dtype="<i4")
+                np.cumsum([len(e) for e in encoded], out=offsets[1:])
+                data = offsets.tobytes() + b"".join(encoded)
+        spec["offset"] = append(data)
+        spec["length"] = len(data)
+        if present is not None and not present.all():
+            spec["nulls"] = {"offset": append(_packed_validity(present)), "length": (rows + 7) // 8}
+        specs.append(spec)
+
+    header = json.dumps({"rows": rows or 0, "columns": specs}).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\x00" * (_align(len(prefix)) - len(prefix))
+    return prefix + b"".join(chunks)
+
+
+def decode_arrow(buffer) -> Table:
+    """Parse an Arrow IPC stream (requires pyarrow). Numeric columns without nulls are zero-copy."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ColumnarFormatError("Arrow uploads need pyarrow installed on the server")
+    try:
+        arrow_table = pa.ipc.open_stream(pa.py_buffer(buffer)).read_all().combine_chunks()
+    except pa.ArrowException as e:
+        raise ColumnarFormatError(f"Invalid Arrow stream: {e}")
+    columns = {}
+    for name, column in zip(arrow_table.column_names, arrow_table.columns):
+        array = column.chunk(0) if column.num_chunks else pa.array([], type=column.type)
+        if pa.types.is_floating(array.type) or pa.types.is_integer(array.type):
+            columns[name] = array.to_numpy(zero_copy_only=False).astype(float, copy=False)
+        else:
+            columns[name] = array.to_pylist()
+    return Table(columns)
+
+
+async def read_upload(chunks: AsyncIterable[bytes]):
+    """Collect an upload body, spilling to a memory-mapped temporary file past SPILL_THRESHOLD.
+
+    Returns (buffer, resources) where resources must stay open as long as the buffer is used.
+    """
+    buffer = bytearray()
+    spill = None
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            if spill:
+                spill.close()
+            raise UploadTooLargeError(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+        if spill is None and size > SPILL_THRESHOLD:
+            spill = tempfile.TemporaryFile(prefix="excel-table-")
+            spill.write(buffer)
+            buffer = None
+        if spill is not None:
+            spill.write(chunk)
+        else:
+            buffer.extend(chunk)
+    if spill is None:
+        return buffer, ()
+    spill.flush()
+    mapped = mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped, (mapped, spill)
+
+
+class TableStore:
+    """Uploaded tables by handle, bounded by an approximate memory budget (least recently used evicted first)."""
+
+    def __init__(self, max_bytes: int = MAX_TABLE_STORE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._tables: OrderedDict[str, tuple[Table, int, tuple]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __contains__(self, handle: str):
+        return handle in self._tables
+
+    def add(self, table: Table, size: int, resources: tuple = (), handle: str | None = None) -> str:
+        handle = handle or f"tbl_{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self._discard(handle)
+            self._tables[handle] = (table, size, resources)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._tables) > 1:
+                self._discard(next(iter(self._tables)))
+        return handle
+
+    def get(self, handle: str) -> Table:
+        with self._lock:
+            table, _, _ = self._tables[handle]
+            self._tables.move_to_end(handle)
+            return table
+
+    def remove(self, handle: str):
+        with self._lock:
+            self._discard(handle)
+
+    def _discard(self, handle: str):
+        entry = self._tables.pop(handle, None)
+        if entry is None:
+            return
+        _, size, resources = entry
+        self.bytes -= size
+        for resource in resources:
+            try:
+                resource.close()
+            except (BufferError, OSError):
+                # a NumPy view still references the mapping, let the GC release it
+                pass
+
+    def describe(self, handles: list[str]) -> str:
+        """One line per handle, for telling the model which uploaded tables it can use."""
+        lines = []
+        for handle in handles:
+            try:
+                table = self.get(handle)
+            except KeyError:
+                lines.append(f"- {handle}: unknown or expired, ask the user to upload it again")
+                continue
+            lines.append(f"- {handle}: {table.rows} rows, columns {list(table.columns)}")
+        return "\n".join(lines)
+
+
+table_store = TableStore()
+
+
+async def receive_table(chunks: AsyncIterable[bytes], content_type: str | None = None, store: TableStore = table_store) -> tuple[str, Table]:
+    """Read, parse and store an uploaded table; returns its handle."""
+    buffer, resources = await read_upload(chunks)
+    try:
+        if content_type and content_type.startswith(ARROW_CONTENT_TYPE):
+            table = decode_arrow(buffer)
+        else:
+            table = decode_columnar(buffer)
+    except Exception:
+        for resource in resources:
+            resource.close()
+        raise
+    return store.add(table, len(buffer), resources), table
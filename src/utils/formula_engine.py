@@ -0,0 +1,830 @@
+import os
+import re
+import math
+import inspect
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Any, Callable, Mapping
+
+# Compiled formulas are kept in a bounded LRU keyed by the formula text
+FORMULA_CACHE_SIZE = int(os.getenv('FORMULA_CACHE_SIZE', '512'))
+
+EXCEL_EPOCH = date(1899, 12, 30)
+# Serial of 9999-12-31, the last date Excel handles
+EXCEL_MAX_SERIAL = 2958465
+
+
+class FormulaSyntaxError(ValueError):
+    """Raised when a formula cannot be tokenized or parsed."""
+
+
+class ExcelError(Exception):
+    """An Excel error value (#DIV/0!, #VALUE!, ...) propagated through evaluation."""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+    def __str__(self):
+        return self.code
+
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+
+ERROR_CODES = ("#DIV/0!", "#N/A", "#NAME?", "#NULL!", "#NUM!", "#REF!", "#VALUE!")
+
+
+class Range:
+    """A rectangular block of values, stored row-major.
+
+    `indexes` caches lookup indexes built over the range (see formula_lookup).
+    """
+    __slots__ = ("rows", "indexes")
+
+    def __init__(self, rows: list[list]):
+        self.rows = rows
+        self.indexes = None
+
+    @classmethod
+    def from_value(cls, value) -> "Range":
+        if isinstance(value, Range):
+            return value
+        if value and isinstance(value[0], (list, tuple)):
+            return cls(value if isinstance(value, list) and isinstance(value[0], list) else [list(row) for row in value])
+        return cls([[v] for v in value])
+
+    @property
+    def height(self) -> int:
+        return len(self.rows)
+
+    @property
+    def width(self) -> int:
+        return len(self.rows[0]) if self.rows else 0
+
+    def values(self):
+        for row in self.rows:
+            yield from row
+
+    def column(self, index: int) -> list:
+        return [row[index] for row in self.rows]
+
+    def to_list(self) -> list:
+        if self.width == 1:
+            return self.column(0)
+        return [list(row) for row in self.rows]
+
+
+## Tokenizer
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<error>\#(?:DIV/0!|N/A|NAME\?|NULL!|NUM!|REF!|VALUE!))
+  | (?P<range>\$?[A-Za-z]{1,3}\$?\d+:\$?[A-Za-z]{1,3}\$?\d+)
+  | (?P<name>\$?[A-Za-z_\\][A-Za-z0-9_.]*(?:\$\d+)?)
+  | (?P<op><>|<=|>=|[-+*/^&=<>%(),;])
+""", re.VERBOSE)
+
+_CELL_RE = re.compile(r"^\$?([A-Za-z]{1,3})\$?(\d+)$")
+
+
+def tokenize(formula: str) -> list[tuple[str, str]]:
+    tokens = []
+    pos = 0
+    while pos < len(formula):
+        match = _TOKEN_RE.match(formula, pos)
+        if not match:
+            raise FormulaSyntaxError(f"Unexpected character {formula[pos]!r} at position {pos} in {formula!r}")
+        kind = match.lastgroup
+        if kind != "ws":
+            tokens.append((kind, match.group()))
+        pos = match.end()
+    return tokens
+
+
+def normalize_name(name: str) -> str:
+    return name.replace("$", "").upper()
+
+
+def column_index(letters: str) -> int:
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + (ord(ch) - 64)
+    return index
+
+
+def column_letters(index: int) -> str:
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def split_cell(ref: str) -> tuple[int, int] | None:
+    """Return (row, column) for an A1-style reference, or None if it is not one."""
+    match = _CELL_RE.match(ref)
+    if not match:
+        return None
+    return int(match.group(2)), column_index(match.group(1))
+
+
+def expand_range(ref: str) -> list[list[str]]:
+    """Expand "A1:B3" into a row-major grid of normalized cell names."""
+    start, end = ref.split(":")
+    (r1, c1), (r2, c2) = split_cell(start), split_cell(end)
+    r1, r2 = min(r1, r2), max(r1, r2)
+    c1, c2 = min(c1, c2), max(c1, c2)
+    letters = [column_letters(c) for c in range(c1, c2 + 1)]
+    return [[f"{col}{row}" for col in letters] for row in range(r1, r2 + 1)]
+
+
+## Parser (Pratt style, Excel operator precedence)
+# AST nodes are plain tuples: (kind, ...)
+
+_BINARY_PRECEDENCE = {
+    "=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "&": 2,
+    "+": 3, "-": 3,
+    "*": 4, "/": 4,
+    "^": 5,
+}
+_PREFIX_PRECEDENCE = 5
+
+
+class _Parser:
+    def __init__(self, formula: str):
+        self.formula = formula
+        self.tokens = tokenize(formula)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def advance(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, value: str):
+        kind, text = self.advance()
+        if text != value:
+            raise FormulaSyntaxError(f"Expected {value!r} but found {text!r} in {self.formula!r}")
+
+    def parse(self):
+        if not self.tokens:
+            raise FormulaSyntaxError("Empty formula")
+        node = self.expression(0)
+        if self.pos != len(self.tokens):
+            raise FormulaSyntaxError(f"Unexpected token {self.peek()[1]!r} in {self.formula!r}")
+        return node
+
+    def expression(self, min_precedence: int):
+        node = self.prefix()
+        while True:
+            kind, text = self.peek()
+            if kind != "op":
+                break
+            if text == "%":
+                self.advance()
+                node = ("percent", node)
+                continue
+            precedence = _BINARY_PRECEDENCE.get(text)
+            # All Excel binary operators are left-associative (2^3^2 = 64)
+            if precedence is None or precedence <= min_precedence:
+                break
+            self.advance()
+            right = self.expression(precedence)
+            node = ("binary", text, node, right)
+        return node
+
+    def prefix(self):
+        kind, text = self.advance()
+        if kind is None:
+            raise FormulaSyntaxError(f"Unexpected end of formula {self.formula!r}")
+        if kind == "number":
+            return ("literal", float(text))
+        if kind == "string":
+            return ("literal", text[1:-1].replace('""', '"'))
+        if kind == "error":
+            return ("error", text)
+        if kind == "range":
+            return ("range", normalize_name(text))
+        if kind == "name":
+            # "$" only marks absolute cell references ($A$1, A$1, $A1)
+            if "$" in text and split_cell(text) is None:
+                raise FormulaSyntaxError(f"Invalid reference {text!r} in {self.formula!r}")
+            if self.peek()[1] == "(":
+                return self.call(text.upper())
+            upper = text.upper()
+            if upper in ("TRUE", "FALSE"):
+                return ("literal", upper == "TRUE")
+            return ("name", normalize_name(text))
+        if text == "(":
+            node = self.expression(0)
+            self.expect(")")
+            return node
+        if text in ("-", "+"):
+            # Negation binds tighter than ^ in Excel (-2^2 = 4)
+            operand = self.expression(_PREFIX_PRECEDENCE)
+            return ("negate", operand) if text == "-" else operand
+        raise FormulaSyntaxError(f"Unexpected token {text!r} in {self.formula!r}")
+
+    def call(self, function: str):
+        self.expect("(")
+        args = []
+        if self.peek()[1] != ")":
+            while True:
+                if self.peek()[1] in (",", ";", ")"):
+                    args.append(("literal", None))
+                else:
+                    args.append(self.expression(0))
+                if self.peek()[1] in (",", ";"):
+                    self.advance()
+                    continue
+                break
+        self.expect(")")
+        return ("call", function, tuple(args))
+
+
+def parse_formula(formula: str):
+    formula = formula.strip()
+    if formula.startswith("="):
+        formula = formula[1:]
+    return _Parser(formula).parse()
+
+
+def formula_references(node) -> set[str]:
+    """All cell/variable names referenced by a parsed formula (ranges are expanded)."""
+    refs = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        kind = node[0]
+        if kind == "name":
+            refs.add(node[1])
+        elif kind == "range":
+            refs.update(cell for row in expand_range(node[1]) for cell in row)
+        elif kind == "call":
+            stack.extend(node[2])
+        elif kind == "binary":
+            stack.extend(node[2:])
+        elif kind in ("negate", "percent"):
+            stack.append(node[1])
+    return refs
+
+
+## Value coercion
+
+def to_number(value) -> float:
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value is None:
+        return 0.0
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            raise ExcelError("#VALUE!")
+    if isinstance(value, ExcelError):
+        raise value
+    if isinstance(value, Range):
+        if value.height == 1 and value.width == 1:
+            return to_number(value.rows[0][0])
+        raise ExcelError("#VALUE!")
+    if isinstance(value, date):
+        return float((value - EXCEL_EPOCH).days)
+    raise ExcelError("#VALUE!")
+
+
+def to_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        if float(value).is_integer():
+            return str(int(value))
+        return f"{value:.15g}"
+    if isinstance(value, ExcelError):
+        raise value
+    if isinstance(value, Range):
+        if value.height == 1 and value.width == 1:
+            return to_text(value.rows[0][0])
+        raise ExcelError("#VALUE!")
+    return str(value)
+
+
+def to_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str):
+        upper = value.strip().upper()
+        if upper in ("TRUE", "FALSE"):
+            return upper == "TRUE"
+        raise ExcelError("#VALUE!")
+    if isinstance(value, ExcelError):
+        raise value
+    if isinstance(value, Range):
+        if value.height == 1 and value.width == 1:
+            return to_bool(value.rows[0][0])
+        raise ExcelError("#VALUE!")
+    raise ExcelError("#VALUE!")
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _type_rank(value) -> int:
+    # Excel orders numbers < text < logical values
+    if isinstance(value, bool):
+        return 2
+    if isinstance(value, str):
+        return 1
+    return 0
+
+
+def compare(left, right) -> int:
+    """Excel-style three-way comparison (text is case-insensitive, blank matches 0 / "")."""
+    if isinstance(left, ExcelError):
+        raise left
+    if isinstance(right, ExcelError):
+        raise right
+    if left is None:
+        left = "" if isinstance(right, str) else (False if isinstance(right, bool) else 0.0)
+    if right is None:
+        right = "" if isinstance(left, str) else (False if isinstance(left, bool) else 0.0)
+    left_rank, right_rank = _type_rank(left), _type_rank(right)
+    if left_rank != right_rank:
+        return -1 if left_rank < right_rank else 1
+    if left_rank == 1:
+        left, right = left.lower(), right.lower()
+    if left == right:
+        return 0
+    return -1 if left < right else 1
+
+
+def to_scalar(value):
+    """Collapse a single-cell range to its value; reject larger ranges in scalar context."""
+    if isinstance(value, Range):
+        if value.height == 1 and value.width == 1:
+            value = value.rows[0][0]
+        else:
+            raise ExcelError("#VALUE!")
+    if isinstance(value, ExcelError):
+        raise value
+    return value
+
+
+## Operators
+
+def _divide(left, right):
+    if right == 0:
+        raise ExcelError("#DIV/0!")
+    return left / right
+
+
+def _power(left, right):
+    try:
+        result = left ** right
+    except (OverflowError, ZeroDivisionError):
+        raise ExcelError("#NUM!")
+    if isinstance(result, complex) or math.isinf(result) or math.isnan(result):
+        raise ExcelError("#NUM!")
+    return result
+
+
+_ARITHMETIC = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": _divide,
+    "^": _power,
+}
+
+_COMPARISON = {
+    "=": lambda c: c == 0,
+    "<>": lambda c: c != 0,
+    "<": lambda c: c < 0,
+    ">": lambda c: c > 0,
+    "<=": lambda c: c <= 0,
+    ">=": lambda c: c >= 0,
+}
+
+
+## Function library
+
+FUNCTIONS: dict[str, Callable] = {}
+LAZY_FUNCTIONS: dict[str, Callable] = {}
+
+
+def excel_function(*names: str, lazy: bool = False):
+    """Register a worksheet function. Lazy functions receive thunks instead of values."""
+    def decorator(fn):
+        for name in names:
+            (LAZY_FUNCTIONS if lazy else FUNCTIONS)[name] = fn
+        return fn
+    return decorator
+
+
+def iter_numbers(args):
+    """Numbers from the arguments of an aggregate: ranges skip text/blank, scalars are coerced."""
+    for arg in args:
+        if isinstance(arg, Range):
+            for value in arg.values():
+                if isinstance(value, ExcelError):
+                    raise value
+                if is_number(value):
+                    yield float(value)
+        elif arg is not None:
+            yield to_number(arg)
+
+
+def iter_values(args):
+    for arg in args:
+        if isinstance(arg, Range):
+            yield from arg.values()
+        else:
+            yield arg
+
+
+@excel_function("SUM")
+def _sum(*args):
+    return math.fsum(iter_numbers(args))
+
+
+@excel_function("AVERAGE")
+def _average(*args):
+    numbers = list(iter_numbers(args))
+    if not numbers:
+        raise ExcelError("#DIV/0!")
+    return math.fsum(numbers) / len(numbers)
+
+
+@excel_function("MIN")
+def _min(*args):
+    return min(iter_numbers(args), default=0.0)
+
+
+@excel_function("MAX")
+def _max(*args):
+    return max(iter_numbers(args), default=0.0)
+
+
+@excel_function("COUNT")
+def _count(*args):
+    count = 0
+    for value in iter_values(args):
+        if is_number(value):
+            count += 1
+    return float(count)
+
+
+@excel_function("COUNTA")
+def _counta(*args):
+    return float(sum(1 for value in iter_values(args) if value is not None and value != ""))
+
+
+@excel_function("PRODUCT")
+def _product(*args):
+    return math.prod(iter_numbers(args))
+
+
+@excel_function("ROUND")
+def _round(number, digits=0.0):
+    number, digits = to_number(number), int(to_number(digits))
+    if not math.isfinite(number):
+        return number
+    # Excel rounds half away from zero, on the decimal value shown (1.005 is stored as 1.00499...)
+    shown = Decimal(repr(number))
+    if shown.as_tuple().exponent >= -digits:
+        # nothing below the rounding digit; quantizing could need more than the context's 28 digits
+        return number
+    if digits < -308:
+        return 0.0
+    return float(shown.quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP))
+
+
+@excel_function("ABS")
+def _abs(number):
+    return abs(to_number(number))
+
+
+@excel_function("INT")
+def _int(number):
+    return float(math.floor(to_number(number)))
+
+
+@excel_function("MOD")
+def _mod(number, divisor):
+    number, divisor = to_number(number), to_number(divisor)
+    if divisor == 0:
+        raise ExcelError("#DIV/0!")
+    return number - divisor * math.floor(number / divisor)
+
+
+@excel_function("POWER")
+def _power_fn(number, power):
+    return _power(to_number(number), to_number(power))
+
+
+@excel_function("SQRT")
+def _sqrt(number):
+    number = to_number(number)
+    if number < 0:
+        raise ExcelError("#NUM!")
+    return math.sqrt(number)
+
+
+@excel_function("AND")
+def _and(*args):
+    values = [to_bool(v) for v in iter_values(args) if v is not None]
+    if not values:
+        raise ExcelError("#VALUE!")
+    return all(values)
+
+
+@excel_function("OR")
+def _or(*args):
+    values = [to_bool(v) for v in iter_values(args) if v is not None]
+    if not values:
+        raise ExcelError("#VALUE!")
+    return any(values)
+
+
+@excel_function("NOT")
+def _not(value):
+    return not to_bool(value)
+
+
+@excel_function("IF", lazy=True)
+def _if(test, if_true=None, if_false=None):
+    if to_bool(to_scalar(test())):
+        return if_true() if if_true else True
+    return if_false() if if_false else False
+
+
+@excel_function("IFERROR", lazy=True)
+def _iferror(value, value_if_error):
+    try:
+        return to_scalar(value())
+    except ExcelError:
+        return value_if_error()
+
+
+@excel_function("IFNA", lazy=True)
+def _ifna(value, value_if_na):
+    try:
+        return to_scalar(value())
+    except ExcelError as error:
+        if error.code != "#N/A":
+            raise
+        return value_if_na()
+
+
+@excel_function("CONCAT", "CONCATENATE")
+def _concat(*args):
+    return "".join(to_text(v) for v in iter_values(args))
+
+
+@excel_function("LEN")
+def _len(text):
+    return float(len(to_text(text)))
+
+
+@excel_function("UPPER")
+def _upper(text):
+    return to_text(text).upper()
+
+
+@excel_function("LOWER")
+def _lower(text):
+    return to_text(text).lower()
+
+
+@excel_function("TRIM")
+def _trim(text):
+    return " ".join(to_text(text).split())
+
+
+def char_count(count) -> int:
+    count = int(to_number(count))
+    if count < 0:
+        raise ExcelError("#VALUE!")
+    return count
+
+
+@excel_function("LEFT")
+def _left(text, count=1.0):
+    return to_text(text)[:char_count(count)]
+
+
+@excel_function("RIGHT")
+def _right(text, count=1.0):
+    count = char_count(count)
+    return to_text(text)[-count:] if count else ""
+
+
+@excel_function("MID")
+def _mid(text, start, count):
+    start = int(to_number(start))
+    if start < 1:
+        raise ExcelError("#VALUE!")
+    return to_text(text)[start - 1:start - 1 + char_count(count)]
+
+
+def serial_to_date(serial) -> date:
+    serial = to_number(serial)
+    if not 0 <= serial < EXCEL_MAX_SERIAL + 1:
+        raise ExcelError("#NUM!")
+    return EXCEL_EPOCH + timedelta(days=int(serial))
+
+
+@excel_function("TODAY")
+def _today():
+    return float((date.today() - EXCEL_EPOCH).days)
+
+
+@excel_function("DATE")
+def _date(year, month, day):
+    year, month, day = int(to_number(year)), int(to_number(month)), int(to_number(day))
+    # Excel normalizes out-of-range months and days
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    try:
+        result = date(year, month, 1) + timedelta(days=day - 1)
+    except (ValueError, OverflowError):
+        raise ExcelError("#NUM!")
+    return float((result - EXCEL_EPOCH).days)
+
+
+@excel_function("YEAR")
+def _year(serial):
+    return float(serial_to_date(serial).year)
+
+
+@excel_function("MONTH")
+def _month(serial):
+    return float(serial_to_date(serial).month)
+
+
+@excel_function("DAY")
+def _day(serial):
+    return float(serial_to_date(serial).day)
+
+
+## Compiler: AST -> closure over an environment mapping
+
+def _compile(node) -> Callable[[Mapping], Any]:
+    kind = node[0]
+
+    if kind == "literal":
+        value = node[1]
+        return lambda env: value
+
+    if kind == "error":
+        code = node[1]
+
+        def error(env):
+            raise ExcelError(code)
+        return error
+
+    if kind == "name":
+        name = node[1]
+        is_cell = split_cell(name) is not None
+
+        def lookup(env):
+            try:
+                value = env[name]
+            except KeyError:
+                if is_cell:
+                    return None
+                raise ExcelError("#NAME?")
+            if isinstance(value, ExcelError):
+                raise value
+            return value
+        return lookup
+
+    if kind == "range":
+        grid = expand_range(node[1])
+        return lambda env: Range([[env.get(cell) for cell in row] for row in grid])
+
+    if kind == "negate":
+        operand = _compile(node[1])
+        return lambda env: -to_number(to_scalar(operand(env)))
+
+    if kind == "percent":
+        operand = _compile(node[1])
+        return lambda env: to_number(to_scalar(operand(env))) / 100.0
+
+    if kind == "binary":
+        op, left, right = node[1], _compile(node[2]), _compile(node[3])
+        if op in _ARITHMETIC:
+            fn = _ARITHMETIC[op]
+            return lambda env: fn(to_number(to_scalar(left(env))), to_number(to_scalar(right(env))))
+        if op == "&":
+            return lambda env: to_text(to_scalar(left(env))) + to_text(to_scalar(right(env)))
+        test = _COMPARISON[op]
+        return lambda env: test(compare(to_scalar(left(env)), to_scalar(right(env))))
+
+    if kind == "call":
+        name, args = node[1], [_compile(arg) for arg in node[2]]
+        if name in LAZY_FUNCTIONS:
+            fn = LAZY_FUNCTIONS[name]
+            # a wrong argument count would only fail when the thunks are called, so check it here
+            try:
+                inspect.signature(fn).bind(*args)
+            except TypeError:
+                raise FormulaSyntaxError(f"Wrong number of arguments for {name}: {len(args)}")
+            return lambda env: fn(*[(lambda arg=arg: arg(env)) for arg in args])
+        if name not in FUNCTIONS:
+            raise FormulaSyntaxError(f"Unsupported function {name}")
+        fn = FUNCTIONS[name]
+
+        def call(env):
+            try:
+                return fn(*[arg(env) for arg in args])
+            except TypeError:
+                raise ExcelError("#VALUE!")
+        return call
+
+    raise FormulaSyntaxError(f"Unknown node {kind}")
+
+
+def _prepare_value(value):
+    if isinstance(value, (list, tuple)):
+        return Range.from_value(value)
+    if isinstance(value, str) and value in ERROR_CODES:
+        return ExcelError(value)
+    return value
+
+
+class CompiledFormula:
+    """A formula parsed and compiled once, evaluated many times against different inputs."""
+    __slots__ = ("formula", "ast", "references", "_fn")
+
+    def __init__(self, formula: str):
+        self.formula = formula
+        self.ast = parse_formula(formula)
+        self.references = frozenset(formula_references(self.ast))
+        self._fn = _compile(self.ast)
+
+    def evaluate(self, inputs: Mapping[str, Any] | None = None, normalized: bool = False):
+        """Evaluate against `inputs`; Excel errors are returned as ExcelError values."""
+        if normalized:
+            env = inputs or {}
+        else:
+            env = {normalize_name(k): _prepare_value(v) for k, v in (inputs or {}).items()}
+        try:
+            result = self._fn(env)
+            if isinstance(result, float) and (math.isinf(result) or math.isnan(result)):
+                raise ExcelError("#NUM!")
+            return result
+        except ExcelError as error:
+            return error
+        except (RecursionError, ArithmeticError):
+            # backstop for numeric edge cases a function does not map to an Excel error itself
+            return ExcelError("#NUM!")
+
+    __call__ = evaluate
+
+
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def compile_formula(formula: str) -> CompiledFormula:
+    return CompiledFormula(formula)
+
+
+def formula_cache_info():
+    return compile_formula.cache_info()
+
+
+def to_output(value):
+    """Convert an evaluation result into something JSON-serializable for the model."""
+    if isinstance(value, ExcelError):
+        return value.code
+    if isinstance(value, Range):
+        return value.to_list()
+    if value is None:
+        return 0.0
+    return value
+
+
+def evaluate_formula(formula: str, inputs: Mapping[str, Any] | None = None):
+    return to_output(compile_formula(formula).evaluate(inputs))
+
+
+# Lookup and conditional aggregate functions register themselves in FUNCTIONS
+from src.utils import formula_lookup  # noqa: E402,F401
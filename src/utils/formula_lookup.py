@@ -0,0 +1,428 @@
+import os
+import re
+import math
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+from src.utils.formula_engine import (
+    ExcelError,
+    Range,
+    excel_function,
+    is_number,
+    to_bool,
+    to_number,
+    to_scalar,
+)
+
+# Indexes are built once per distinct lookup column and shared across calls
+LOOKUP_INDEX_CACHE_SIZE = int(os.getenv('LOOKUP_INDEX_CACHE_SIZE', '64'))
+
+_NUMBER, _TEXT, _LOGICAL, _BLANK, _ERROR = range(5)
+
+
+def lookup_key(value) -> tuple:
+    """Hashable key with Excel equality: text is case-insensitive and TRUE is not 1."""
+    if isinstance(value, bool):
+        return (_LOGICAL, value)
+    if is_number(value):
+        return (_NUMBER, float(value))
+    if isinstance(value, str):
+        return (_TEXT, value.lower())
+    if value is None:
+        return (_BLANK, None)
+    if isinstance(value, ExcelError):
+        return (_ERROR, value.code)
+    return (_TEXT, str(value).lower())
+
+
+@lru_cache(maxsize=LOOKUP_INDEX_CACHE_SIZE)
+def key_positions(keys: tuple) -> tuple[dict, dict]:
+    """Positions of each lookup key, and the cache of sorted indexes over them, shared by equal columns.
+
+    Keyed on lookup keys rather than raw values: Python treats (True, 2) and (1, 2) as equal tuples.
+    """
+    positions = {}
+    for position, key in enumerate(keys):
+        bucket = positions.get(key)
+        if bucket is None:
+            positions[key] = [position]
+        else:
+            bucket.append(position)
+    return positions, {}
+
+
+class LookupIndex:
+    """Hash index (value -> row positions) with lazily built sorted indexes for range queries."""
+    __slots__ = ("values", "positions", "_sorted")
+
+    def __init__(self, values: tuple):
+        self.values = values
+        self.positions, self._sorted = key_positions(tuple(lookup_key(value) for value in values))
+
+    def __len__(self):
+        return len(self.values)
+
+    def equal(self, value) -> list[int]:
+        return self.positions.get(lookup_key(value), [])
+
+    def sorted(self, kind: int) -> tuple[list, list[int]]:
+        """(keys, positions) of all values of one type, ordered by (key, position)."""
+        cached = self._sorted.get(kind)
+        if cached is None:
+            pairs = sorted((key[1], position) for key, bucket in self.positions.items() if key[0] == kind
+                           for position in bucket)
+            cached = ([k for k, _ in pairs], [p for _, p in pairs])
+            self._sorted[kind] = cached
+        return cached
+
+    def nearest(self, value, direction: int) -> int | None:
+        """Position of the largest value <= `value` (direction -1) or smallest >= `value` (direction 1)."""
+        kind, key = lookup_key(value)
+        keys, positions = self.sorted(kind)
+        if direction < 0:
+            # among duplicates this picks the last one, like Excel's binary search
+            index = bisect_right(keys, key) - 1
+            return positions[index] if index >= 0 else None
+        index = bisect_left(keys, key)
+        return positions[index] if index < len(keys) else None
+
+    def between(self, kind: int, low=None, high=None, include_low=True, include_high=True) -> list[int]:
+        keys, positions = self.sorted(kind)
+        start = 0 if low is None else (bisect_left(keys, low) if include_low else bisect_right(keys, low))
+        end = len(keys) if high is None else (bisect_right(keys, high) if include_high else bisect_left(keys, high))
+        return positions[start:end]
+
+
+def range_index(rng: Range, axis: str = "flat", position: int = 0) -> LookupIndex:
+    """The index over one column ("col"), one row ("row") or every cell ("flat") of a range.
+
+    Indexes are cached on the Range itself, and their positions by content in a process-wide
+    LRU so repeated lookups against the same data reuse them.
+    """
+    cache_key = (axis, position)
+    if rng.indexes is None:
+        rng.indexes = {}
+    index = rng.indexes.get(cache_key)
+    if index is None:
+        if axis == "col":
+            values = tuple(rng.column(position))
+        elif axis == "row":
+            values = tuple(rng.rows[position])
+        else:
+            values = tuple(rng.values())
+        index = LookupIndex(values)
+        rng.indexes[cache_key] = index
+    return index
+
+
+def _as_range(value) -> Range:
+    if isinstance(value, Range):
+        return value
+    if isinstance(value, (list, tuple)):
+        return Range.from_value(value)
+    if isinstance(value, ExcelError):
+        raise value
+    return Range([[value]])
+
+
+def _vector_index(rng: Range) -> LookupIndex:
+    """Index over a one-dimensional range, whichever way it is oriented."""
+    if rng.height == 1:
+        return range_index(rng, "row", 0)
+    if rng.width == 1:
+        return range_index(rng, "col", 0)
+    raise ExcelError("#N/A")
+
+
+## Wildcards and criteria
+
+_WILDCARD_RE = re.compile(r"~[*?~]|[*?]")
+
+
+def has_wildcards(text) -> bool:
+    return isinstance(text, str) and ("*" in text or "?" in text)
+
+
+@lru_cache(maxsize=256)
+def wildcard_pattern(text: str) -> re.Pattern:
+    def replace(match):
+        token = match.group()
+        if token.startswith("~"):
+            return re.escape(token[1])
+        return ".*" if token == "*" else "."
+    parts = []
+    last = 0
+    for match in _WILDCARD_RE.finditer(text):
+        parts.append(re.escape(text[last:match.start()]))
+        parts.append(replace(match))
+        last = match.end()
+    parts.append(re.escape(text[last:]))
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def _scan(values, pattern: re.Pattern, reverse: bool = False) -> list[int]:
+    positions = range(len(values) - 1, -1, -1) if reverse else range(len(values))
+    return [p for p in positions if isinstance(values[p], str) and pattern.fullmatch(values[p])]
+
+
+@lru_cache(maxsize=256)
+def _parse_criterion_text(text: str) -> tuple[str, object]:
+    for op in (">=", "<=", "<>", "=", ">", "<"):
+        if text.startswith(op):
+            operand = text[len(op):]
+            break
+    else:
+        op, operand = "=", text
+    upper = operand.strip().upper()
+    if upper in ("TRUE", "FALSE"):
+        return op, upper == "TRUE"
+    try:
+        return op, float(operand)
+    except ValueError:
+        return op, operand
+
+
+def parse_criterion(criterion) -> tuple[str, object]:
+    criterion = to_scalar(criterion)
+    if isinstance(criterion, str):
+        return _parse_criterion_text(criterion)
+    if criterion is None:
+        return "=", 0.0
+    return "=", criterion
+
+
+def _equal_positions(index: LookupIndex, operand) -> list[int]:
+    if operand == "":
+        return sorted(index.equal(None) + index.equal(""))
+    if has_wildcards(operand):
+        return _scan(index.values, wildcard_pattern(operand))
+    return index.equal(operand)
+
+
+def matching_positions(index: LookupIndex, criterion) -> list[int]:
+    """Positions in an indexed range that satisfy an Excel criterion such as ">=10", "<>x" or "a*"."""
+    op, operand = parse_criterion(criterion)
+    if op == "=":
+        return _equal_positions(index, operand)
+    if op == "<>":
+        excluded = set(_equal_positions(index, operand))
+        return [p for p in range(len(index)) if p not in excluded]
+    kind, key = lookup_key(operand)
+    if op == ">":
+        return index.between(kind, low=key, include_low=False)
+    if op == ">=":
+        return index.between(kind, low=key)
+    if op == "<":
+        return index.between(kind, high=key, include_high=False)
+    return index.between(kind, high=key)
+
+
+def _criteria_positions(pairs, size: int | None = None) -> list[int]:
+    """Intersect the positions matching every (range, criterion) pair."""
+    if not pairs:
+        raise ExcelError("#VALUE!")
+    matches = []
+    for rng, criterion in pairs:
+        rng = _as_range(rng)
+        count = rng.height * rng.width
+        if size is not None and count != size:
+            raise ExcelError("#VALUE!")
+        size = count
+        matches.append(matching_positions(range_index(rng), criterion))
+    if len(matches) == 1:
+        return matches[0]
+    matches.sort(key=len)
+    result = set(matches[0])
+    for positions in matches[1:]:
+        if not result:
+            break
+        result.intersection_update(positions)
+    return sorted(result)
+
+
+def _pairs(args) -> list[tuple]:
+    if len(args) % 2:
+        raise ExcelError("#VALUE!")
+    return [(args[i], args[i + 1]) for i in range(0, len(args), 2)]
+
+
+def _selected_numbers(rng, positions) -> list[float]:
+    values = list(_as_range(rng).values())
+    numbers = []
+    for position in positions:
+        value = values[position]
+        if isinstance(value, ExcelError):
+            raise value
+        if is_number(value):
+            numbers.append(float(value))
+    return numbers
+
+
+def _size(rng) -> int:
+    rng = _as_range(rng)
+    return rng.height * rng.width
+
+
+## Lookup functions
+
+def _column_number(value, limit: int) -> int:
+    number = int(to_number(value))
+    if number < 1:
+        raise ExcelError("#VALUE!")
+    if number > limit:
+        raise ExcelError("#REF!")
+    return number
+
+
+def _find(index: LookupIndex, lookup_value, approximate: bool) -> int:
+    if approximate:
+        position = index.nearest(lookup_value, -1)
+    elif has_wildcards(lookup_value):
+        matches = _scan(index.values, wildcard_pattern(lookup_value))
+        position = matches[0] if matches else None
+    else:
+        matches = index.equal(lookup_value)
+        position = matches[0] if matches else None
+    if position is None:
+        raise ExcelError("#N/A")
+    return position
+
+
+@excel_function("VLOOKUP")
+def _vlookup(lookup_value, table, col_index, range_lookup=True):
+    table = _as_range(table)
+    col = _column_number(col_index, table.width)
+    approximate = to_bool(range_lookup) if range_lookup is not None else False
+    row = _find(range_index(table, "col", 0), to_scalar(lookup_value), approximate)
+    return table.rows[row][col - 1]
+
+
+@excel_function("HLOOKUP")
+def _hlookup(lookup_value, table, row_index, range_lookup=True):
+    table = _as_range(table)
+    row = _column_number(row_index, table.height)
+    approximate = to_bool(range_lookup) if range_lookup is not None else False
+    col = _find(range_index(table, "row", 0), to_scalar(lookup_value), approximate)
+    return table.rows[row - 1][col]
+
+
+@excel_function("MATCH")
+def _match(lookup_value, lookup_array, match_type=1.0):
+    index = _vector_index(_as_range(lookup_array))
+    lookup_value = to_scalar(lookup_value)
+    match_type = int(to_number(match_type)) if match_type is not None else 0
+    if match_type == 0:
+        position = _find(index, lookup_value, approximate=False)
+    else:
+        position = index.nearest(lookup_value, -1 if match_type > 0 else 1)
+        if position is None:
+            raise ExcelError("#N/A")
+    return float(position + 1)
+
+
+@excel_function("INDEX")
+def _index(array, row_num, col_num=None):
+    array = _as_range(array)
+    row = int(to_number(row_num))
+    col = int(to_number(col_num)) if col_num is not None else None
+    if col is None and array.height == 1:
+        row, col = 1, row
+    col = 1 if col is None else col
+    if row < 0 or col < 0 or row > array.height or col > array.width:
+        raise ExcelError("#REF!")
+    if row == 0 and col == 0:
+        return array
+    if row == 0:
+        return Range([[r[col - 1]] for r in array.rows])
+    if col == 0:
+        return Range([list(array.rows[row - 1])])
+    return array.rows[row - 1][col - 1]
+
+
+@excel_function("XLOOKUP")
+def _xlookup(lookup_value, lookup_array, return_array, if_not_found=None, match_mode=0.0, search_mode=1.0):
+    lookup_array, return_array = _as_range(lookup_array), _as_range(return_array)
+    index = _vector_index(lookup_array)
+    lookup_value = to_scalar(lookup_value)
+    match_mode = int(to_number(match_mode)) if match_mode is not None else 0
+    reverse = search_mode is not None and to_number(search_mode) < 0
+
+    if match_mode == 2 and has_wildcards(lookup_value):
+        matches = _scan(index.values, wildcard_pattern(lookup_value), reverse=reverse)
+    else:
+        matches = index.equal(lookup_value)
+        if reverse:
+            matches = matches[::-1]
+    position = matches[0] if matches else None
+    if position is None and match_mode in (-1, 1):
+        position = index.nearest(lookup_value, match_mode)
+    if position is None:
+        if if_not_found is not None:
+            return if_not_found
+        raise ExcelError("#N/A")
+
+    if lookup_array.height == 1:
+        if return_array.width != lookup_array.width:
+            raise ExcelError("#VALUE!")
+        column = [[row[position]] for row in return_array.rows]
+        return column[0][0] if len(column) == 1 else Range(column)
+    if return_array.height != lookup_array.height:
+        raise ExcelError("#VALUE!")
+    row = return_array.rows[position]
+    return row[0] if len(row) == 1 else Range([list(row)])
+
+
+## Conditional aggregates
+
+@excel_function("COUNTIF")
+def _countif(rng, criterion):
+    return float(len(_criteria_positions([(rng, criterion)])))
+
+
+@excel_function("COUNTIFS")
+def _countifs(*args):
+    return float(len(_criteria_positions(_pairs(args))))
+
+
+@excel_function("SUMIF")
+def _sumif(rng, criterion, sum_range=None):
+    target = rng if sum_range is None else sum_range
+    positions = _criteria_positions([(rng, criterion)], _size(target))
+    return math.fsum(_selected_numbers(target, positions))
+
+
+@excel_function("SUMIFS")
+def _sumifs(sum_range, *args):
+    positions = _criteria_positions(_pairs(args), _size(sum_range))
+    return math.fsum(_selected_numbers(sum_range, positions))
+
+
+def _average(numbers):
+    if not numbers:
+        raise ExcelError("#DIV/0!")
+    return math.fsum(numbers) / len(numbers)
+
+
+@excel_function("AVERAGEIF")
+def _averageif(rng, criterion, average_range=None):
+    target = rng if average_range is None else average_range
+    positions = _criteria_positions([(rng, criterion)], _size(target))
+    return _average(_selected_numbers(target, positions))
+
+
+@excel_function("AVERAGEIFS")
+def _averageifs(average_range, *args):
+    positions = _criteria_positions(_pairs(args), _size(average_range))
+    return _average(_selected_numbers(average_range, positions))
+
+
+@excel_function("MAXIFS")
+def _maxifs(max_range, *args):
+    positions = _criteria_positions(_pairs(args), _size(max_range))
+    return max(_selected_numbers(max_range, positions), default=0.0)
+
+
+@excel_function("MINIFS")
+def _minifs(min_range, *args):
+    positions = _criteria_positions(_pairs(args), _size(min_range))
+    return min(_selected_numbers(min_range, positions), default=0.0)
@@ -0,0 +1,578 @@
+import os
+import math
+from functools import lru_cache
+from typing import Any, Callable, Mapping
+
+import numpy as np
+
+from src.utils.formula_engine import (
+    ERROR_CODES,
+    FORMULA_CACHE_SIZE,
+    LAZY_FUNCTIONS,
+    FUNCTIONS,
+    ExcelError,
+    FormulaSyntaxError,
+    Range,
+    compare,
+    compile_formula,
+    expand_range,
+    is_number,
+    normalize_name,
+    split_cell,
+    to_bool,
+    to_text,
+)
+
+# Errors are tracked per cell as small integer codes, 0 meaning "no error"
+_ERROR_INDEX = {code: index + 1 for index, code in enumerate(ERROR_CODES)}
+DIV0, NUM, VALUE, NAME = (_ERROR_INDEX[c] for c in ("#DIV/0!", "#NUM!", "#VALUE!", "#NAME?"))
+
+# Number of result values returned inline by the column tool before only a preview is sent
+COLUMN_RESULT_LIMIT = int(os.getenv('COLUMN_RESULT_LIMIT', '1000'))
+
+
+class Vector:
+    """One value per row. Blanks are NaN in float data and None in object data."""
+    __slots__ = ("data", "errors")
+
+    def __init__(self, data: np.ndarray, errors: np.ndarray | None = None):
+        self.data = data
+        self.errors = errors if errors is not None and errors.any() else None
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def kind(self) -> str:
+        return self.data.dtype.kind
+
+    @classmethod
+    def full(cls, value, rows: int) -> "Vector":
+        if isinstance(value, ExcelError):
+            return cls(np.full(rows, np.nan), np.full(rows, _ERROR_INDEX[value.code], dtype=np.int8))
+        if value is None:
+            return cls(np.full(rows, np.nan))
+        if isinstance(value, bool):
+            return cls(np.full(rows, value, dtype=bool))
+        if is_number(value):
+            return cls(np.full(rows, float(value)))
+        return cls(np.full(rows, value, dtype=object))
+
+    @classmethod
+    def from_column(cls, column) -> "Vector":
+        """Build a vector from a list of cell values (numbers, text, booleans, None or error codes)."""
+        array = np.asarray(column)
+        if array.dtype.kind in "iuf":
+            return cls(array.astype(float))
+        if array.dtype.kind == "b":
+            return cls(array)
+        rows = len(column)
+        data = np.empty(rows, dtype=object)
+        errors = np.zeros(rows, dtype=np.int8)
+        numeric = True
+        for i, value in enumerate(column):
+            if isinstance(value, ExcelError):
+                errors[i] = _ERROR_INDEX[value.code]
+            elif isinstance(value, str) and value in _ERROR_INDEX:
+                errors[i] = _ERROR_INDEX[value]
+            elif value is None or (isinstance(value, float) and math.isnan(value)):
+                pass
+            else:
+                data[i] = value
+                numeric = numeric and is_number(value)
+        if numeric:
+            data = np.array([np.nan if v is None else v for v in data], dtype=float)
+        return cls(data, errors)
+
+    def cell(self, index: int):
+        """The scalar value of one row, as the scalar engine understands it."""
+        if self.errors is not None and self.errors[index]:
+            return ExcelError(ERROR_CODES[self.errors[index] - 1])
+        value = self.data[index]
+        if self.kind == "f":
+            return None if math.isnan(value) else float(value)
+        if self.kind == "b":
+            return bool(value)
+        return value
+
+    def to_list(self) -> list:
+        if self.kind == "f":
+            # A formula that resolves to a blank cell displays 0
+            values = np.nan_to_num(self.data, nan=0.0).tolist()
+        else:
+            values = [0.0 if v is None else v for v in self.data.tolist()]
+        if self.errors is not None:
+            for index in np.flatnonzero(self.errors):
+                values[index] = ERROR_CODES[self.errors[index] - 1]
+        return values
+
+
+def merge_errors(*errors):
+    """Combine per-cell error arrays, keeping the left-most error for each row."""
+    result = None
+    for error in errors:
+        if error is None:
+            continue
+        result = error if result is None else np.where(result != 0, result, error)
+    return result
+
+
+def _flag(mask: np.ndarray, code: int):
+    return np.where(mask, np.int8(code), np.int8(0)) if mask.any() else None
+
+
+def _numbers(vector: Vector):
+    """Numeric coercion of a vector; returns (float data, errors)."""
+    if vector.kind == "f":
+        return np.nan_to_num(vector.data, nan=0.0), vector.errors
+    if vector.kind == "b":
+        return vector.data.astype(float), vector.errors
+    rows = len(vector)
+    data = np.zeros(rows)
+    errors = np.zeros(rows, dtype=np.int8) if vector.errors is None else vector.errors.copy()
+    for i in range(rows):
+        if errors[i]:
+            continue
+        value = vector.data[i]
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            data[i] = float(value)
+        elif is_number(value):
+            data[i] = value
+        else:
+            try:
+                data[i] = float(str(value).strip())
+            except ValueError:
+                errors[i] = VALUE
+    return data, errors
+
+
+def _finish(data: np.ndarray, errors) -> Vector:
+    bad = ~np.isfinite(data)
+    return Vector(data, merge_errors(errors, _flag(bad, NUM)))
+
+
+def _truthy(vector: Vector):
+    if vector.kind == "b":
+        return vector.data, vector.errors
+    if vector.kind == "f":
+        return np.nan_to_num(vector.data, nan=0.0) != 0, vector.errors
+    rows = len(vector)
+    data = np.zeros(rows, dtype=bool)
+    errors = np.zeros(rows, dtype=np.int8) if vector.errors is None else vector.errors.copy()
+    for i in range(rows):
+        if errors[i]:
+            continue
+        try:
+            data[i] = to_bool(vector.data[i])
+        except ExcelError as error:
+            errors[i] = _ERROR_INDEX[error.code]
+    return data, errors
+
+
+def _select(test: np.ndarray, if_true: Vector, if_false: Vector) -> Vector:
+    if if_true.kind == if_false.kind and if_true.kind in "fb":
+        data = np.where(test, if_true.data, if_false.data)
+    else:
+        data = np.where(test, if_true.data.astype(object), if_false.data.astype(object))
+        if if_true.kind == "f" or if_false.kind == "f":
+            data = np.array([None if isinstance(v, float) and math.isnan(v) else v for v in data], dtype=object)
+    errors = None
+    if if_true.errors is not None or if_false.errors is not None:
+        zeros = np.zeros(len(test), dtype=np.int8)
+        true_errors = if_true.errors if if_true.errors is not None else zeros
+        false_errors = if_false.errors if if_false.errors is not None else zeros
+        errors = np.where(test, true_errors, false_errors)
+    return Vector(data, errors)
+
+
+## Per-row fallback for anything without a vectorized implementation
+
+def _per_row(fn: Callable, args: list, rows: int, lazy: bool = False) -> Vector:
+    results = []
+    for i in range(rows):
+        cells = [arg.cell(i) if isinstance(arg, Vector) else arg for arg in args]
+        try:
+            if lazy:
+                results.append(fn(*[_thunk(cell) for cell in cells]))
+            else:
+                for cell in cells:
+                    if isinstance(cell, ExcelError):
+                        raise cell
+                results.append(fn(*cells))
+        except ExcelError as error:
+            results.append(error)
+        except TypeError:
+            results.append(ExcelError("#VALUE!"))
+    return Vector.from_column(results) if rows else Vector(np.zeros(0))
+
+
+def _thunk(cell):
+    def value():
+        if isinstance(cell, ExcelError):
+            raise cell
+        return cell
+    return value
+
+
+## Vectorized functions
+
+VECTOR_FUNCTIONS: dict[str, Callable] = {}
+
+
+def vector_function(*names: str):
+    """Register a vectorized implementation; returning NotImplemented falls back to per-row evaluation."""
+    def decorator(fn):
+        for name in names:
+            VECTOR_FUNCTIONS[name] = fn
+        return fn
+    return decorator
+
+
+def _numeric_args(args):
+    if not all(isinstance(arg, Vector) and arg.kind in "fb" for arg in args):
+        return None
+    return args
+
+
+@vector_function("SUM")
+def _v_sum(rows, *args):
+    if not args or _numeric_args(args) is None:
+        return NotImplemented
+    stacked = np.vstack([np.nan_to_num(arg.data.astype(float), nan=0.0) for arg in args])
+    return _finish(stacked.sum(axis=0), merge_errors(*[arg.errors for arg in args]))
+
+
+@vector_function("AVERAGE")
+def _v_average(rows, *args):
+    if not args or _numeric_args(args) is None:
+        return NotImplemented
+    stacked = np.vstack([arg.data.astype(float) for arg in args])
+    counts = (~np.isnan(stacked)).sum(axis=0)
+    with np.errstate(all="ignore"):
+        data = np.nansum(stacked, axis=0) / counts
+    errors = merge_errors(*[arg.errors for arg in args], _flag(counts == 0, DIV0))
+    return _finish(np.where(counts == 0, 0.0, data), errors)
+
+
+def _extreme(reducer):
+    def implementation(rows, *args):
+        if not args or _numeric_args(args) is None:
+            return NotImplemented
+        stacked = np.vstack([arg.data.astype(float) for arg in args])
+        empty = np.isnan(stacked).all(axis=0)
+        filled = np.where(np.isnan(stacked), np.inf if reducer is np.min else -np.inf, stacked)
+        data = np.where(empty, 0.0, reducer(filled, axis=0))
+        return _finish(data, merge_errors(*[arg.errors for arg in args]))
+    return implementation
+
+
+VECTOR_FUNCTIONS["MIN"] = _extreme(np.min)
+VECTOR_FUNCTIONS["MAX"] = _extreme(np.max)
+
+
+def _unary(fn, domain=None):
+    def implementation(rows, value):
+        if not isinstance(value, Vector):
+            return NotImplemented
+        data, errors = _numbers(value)
+        if domain is not None:
+            errors = merge_errors(errors, _flag(~domain(data), NUM))
+        with np.errstate(all="ignore"):
+            return _finish(fn(data), errors)
+    return implementation
+
+
+VECTOR_FUNCTIONS["ABS"] = _unary(np.abs)
+VECTOR_FUNCTIONS["INT"] = _unary(np.floor)
+VECTOR_FUNCTIONS["SQRT"] = _unary(lambda d: np.sqrt(np.maximum(d, 0.0)), domain=lambda d: d >= 0)
+
+
+@vector_function("ROUND")
+def _v_round(rows, number, digits=None):
+    if not isinstance(number, Vector) or not (digits is None or isinstance(digits, Vector)):
+        return NotImplemented
+    data, errors = _numbers(number)
+    places, digit_errors = _numbers(digits) if digits is not None else (np.zeros(rows), None)
+    factor = 10.0 ** np.trunc(places)
+    # Excel rounds half away from zero; the few ulps count 1.005 (stored as 1.00499...) as a half,
+    # as the scalar engine does by rounding the decimal value
+    with np.errstate(all="ignore"):
+        scaled = np.abs(data) * factor
+        rounded = np.copysign(np.floor(scaled + 0.5 + 4 * np.spacing(scaled)) / factor, data)
+    return _finish(rounded, merge_errors(errors, digit_errors))
+
+
+@vector_function("MOD")
+def _v_mod(rows, number, divisor):
+    if not isinstance(number, Vector) or not isinstance(divisor, Vector):
+        return NotImplemented
+    (a, a_errors), (b, b_errors) = _numbers(number), _numbers(divisor)
+    zero = b == 0
+    with np.errstate(all="ignore"):
+        data = a - b * np.floor(a / np.where(zero, 1.0, b))
+    return _finish(np.where(zero, 0.0, data), merge_errors(a_errors, b_errors, _flag(zero, DIV0)))
+
+
+def _present(vector: Vector) -> np.ndarray:
+    """Rows that are not blank."""
+    if vector.kind == "f":
+        return ~np.isnan(vector.data)
+    if vector.kind == "b":
+        return np.ones(len(vector), dtype=bool)
+    return np.array([value is not None for value in vector.data], dtype=bool)
+
+
+def _logical(reducer, identity: bool):
+    def implementation(rows, *args):
+        if not args or not all(isinstance(arg, Vector) for arg in args):
+            return NotImplemented
+        truths = [_truthy(arg) for arg in args]
+        # blanks are skipped, as in the scalar engine; a row with nothing but blanks is #VALUE!
+        present = np.vstack([_present(arg) for arg in args])
+        data = reducer(np.where(present, np.vstack([t[0] for t in truths]), identity), axis=0)
+        return Vector(data, merge_errors(*[t[1] for t in truths], _flag(~present.any(axis=0), VALUE)))
+    return implementation
+
+
+VECTOR_FUNCTIONS["AND"] = _logical(np.all, True)
+VECTOR_FUNCTIONS["OR"] = _logical(np.any, False)
+
+
+@vector_function("NOT")
+def _v_not(rows, value):
+    if not isinstance(value, Vector):
+        return NotImplemented
+    data, errors = _truthy(value)
+    return Vector(~data, errors)
+
+
+## Compiler: AST -> closure over (environment, row count)
+
+_ARITHMETIC = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.divide,
+    "^": np.power,
+}
+
+_COMPARISON = {
+    "=": np.equal,
+    "<>": np.not_equal,
+    "<": np.less,
+    ">": np.greater,
+    "<=": np.less_equal,
+    ">=": np.greater_equal,
+}
+
+_SCALAR_COMPARISON = {
+    "=": lambda c: c == 0,
+    "<>": lambda c: c != 0,
+    "<": lambda c: c < 0,
+    ">": lambda c: c > 0,
+    "<=": lambda c: c <= 0,
+    ">=": lambda c: c >= 0,
+}
+
+
+def _as_vector(value, rows: int) -> Vector:
+    if isinstance(value, Vector):
+        return value
+    if isinstance(value, Range):
+        if value.height == 1 and value.width == 1:
+            return Vector.full(value.rows[0][0], rows)
+        return Vector.full(ExcelError("#VALUE!"), rows)
+    return Vector.full(value, rows)
+
+
+def _compile_vector(node) -> Callable[[Mapping, int], Any]:
+    kind = node[0]
+
+    if kind == "literal":
+        value = node[1]
+        return lambda env, rows: Vector.full(value, rows)
+
+    if kind == "error":
+        error = ExcelError(node[1])
+        return lambda env, rows: Vector.full(error, rows)
+
+    if kind == "name":
+        name = node[1]
+        is_cell = split_cell(name) is not None
+
+        def lookup(env, rows):
+            if name in env:
+                return env[name]
+            return Vector.full(None if is_cell else ExcelError("#NAME?"), rows)
+        return lookup
+
+    if kind == "range":
+        grid = expand_range(node[1])
+
+        def build_range(env, rows):
+            values = [[env.get(cell) for cell in row] for row in grid]
+            if any(isinstance(v, Vector) for row in values for v in row):
+                raise FormulaSyntaxError(f"Range {node[1]} refers to per-row columns; pass it as a constant instead")
+            return Range(values)
+        return build_range
+
+    if kind == "negate":
+        operand = _compile_vector(node[1])
+
+        def negate(env, rows):
+            data, errors = _numbers(_as_vector(operand(env, rows), rows))
+            return Vector(-data, errors)
+        return negate
+
+    if kind == "percent":
+        operand = _compile_vector(node[1])
+
+        def percent(env, rows):
+            data, errors = _numbers(_as_vector(operand(env, rows), rows))
+            return Vector(data / 100.0, errors)
+        return percent
+
+    if kind == "binary":
+        op, left, right = node[1], _compile_vector(node[2]), _compile_vector(node[3])
+
+        if op in _ARITHMETIC:
+            ufunc = _ARITHMETIC[op]
+
+            def arithmetic(env, rows):
+                a, a_errors = _numbers(_as_vector(left(env, rows), rows))
+                b, b_errors = _numbers(_as_vector(right(env, rows), rows))
+                errors = merge_errors(a_errors, b_errors)
+                if op == "/":
+                    zero = b == 0
+                    errors = merge_errors(errors, _flag(zero, DIV0))
+                    b = np.where(zero, 1.0, b)
+                with np.errstate(all="ignore"):
+                    return _finish(ufunc(a, b), errors)
+            return arithmetic
+
+        if op == "&":
+            def concat(env, rows):
+                args = [_as_vector(left(env, rows), rows), _as_vector(right(env, rows), rows)]
+                return _per_row(lambda a, b: to_text(a) + to_text(b), args, rows)
+            return concat
+
+        ufunc, scalar_test = _COMPARISON[op], _SCALAR_COMPARISON[op]
+
+        def comparison(env, rows):
+            a, b = _as_vector(left(env, rows), rows), _as_vector(right(env, rows), rows)
+            if a.kind == "f" and b.kind == "f":
+                data = ufunc(np.nan_to_num(a.data, nan=0.0), np.nan_to_num(b.data, nan=0.0))
+                return Vector(data, merge_errors(a.errors, b.errors))
+            return _per_row(lambda x, y: scalar_test(compare(x, y)), [a, b], rows)
+        return comparison
+
+    if kind == "call":
+        name, args = node[1], [_compile_vector(arg) for arg in node[2]]
+
+        if name == "IF":
+            def if_(env, rows):
+                test, test_errors = _truthy(_as_vector(args[0](env, rows), rows))
+                if_true = _as_vector(args[1](env, rows), rows) if len(args) > 1 else Vector.full(True, rows)
+                if_false = _as_vector(args[2](env, rows), rows) if len(args) > 2 else Vector.full(False, rows)
+                result = _select(test, if_true, if_false)
+                return Vector(result.data, merge_errors(test_errors, result.errors))
+            return if_
+
+        if name in ("IFERROR", "IFNA"):
+            only_na = name == "IFNA"
+
+            def if_error(env, rows):
+                value = _as_vector(args[0](env, rows), rows)
+                if value.errors is None:
+                    return value
+                caught = value.errors == _ERROR_INDEX["#N/A"] if only_na else value.errors != 0
+                fallback = _as_vector(args[1](env, rows), rows)
+                result = _select(caught, fallback, Vector(value.data))
+                return Vector(result.data, merge_errors(np.where(caught, 0, value.errors).astype(np.int8), result.errors))
+            return if_error
+
+        if name in LAZY_FUNCTIONS:
+            fn = LAZY_FUNCTIONS[name]
+            return lambda env, rows: _per_row(fn, [arg(env, rows) for arg in args], rows, lazy=True)
+
+        if name not in FUNCTIONS:
+            raise FormulaSyntaxError(f"Unsupported function {name}")
+        fn, vectorized = FUNCTIONS[name], VECTOR_FUNCTIONS.get(name)
+
+        def call(env, rows):
+            values = [arg(env, rows) for arg in args]
+            if vectorized is not None:
+                try:
+                    result = vectorized(rows, *values)
+                except TypeError:
+                    result = NotImplemented
+                if result is not NotImplemented:
+                    return result
+            if not any(isinstance(value, Vector) for value in values):
+                # Constant call, evaluate once and broadcast
+                try:
+                    return Vector.full(fn(*values), rows)
+                except ExcelError as error:
+                    return Vector.full(error, rows)
+                except TypeError:
+                    return Vector.full(ExcelError("#VALUE!"), rows)
+            return _per_row(fn, values, rows)
+        return call
+
+    raise FormulaSyntaxError(f"Unknown node {kind}")
+
+
+class VectorFormula:
+    """A formula compiled for column-wise evaluation over NumPy arrays."""
+    __slots__ = ("formula", "_fn")
+
+    def __init__(self, formula: str):
+        self.formula = formula
+        self._fn = _compile_vector(compile_formula(formula).ast)
+
+    def evaluate(self, columns: Mapping[str, Any], constants: Mapping[str, Any] | None = None) -> Vector:
+        env = {}
+        lengths = set()
+        for name, column in columns.items():
+            vector = column if isinstance(column, Vector) else Vector.from_column(column)
+            lengths.add(len(vector))
+            env[normalize_name(name)] = vector
+        if len(lengths) > 1:
+            raise ValueError(f"All columns must have the same length, got {sorted(lengths)}")
+        rows = lengths.pop() if lengths else 1
+        for name, value in (constants or {}).items():
+            if isinstance(value, (list, tuple)):
+                value = Range.from_value(value)
+            elif isinstance(value, str) and value in _ERROR_INDEX:
+                value = ExcelError(value)
+            env[normalize_name(name)] = value
+        return _as_vector(self._fn(env, rows), rows)
+
+
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def compile_vector_formula(formula: str) -> VectorFormula:
+    return VectorFormula(formula)
+
+
+def summarize_vector(vector: Vector) -> tuple[dict[str, float], dict[str, int]]:
+    """Numeric summary over the non-error rows, plus a count of each error code."""
+    error_counts = {}
+    ok = np.ones(len(vector), dtype=bool)
+    if vector.errors is not None:
+        ok = vector.errors == 0
+        codes, counts = np.unique(vector.errors[~ok], return_counts=True)
+        error_counts = {ERROR_CODES[c - 1]: int(n) for c, n in zip(codes, counts)}
+    summary = {}
+    if vector.kind in "fb":
+        values = np.nan_to_num(vector.data[ok].astype(float), nan=0.0)
+        if len(values):
+            summary = {
+                "count": float(len(values)),
+                "sum": float(values.sum()),
+                "mean": float(values.mean()),
+                "min": float(values.min()),
+                "max": float(values.max()),
+            }
+    return summary, error_counts
@@ -0,0 +1,227 @@
+import os
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from pydantic_ai.exceptions import FallbackExceptionGroup, ModelAPIError
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.models.fallback import FallbackModel
+
+MODEL_HEDGING_ENABLED = os.getenv('MODEL_HEDGING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# A hedge is sent once the current model is slower than this percentile of its recent latencies
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '90'))
+# Hedge delay while a model has fewer than HEDGE_MIN_SAMPLES recorded latencies
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '8'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '1'))
+HEDGE_MAX_DELAY = float(os.getenv('HEDGE_MAX_DELAY', '30'))
+HEDGE_MIN_SAMPLES = 5
+# Requests in flight for one model call, the original included
+HEDGE_MAX_PARALLEL = int(os.getenv('HEDGE_MAX_PARALLEL', '2'))
+# Seconds of expected latency added per unit of error rate when ranking models
+ERROR_PENALTY_SECONDS = 30.0
+# Recent requests per model used for percentiles and error rates
+STATS_WINDOW = 200
+# Upper bounds (seconds) of the latency histogram buckets reported in /metrics
+LATENCY_BUCKETS = (0.5, 1, 2, 4, 8, 16, 32, 64)
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStats:
+    """Latency histogram and error rate of one model, over all time and over a recent window."""
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0
+        self.cancelled = 0
+
+    def success(self, latency: float):
+        self.requests += 1
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def overtaken(self, elapsed: float):
+        """A call cancelled after `elapsed` seconds because another model answered first.
+
+        Its latency was at least `elapsed`; counting it keeps a model that is always overtaken
+        from being ranked on old, faster samples.
+        """
+        self.cancelled += 1
+        self.latencies.append(elapsed)
+
+    def failure(self):
+        self.requests += 1
+        self.errors += 1
+        self.outcomes.append(False)
+
+    def percentile(self, percentile: float) -> float | None:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def expected_latency(self) -> float:
+        median = self.percentile(50)
+        return (HEDGE_DEFAULT_DELAY if median is None else median) + self.error_rate * ERROR_PENALTY_SECONDS
+
+    def hedge_delay(self) -> float:
+        threshold = self.percentile(HEDGE_PERCENTILE)
+        if threshold is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(max(threshold, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "wins": self.wins,
+            "cancelled": self.cancelled,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "histogram": {f"<={bound}s": count for bound, count in zip(LATENCY_BUCKETS, self.buckets)}
+                         | {f">{LATENCY_BUCKETS[-1]}s": self.buckets[-1]},
+        }
+
+
+@dataclass(init=False)
+class HedgedModel(FallbackModel):
+    """Sends each request to the model expected to answer fastest, hedging with the next one when it is slow.
+
+    Models are ranked by recent median latency, penalized by their error rate. When the model in
+    flight takes longer than its own HEDGE_PERCENTILE latency, the request is also sent to the next
+    model and whichever answers first wins; the other call is cancelled. A failed call (HTTP error,
+    rate limit) moves on to the next model right away, as FallbackModel does.
+    For streamed requests, "answering" means the first chunk of the stream arrived.
+    """
+
+    def __init__(self, *models: Model, max_parallel: int = HEDGE_MAX_PARALLEL):
+        super().__init__(*models, fallback_on=(ModelAPIError,))
+        self.max_parallel = max(1, max_parallel)
+        self.model_stats = {model.model_name: ModelStats() for model in self.models}
+        self.hedges = 0
+
+    @property
+    def model_name(self) -> str:
+        return f'hedged:{",".join(model.model_name for model in self.models)}'
+
+    @property
+    def model_id(self) -> str:
+        return f'hedged:{",".join(model.model_id for model in self.models)}'
+
+    def ranked(self) -> list[Model]:
+        # sorted() is stable: with no data yet, the configured order is kept
+        return sorted(self.models, key=lambda model: self.model_stats[model.model_name].expected_latency())
+
+    async def _race(self, attempt, order: list[Model]):
+        """Run `attempt(model)` on `order`, adding a model when the running ones are slow or failed.
+
+        Returns (model, result) of the first success; the other attempts are cancelled.
+        """
+        pending: dict[asyncio.Task, tuple[Model, float]] = {}
+        exceptions: list[Exception] = []
+        remaining = list(order)
+
+        def start():
+            model = remaining.pop(0)
+            task = asyncio.ensure_future(attempt(model))
+            pending[task] = (model, time.monotonic())
+            return model
+
+        try:
+            delay = self.model_stats[start().model_name].hedge_delay()
+            while pending:
+                can_hedge = remaining and len(pending) < self.max_parallel
+                done, _ = await asyncio.wait(pending, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges += 1
+                    model = start()
+                    logger.info("Model call is slow, hedging with %s", model.model_name)
+                    delay = self.model_stats[model.model_name].hedge_delay()
+                    continue
+                for task in done:
+                    model, started = pending.pop(task)
+                    stats = self.model_stats[model.model_name]
+                    error = task.exception()
+                    if error is None:
+                        stats.success(time.monotonic() - started)
+                        stats.wins += 1
+                        return model, task.result()
+                    stats.failure()
+                    if not isinstance(error, ModelAPIError):
+                        raise error
+                    logger.warning("Model %s failed: %s", model.model_name, error)
+                    exceptions.append(error)
+                if remaining and len(pending) < self.max_parallel:
+                    delay = self.model_stats[start().model_name].hedge_delay()
+            raise FallbackExceptionGroup("All models from HedgedModel failed", exceptions)
+        finally:
+            for task, (model, started) in pending.items():
+                task.cancel()
+                self.model_stats[model.model_name].overtaken(time.monotonic() - started)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def request(self, messages, model_settings, model_request_parameters: ModelRequestParameters):
+        async def attempt(model: Model):
+            return await model.request(model.prepare_messages(messages), model_settings, model_request_parameters)
+
+        model, response = await self._race(attempt, self.ranked())
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, messages, model_settings, model_request_parameters: ModelRequestParameters,
+                             run_context=None) -> AsyncIterator[StreamedResponse]:
+        # Each attempt opens its stream in its own task and keeps it open until the winner's
+        # consumer is done, so every stream is closed by the task that opened it.
+        release = asyncio.Event()
+
+        async def attempt(model: Model):
+            opened: asyncio.Future = asyncio.get_running_loop().create_future()
+
+            async def hold():
+                try:
+                    async with model.request_stream(model.prepare_messages(messages), model_settings,
+                                                    model_request_parameters, run_context) as response:
+                        opened.set_result(response)
+                        await release.wait()
+                except BaseException as e:
+                    if not opened.done():
+                        opened.set_exception(e)
+                    raise
+
+            holder = asyncio.ensure_future(hold())
+            try:
+                return await opened, holder
+            except BaseException:
+                holder.cancel()
+                await asyncio.gather(holder, return_exceptions=True)
+                raise
+
+        model, (response, holder) = await self._race(attempt, self.ranked())
+        try:
+            yield response
+        finally:
+            release.set()
+            await asyncio.gather(holder, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "order": [model.model_name for model in self.ranked()],
+            "hedges": self.hedges,
+            "models": {name: stats.snapshot() for name, stats in self.model_stats.items()},
+        }
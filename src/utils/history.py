@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from dataclasses import replace
+from typing import Awaitable, Callable
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+from src.utils.session_store import SESSION_IDLE_SECONDS, ConversationState, MemorySessionStore, SessionStore
+
+# Approximate prompt tokens a user's history may take before older turns are summarized
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '6000'))
+# Most recent tokens kept verbatim when compacting
+HISTORY_KEEP_RECENT_TOKENS = int(os.getenv('HISTORY_KEEP_RECENT_TOKENS', '2000'))
+# If summarizing falls behind, the oldest turns are dropped past budget * this factor
+HISTORY_HARD_LIMIT_FACTOR = float(os.getenv('HISTORY_HARD_LIMIT_FACTOR', '2'))
+# Tool arguments and results kept in history are cut to this many characters
+TOOL_PAYLOAD_CHARS = int(os.getenv('TOOL_PAYLOAD_CHARS', '2000'))
+# Seconds between sweeps for idle sessions
+EXPIRY_INTERVAL = 300
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+logger = logging.getLogger(__name__)
+
+
+def _part_text(part) -> str:
+    if isinstance(part, ToolCallPart):
+        return part.tool_name + part.args_as_json_str()
+    if isinstance(part, ToolReturnPart):
+        return part.model_response_str()
+    content = getattr(part, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+
+def estimate_tokens(messages: list[ModelMessage]) -> int:
+    """Rough token count (4 characters per token), good enough for budgeting."""
+    return sum(len(_part_text(part)) for message in messages for part in message.parts) // 4
+
+
+def _truncate(text: str, limit: int) -> str:
+    return f"{text[:limit]} ... [{len(text) - limit} characters trimmed]"
+
+
+def trim_tool_payloads(messages: list[ModelMessage], limit: int = TOOL_PAYLOAD_CHARS) -> list[ModelMessage]:
+    """Shorten large tool arguments and results; the model already used them to answer."""
+    trimmed = []
+    for message in messages:
+        parts = []
+        for part in message.parts:
+            if isinstance(part, ToolReturnPart):
+                text = part.model_response_str()
+                if len(text) > limit:
+                    part = replace(part, content=_truncate(text, limit))
+            elif isinstance(part, ToolCallPart):
+                text = part.args_as_json_str()
+                if len(text) > limit:
+                    part = replace(part, args={"trimmed_arguments": _truncate(text, limit)})
+            parts.append(part)
+        trimmed.append(replace(message, parts=parts))
+    return trimmed
+
+
+def _starts_turn(message: ModelMessage) -> bool:
+    return isinstance(message, ModelRequest) and any(isinstance(part, UserPromptPart) for part in message.parts)
+
+
+def split_recent(messages: list[ModelMessage], keep_tokens: int) -> int:
+    """Index where the most recent whole turns fitting in `keep_tokens` start (never splits a tool call from its result)."""
+    start = len(messages)
+    for index in range(len(messages) - 1, 0, -1):
+        if not _starts_turn(messages[index]):
+            continue
+        if estimate_tokens(messages[index:]) > keep_tokens:
+            break
+        start = index
+    if start == len(messages):
+        # even the last turn is over budget: keep it anyway
+        for index in range(len(messages) - 1, -1, -1):
+            if _starts_turn(messages[index]):
+                return index
+        return 0
+    return start
+
+
+def transcript(messages: list[ModelMessage]) -> str:
+    """Plain-text rendering of user prompts and answers for the summarizer."""
+    lines = []
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, UserPromptPart):
+                lines.append(f"User: {_part_text(part)}")
+            elif isinstance(part, TextPart) and isinstance(message, ModelResponse):
+                lines.append(f"Assistant: {part.content}")
+            elif isinstance(part, ToolReturnPart):
+                text = _part_text(part)
+                lines.append(f"Tool {part.tool_name}: {_truncate(text, 500) if len(text) > 500 else text}")
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """Per-user conversation history kept under a token budget, persisted in a session store.
+
+    When a history grows past `budget` tokens, the older turns are folded into a running
+    summary by `summarizer` in a background task; the request that triggered it does not wait.
+    Callers hold `lock(user_id)` while they read, run and append, so one user's requests do not
+    interleave even across worker processes.
+    """
+
+    def __init__(self, summarizer: Callable[[str], Awaitable[str]] | None = None, budget: int = HISTORY_TOKEN_BUDGET,
+                 keep_recent: int = HISTORY_KEEP_RECENT_TOKENS, hard_limit_factor: float = HISTORY_HARD_LIMIT_FACTOR,
+                 store: SessionStore | None = None, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.summarizer = summarizer
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.hard_limit = int(budget * hard_limit_factor)
+        self.store = store or MemorySessionStore()
+        self.idle_seconds = idle_seconds
+        self._compacting: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._last_expiry = time.monotonic()
+        self.stats = {"compactions": 0, "compaction_failures": 0, "dropped_messages": 0, "expired_sessions": 0}
+
+    def lock(self, user_id: str):
+        return self.store.lock(user_id)
+
+    async def get(self, user_id: str) -> list[ModelMessage]:
+        """History to send with the next run: the running summary, then the recent messages."""
+        state = await self.store.load(user_id)
+        if state is None:
+            return []
+        if state.summary is None:
+            return list(state.messages)
+        summary = ModelRequest(parts=[SystemPromptPart(content=SUMMARY_PREFIX + state.summary)])
+        return [summary] + state.messages
+
+    async def append(self, user_id: str, new_messages: list[ModelMessage]):
+        state = await self.store.load(user_id) or ConversationState()
+        state.messages.extend(trim_tool_payloads(new_messages))
+        tokens = estimate_tokens(state.messages)
+        if tokens > self.hard_limit or (tokens > self.budget and self.summarizer is None):
+            self._drop_oldest(state)
+        elif tokens > self.budget and user_id not in self._compacting:
+            self._compacting.add(user_id)
+            self._spawn(self._compact(user_id))
+        await self.store.save(user_id, state)
+        if time.monotonic() - self._last_expiry > EXPIRY_INTERVAL:
+            self._last_expiry = time.monotonic()
+            self._spawn(self._expire())
+
+    async def reset(self, user_id: str):
+        await self.store.delete(user_id)
+
+    async def count(self) -> int:
+        return await self.store.count()
+
+    def _spawn(self, coroutine):
+        # a fresh context: background work is not billed to the request that happened to trigger it
+        task = asyncio.get_running_loop().create_task(coroutine, context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _drop_oldest(self, state: ConversationState):
+        start = split_recent(state.messages, self.keep_recent if self.summarizer is None else self.budget)
+        self.stats["dropped_messages"] += start
+        del state.messages[:start]
+
+    async def _compact(self, user_id: str):
+        try:
+            async with self.lock(user_id):
+                state = await self.store.load(user_id)
+            if state is None:
+                return
+            older = state.messages[:split_recent(state.messages, self.keep_recent)]
+            if not older:
+                return
+            text = transcript(older)
+            if state.summary:
+                text = f"{SUMMARY_PREFIX}{state.summary}\n\nLater messages:\n{text}"
+            summary = await self.summarizer(text)
+            async with self.lock(user_id):
+                state = await self.store.load(user_id)
+                # messages may have been appended (or dropped) while summarizing, only remove what was summarized
+                if state is not None and state.messages[:len(older)] == older:
+                    del state.messages[:len(older)]
+                    state.summary = summary
+                    await self.store.save(user_id, state)
+                    self.stats["compactions"] += 1
+        except Exception:
+            self.stats["compaction_failures"] += 1
+            logger.exception("Summarizing conversation history failed")
+        finally:
+            self._compacting.discard(user_id)
+
+    async def _expire(self):
+        try:
+            self.stats["expired_sessions"] += await self.store.expire(self.idle_seconds)
+        except Exception:
+            logger.exception("Expiring idle sessions failed")
+
+    async def drain(self):
+        """Wait for pending background work (used on shutdown and in tests)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
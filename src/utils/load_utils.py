@@ -1,18 +1,107 @@
 import os
 import dotenv
+import httpx
 import logging
 import asyncio
+import importlib.util
 
 from langfuse import get_client, observe
 from dotenv import load_dotenv
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIChatModel
 from pydantic_ai.providers.openrouter import OpenRouterProvider
+from src.utils.hedged_model import HedgedModel, MODEL_HEDGING_ENABLED
+from src.utils.admission import LimitedModel, upstream_limit
+from src.utils.usage_budget import MeteredModel
 
 load_dotenv()  # Load environment variables from .env file
 
 Agent.instrument_all()
 
+# Outgoing HTTP: one keep-alive connection pool per upstream service, shared by all agents and requests
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '20'))
+HTTP_MAX_KEEPALIVE_PER_HOST = int(os.getenv('HTTP_MAX_KEEPALIVE_PER_HOST', '10'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '90'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+# Model responses can take a while to start streaming
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '120'))
+# How long a request waits for a free connection when the host's pool is full
+HTTP_POOL_TIMEOUT = float(os.getenv('HTTP_POOL_TIMEOUT', '10'))
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Counts requests, failures and new connections (from httpcore's trace extension) of one pool."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, counters: dict[str, int]):
+        self.transport = transport
+        self.counters = counters
+
+    async def _trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self.counters["connections_opened"] += 1
+        elif event == "connection.start_tls.complete":
+            self.counters["tls_handshakes"] += 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.counters["requests"] += 1
+        self.counters["in_flight"] += 1
+        request.extensions["trace"] = self._trace
+        try:
+            return await self.transport.handle_async_request(request)
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        finally:
+            self.counters["in_flight"] -= 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class HttpClientPool:
+    """Long-lived httpx clients, one per upstream service, so connections and TLS sessions are reused.
+
+    Services get separate clients because SDKs such as Tavily's set default headers (API keys)
+    on the client they are given; the connection limits therefore apply per host.
+    HTTP/2 is used when the optional `h2` package is installed.
+    """
+
+    def __init__(self, http2: bool = HTTP2_ENABLED, max_connections: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+                 max_keepalive: int = HTTP_MAX_KEEPALIVE_PER_HOST, keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT,
+                 pool_timeout: float = HTTP_POOL_TIMEOUT):
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logging.getLogger(__name__).warning("h2 is not installed, upstream connections use HTTP/1.1")
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=pool_timeout)
+        self.clients: dict[str, httpx.AsyncClient] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+
+    def get(self, service: str) -> httpx.AsyncClient:
+        if service not in self.clients:
+            counters = self.counters[service] = {"requests": 0, "in_flight": 0, "errors": 0, "connections_opened": 0, "tls_handshakes": 0}
+            transport = _CountingTransport(httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits), counters)
+            self.clients[service] = httpx.AsyncClient(transport=transport, timeout=self.timeout)
+        return self.clients[service]
+
+    def stats(self) -> dict:
+        services = {
+            service: {**counters, "reused_connections": max(counters["requests"] - counters["connections_opened"], 0)}
+            for service, counters in self.counters.items()
+        }
+        return {"http2": self.http2, "services": services}
+
+    async def aclose(self):
+        clients, self.clients = self.clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+
+http_clients = HttpClientPool()
+
+
 class BasicConfig:
     llm_model = None
     langfuse = None
@@ -62,9 +151,24 @@ class BasicConfig:
         
 
     def load_llm_model(self, OPEN_ROUTER_API_KEY, DEFAULT_MODEL):
-        self.llm_model = OpenAIChatModel(DEFAULT_MODEL,
-            provider=OpenRouterProvider(api_key=OPEN_ROUTER_API_KEY),
-            )
+        provider = OpenRouterProvider(api_key=OPEN_ROUTER_API_KEY, http_client=http_clients.get("openrouter"))
+        # Every call to OpenRouter, whichever model, counts against one concurrency limit
+        limiter = upstream_limit("openrouter")
+        if not MODEL_HEDGING_ENABLED:
+            self.llm_model = MeteredModel(LimitedModel(OpenAIChatModel(DEFAULT_MODEL, provider=provider), limiter))
+            return
+        # The chosen model goes first; the others are hedges and fallbacks, reordered by observed latency
+        model_names = [DEFAULT_MODEL] + [name for name in self.configured_models() if name != DEFAULT_MODEL]
+        # Metered outside the hedge: a hedged call counts once against the request's budget
+        self.llm_model = MeteredModel(HedgedModel(*(LimitedModel(OpenAIChatModel(name, provider=provider), limiter) for name in dict.fromkeys(model_names))))
+        self.logger.info(f"Hedging model calls across {', '.join(dict.fromkeys(model_names))}")
+
+    def configured_models(self):
+        return [
+            os.getenv('DEEPSEEK', 'deepseek/deepseek-chat-v3.1:free'),
+            os.getenv('Z-AI', 'z-ai/glm-4.5-air:free'),
+            os.getenv('GEMINI', 'google/gemini-2.5-flash-lite-preview-09-2025'),
+        ]
 
 
 if __name__ == "__main__":
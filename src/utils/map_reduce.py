@@ -0,0 +1,124 @@
+import os
+import re
+import math
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from src.utils.streaming import emit_progress
+
+# Approximate tokens of content sent to the summarizer in one call
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', '3000'))
+# Summarizer calls running at the same time for one document
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+# Upper bound on summarizer calls (map and reduce) for one document
+SUMMARY_MAX_CALLS = int(os.getenv('SUMMARY_MAX_CALLS', '16'))
+
+CHARS_PER_TOKEN = 4
+
+MAP_PROMPT = "This is part {index} of {total} of a longer document. Summarize it, keeping names, numbers, dates and sources:\n\n{text}"
+REDUCE_PROMPT = "These are summaries of consecutive parts of one document. Combine them into a single summary, keeping names, numbers, dates and sources:\n\n{text}"
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+logger = logging.getLogger(__name__)
+
+summary_stats = {"documents": 0, "chunked_documents": 0, "calls": 0, "reduce_levels": 0}
+
+
+def _pieces(text: str, limit: int) -> list[str]:
+    """Paragraphs, or sentences of paragraphs that are too long, or fixed-size slices as a last resort."""
+    pieces = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= limit:
+            if paragraph:
+                pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            pieces.extend(sentence[start:start + limit] for start in range(0, len(sentence), limit))
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> list[str]:
+    """Split `text` into chunks of at most about `max_tokens`, on paragraph or sentence boundaries where possible."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    chunks, current, size = [], [], 0
+    for piece in _pieces(text, limit):
+        if current and size + len(piece) + 2 > limit:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class MapReduceSummarizer:
+    """Summarizes content of any length with a bounded number of concurrent summarizer calls.
+
+    Long content is cut into chunks that are summarized in parallel (map); the partial summaries
+    are then combined level by level, in groups that fit one call, until one is left (reduce).
+    With n chunks the reduce needs at most n - 1 calls, so the chunk count is limited to keep
+    the total under `max_calls`; past that, chunks get bigger instead of more numerous.
+    """
+
+    def __init__(self, summarize: Callable[[str], Awaitable[str]], chunk_tokens: int = SUMMARY_CHUNK_TOKENS,
+                 concurrency: int = SUMMARY_CONCURRENCY, max_calls: int = SUMMARY_MAX_CALLS):
+        self.summarize = summarize
+        self.chunk_tokens = chunk_tokens
+        self.concurrency = concurrency
+        self.max_chunks = max(1, (max_calls + 1) // 2)
+
+    async def _call(self, semaphore: asyncio.Semaphore, prompt: str) -> str:
+        async with semaphore:
+            summary_stats["calls"] += 1
+            return await self.summarize(prompt)
+
+    async def __call__(self, content: str) -> str:
+        summary_stats["documents"] += 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limit = self.chunk_tokens * CHARS_PER_TOKEN
+        if len(content) <= limit:
+            return await self._call(semaphore, content)
+
+        chunk_tokens = self.chunk_tokens
+        chunks = chunk_text(content, chunk_tokens)
+        if len(chunks) > self.max_chunks:
+            logger.warning("Content of %d characters needs %d chunks, raising the chunk size to stay within %d",
+                           len(content), len(chunks), self.max_chunks)
+            chunk_tokens = math.ceil(len(content) / CHARS_PER_TOKEN / self.max_chunks)
+            # packing on boundaries leaves some room unused in each chunk
+            while len(chunks := chunk_text(content, chunk_tokens)) > self.max_chunks:
+                chunk_tokens = math.ceil(chunk_tokens * 1.1)
+        summary_stats["chunked_documents"] += 1
+
+        emit_progress("summarizing", chunks=len(chunks))
+        summaries = await asyncio.gather(*(
+            self._call(semaphore, MAP_PROMPT.format(index=index + 1, total=len(chunks), text=chunk))
+            for index, chunk in enumerate(chunks)
+        ))
+        while len(summaries) > 1:
+            summary_stats["reduce_levels"] += 1
+            emit_progress("combining summaries", summaries=len(summaries))
+            groups = self._groups(summaries, limit)
+            summaries = await asyncio.gather(*(self._call(semaphore, REDUCE_PROMPT.format(text="\n\n".join(group))) for group in groups))
+        return summaries[0]
+
+    @staticmethod
+    def _groups(summaries: list[str], limit: int) -> list[list[str]]:
+        """Consecutive summaries packed into groups that fit one call, at least two per group so every level shrinks."""
+        groups, current, size = [], [], 0
+        for summary in summaries:
+            if len(current) >= 2 and size + len(summary) > limit:
+                groups.append(current)
+                current, size = [], 0
+            current.append(summary)
+            size += len(summary) + 2
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        elif current:
+            groups.append(current)
+        return groups
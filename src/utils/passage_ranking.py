@@ -0,0 +1,186 @@
+import os
+import re
+import math
+import functools
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Mapping
+
+from pydantic_ai.tools import Tool
+
+from src.utils.search_fanout import normalize_result
+
+PASSAGE_RANKING_ENABLED = os.getenv('PASSAGE_RANKING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Approximate tokens of search results one tool call may hand to the model
+SEARCH_RESULT_TOKENS = int(os.getenv('SEARCH_RESULT_TOKENS', '1200'))
+# Passages kept per tool call, best first
+PASSAGE_TOP_K = int(os.getenv('PASSAGE_TOP_K', '8'))
+# Results are cut into passages of whole sentences of about this many words
+PASSAGE_WORDS = int(os.getenv('PASSAGE_WORDS', '60'))
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when "
+    "where which who why will with".split()
+)
+
+# Index shared by the search calls of one agent run, see `passage_index`
+_index: ContextVar["BM25Index | None"] = ContextVar("passage_index", default=None)
+
+ranking_stats = {"searches": 0, "passages_in": 0, "passages_kept": 0, "tokens_in": 0, "tokens_kept": 0}
+
+
+def passage_terms(text: str) -> list[str]:
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def passage_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> list[str]:
+    """Consecutive sentences grouped into passages of at most about `max_words` words."""
+    passages, current, words = [], [], 0
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        count = len(sentence.split())
+        if current and words + count > max_words:
+            passages.append(" ".join(current))
+            current, words = [], 0
+        current.append(sentence)
+        words += count
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class BM25Index:
+    """Okapi BM25 over passages, grown incrementally as search results arrive.
+
+    Term statistics accumulate over every search of a run, so later searches are scored
+    against everything seen so far, and passages already returned are not sent again.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.document_frequency: Counter = Counter()
+        self.documents: list[Counter] = []
+        self.total_length = 0
+        self.returned: set[str] = set()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, passage: str) -> int:
+        counts = Counter(passage_terms(passage))
+        self.documents.append(counts)
+        self.document_frequency.update(counts.keys())
+        self.total_length += sum(counts.values())
+        return len(self.documents) - 1
+
+    def idf(self, term: str) -> float:
+        frequency = self.document_frequency.get(term, 0)
+        return math.log(1 + (len(self.documents) - frequency + 0.5) / (frequency + 0.5))
+
+    def score(self, query: str, document: int) -> float:
+        counts = self.documents[document]
+        length = sum(counts.values())
+        average = self.total_length / len(self.documents) if self.documents else 0.0
+        score = 0.0
+        for term in set(passage_terms(query)):
+            frequency = counts.get(term, 0)
+            if frequency:
+                norm = self.k1 * (1 - self.b + self.b * length / average) if average else self.k1
+                score += self.idf(term) * frequency * (self.k1 + 1) / (frequency + norm)
+        return score
+
+
+def current_index() -> BM25Index:
+    """The index of the enclosing `passage_index` block, or a fresh one."""
+    index = _index.get()
+    return index if index is not None else BM25Index()
+
+
+@contextmanager
+def passage_index(index: BM25Index | None = None):
+    """Share one BM25 index between the search calls made inside this block (including nested agent runs)."""
+    token = _index.set(index or BM25Index())
+    try:
+        yield _index.get()
+    finally:
+        _index.reset(token)
+
+
+def select_passages(query: str, results: list[Mapping[str, Any]], index: BM25Index | None = None, engine: str = "web",
+                    top_k: int = PASSAGE_TOP_K, token_budget: int = SEARCH_RESULT_TOKENS) -> list[dict]:
+    """Keep only the passages of `results` most relevant to `query`, within `token_budget`.
+
+    Each result keeps its best passages (in their original order); results come back ordered
+    by their best passage. When no passage matches the query, the engine's order is kept.
+    """
+    index = index if index is not None else BM25Index()
+    candidates = []
+    for position, result in enumerate(results):
+        # fan-out results are already normalized
+        result = dict(result) if "engines" in result else normalize_result(result, engine)
+        if result is None:
+            continue
+        for order, passage in enumerate(split_passages(result["content"])):
+            if passage in index.returned:
+                continue
+            candidates.append((index.add(passage), position, order, passage, result))
+
+    scored = sorted(((index.score(query, document), *rest) for document, *rest in candidates),
+                    key=lambda candidate: candidate[0], reverse=True)
+    # passages sharing no term with the query are dropped, unless none does (tickers, synonyms, a
+    # stopword-only query): then trust the engine and keep its leading passages, which the stable sort left in order
+    pool = [candidate for candidate in scored if candidate[0] > 0] or scored
+    kept, tokens = [], 0
+    for candidate in pool:
+        if len(kept) >= top_k:
+            break
+        cost = passage_tokens(candidate[3])
+        if tokens + cost > token_budget:
+            continue
+        kept.append(candidate)
+        tokens += cost
+
+    by_result: dict[int, dict] = {}
+    for score, position, order, passage, result in kept:
+        index.returned.add(passage)
+        entry = by_result.setdefault(position, {**result, "passages": [], "score": score})
+        entry["passages"].append((order, passage))
+    ranked = sorted(by_result.values(), key=lambda entry: entry["score"], reverse=True)
+    for entry in ranked:
+        entry["content"] = " ... ".join(passage for _, passage in sorted(entry.pop("passages")))
+        entry["score"] = round(entry["score"], 3)
+
+    ranking_stats["searches"] += 1
+    ranking_stats["passages_in"] += len(candidates)
+    ranking_stats["passages_kept"] += len(kept)
+    ranking_stats["tokens_in"] += sum(passage_tokens(candidate[3]) for candidate in candidates)
+    ranking_stats["tokens_kept"] += tokens
+    return ranked
+
+
+def ranked_search_tool(tool: Tool, engine: str) -> Tool:
+    """Wrap a search tool so the model only sees the passages most relevant to the query.
+
+    The wrapped tool keeps the name, description and parameters the model sees.
+    """
+    search = tool.function
+
+    @functools.wraps(search)
+    async def ranked_search(query: str, **options):
+        results = await search(query, **options)
+        return select_passages(query, results or [], current_index(), engine)
+
+    return Tool(ranked_search, name=tool.name, description=tool.description)
@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import math
+import hashlib
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Literal, Mapping, Sequence
+
+import yaml
+
+from src.utils.formula_engine import FUNCTIONS, LAZY_FUNCTIONS
+
+PRE_ROUTER_ENABLED = os.getenv('PRE_ROUTER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Minimum probability for sending a request straight to a sub-agent instead of the routing LLM
+PRE_ROUTER_EXCEL_THRESHOLD = float(os.getenv('PRE_ROUTER_EXCEL_THRESHOLD', '0.9'))
+PRE_ROUTER_RESEARCH_THRESHOLD = float(os.getenv('PRE_ROUTER_RESEARCH_THRESHOLD', '0.9'))
+# Shorter messages are usually follow-ups that only make sense with the conversation
+PRE_ROUTER_MIN_WORDS = int(os.getenv('PRE_ROUTER_MIN_WORDS', '3'))
+PRE_ROUTER_MODEL_PATH = os.getenv('PRE_ROUTER_MODEL_PATH', os.path.join('.cache', 'pre_router_model.json'))
+KNOWLEDGE_BASE_PATH = "src/agent/knowledge/excel_kb.yaml"
+ROUTER_EXAMPLES_PATH = "src/agent/knowledge/router_examples.yaml"
+
+Target = Literal["excel", "research"]
+LABELS: tuple[Target, ...] = ("excel", "research")
+
+# Log-odds added in favour of excel for each kind of keyword evidence
+FORMULA_EVIDENCE = 6.0
+KEYWORD_EVIDENCE = 3.0
+
+EXCEL_VOCABULARY = ("excel", "spreadsheet", "worksheet", "workbook", "pivot table", "google sheets", "xlsx")
+# Function names that are also plain English words only count when written in capitals or called
+_ENGLISH_NAMES = {
+    "ABS", "AND", "AVERAGE", "COUNT", "DATE", "DAY", "INDEX", "INT", "LEFT", "LEN", "LOWER", "MATCH", "MAX",
+    "MID", "MIN", "MOD", "MONTH", "NOT", "OR", "POWER", "PRODUCT", "RIGHT", "ROUND", "SUM", "TODAY", "TRIM",
+    "UPPER", "YEAR", "IF",
+}
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9_']*")
+_CALL_RE = re.compile(r"\b([A-Za-z][A-Za-z0-9.]*)\s*\(")
+_RANGE_RE = re.compile(r"(?<![A-Za-z])\$?[A-Z]{1,3}\$?\d+(?::\$?[A-Z]{1,3}\$?\d+)?(?![A-Za-z0-9])")
+_UPPER_WORD_RE = re.compile(r"\b[A-Z][A-Z0-9.]{1,}\b")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase words plus bigrams."""
+    words = _WORD_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def load_formula_names(path: str = KNOWLEDGE_BASE_PATH) -> set[str]:
+    """Function names from the excel knowledge base and the local formula engine."""
+    names = set(FUNCTIONS) | set(LAZY_FUNCTIONS)
+    try:
+        with open(path, "r") as f:
+            names |= {str(name).upper() for name in (yaml.safe_load(f) or {}).get("excel_formulas", {})}
+    except FileNotFoundError:
+        pass
+    return names
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over word unigrams and bigrams, small enough to keep as JSON."""
+
+    def __init__(self, priors: Mapping[str, float], counts: Mapping[str, Mapping[str, int]], vocabulary: int, alpha: float = 1.0):
+        self.priors = dict(priors)
+        self.counts = {label: dict(words) for label, words in counts.items()}
+        self.totals = {label: sum(words.values()) for label, words in self.counts.items()}
+        self.vocabulary = vocabulary
+        self.alpha = alpha
+
+    @classmethod
+    def train(cls, examples: Mapping[str, Iterable[str]], alpha: float = 1.0) -> "NaiveBayes":
+        counts = {label: Counter() for label in examples}
+        documents = {label: 0 for label in examples}
+        for label, texts in examples.items():
+            for text in texts:
+                counts[label].update(tokenize(text))
+                documents[label] += 1
+        total = sum(documents.values())
+        priors = {label: documents[label] / total for label in examples}
+        vocabulary = len(set().union(*counts.values()))
+        return cls(priors, counts, vocabulary, alpha)
+
+    def log_odds(self, text: str, positive: str, negative: str) -> float:
+        """log P(positive | text) - log P(negative | text); words never seen in training are ignored."""
+        score = math.log(self.priors[positive]) - math.log(self.priors[negative])
+        for token in tokenize(text):
+            if not any(token in self.counts[label] for label in (positive, negative)):
+                continue
+            for label, sign in ((positive, 1), (negative, -1)):
+                likelihood = (self.counts[label].get(token, 0) + self.alpha) / (self.totals[label] + self.alpha * self.vocabulary)
+                score += sign * math.log(likelihood)
+        return score
+
+    def to_dict(self) -> dict:
+        return {"priors": self.priors, "counts": self.counts, "vocabulary": self.vocabulary, "alpha": self.alpha}
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "NaiveBayes":
+        return cls(data["priors"], data["counts"], data["vocabulary"], data.get("alpha", 1.0))
+
+
+@dataclass
+class RouteDecision:
+    target: Target | None
+    confidence: float
+    reason: str
+
+    @property
+    def fast_path(self) -> bool:
+        return self.target is not None
+
+
+def _sigmoid(x: float) -> float:
+    if x < 0:
+        z = math.exp(x)
+        return z / (1 + z)
+    return 1 / (1 + math.exp(-x))
+
+
+class PreRouter:
+    """Local classifier that routes obvious requests without asking the routing LLM.
+
+    Formula calls, cell ranges and spreadsheet vocabulary push a request towards the excel agent;
+    a naive Bayes model trained on router_examples.yaml scores everything else. Requests where
+    neither side is confident enough fall back to the LLM router, and so do all messages of a
+    conversation after the first: the sub-agents do not see the history a follow-up refers to.
+    """
+
+    def __init__(self, model: NaiveBayes, formula_names: Iterable[str],
+                 excel_threshold: float = PRE_ROUTER_EXCEL_THRESHOLD,
+                 research_threshold: float = PRE_ROUTER_RESEARCH_THRESHOLD,
+                 min_words: int = PRE_ROUTER_MIN_WORDS):
+        self.model = model
+        self.formula_names = {name.upper() for name in formula_names}
+        self.excel_threshold = excel_threshold
+        self.research_threshold = research_threshold
+        self.min_words = min_words
+        self.counters = {"excel": 0, "research": 0, "fallback": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, model_path: str = PRE_ROUTER_MODEL_PATH, examples_path: str = ROUTER_EXAMPLES_PATH,
+             knowledge_path: str = KNOWLEDGE_BASE_PATH, **thresholds) -> "PreRouter":
+        """Load the model from disk, retraining (and saving) it when the examples changed."""
+        with open(examples_path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        model = None
+        try:
+            with open(model_path, "r") as f:
+                stored = json.load(f)
+            if stored.get("examples_sha256") == digest:
+                model = NaiveBayes.from_dict(stored["model"])
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        if model is None:
+            examples = yaml.safe_load(raw)
+            model = NaiveBayes.train({label: examples.get(label, []) for label in LABELS})
+            os.makedirs(os.path.dirname(os.path.abspath(model_path)), exist_ok=True)
+            with open(model_path, "w") as f:
+                json.dump({"examples_sha256": digest, "model": model.to_dict()}, f)
+        return cls(model, load_formula_names(knowledge_path), **thresholds)
+
+    def keyword_evidence(self, message: str) -> tuple[float, str | None]:
+        """Log-odds towards excel from formula calls, cell ranges, function names and vocabulary."""
+        for match in _CALL_RE.finditer(message):
+            if match.group(1).upper() in self.formula_names:
+                return FORMULA_EVIDENCE, f"formula call {match.group(1).upper()}"
+        if _RANGE_RE.search(message) and re.search(r"[A-Z]{1,3}\d+:[A-Z]{1,3}\d+|\bcells?\b", message, re.IGNORECASE):
+            return FORMULA_EVIDENCE, "cell reference"
+        for word in _UPPER_WORD_RE.findall(message):
+            if word in self.formula_names and len(word) > 2:
+                return KEYWORD_EVIDENCE, f"function name {word}"
+        lowered = message.lower()
+        for name in self.formula_names - _ENGLISH_NAMES:
+            if len(name) > 3 and re.search(rf"\b{re.escape(name.lower())}\b", lowered):
+                return KEYWORD_EVIDENCE, f"function name {name}"
+        for term in EXCEL_VOCABULARY:
+            if term in lowered:
+                return KEYWORD_EVIDENCE, f"keyword {term!r}"
+        return 0.0, None
+
+    def classify(self, message: str, history: Sequence[object] = ()) -> RouteDecision:
+        if history:
+            decision = RouteDecision(None, 0.0, "follow-up, routed with the conversation")
+        elif len(_WORD_RE.findall(message.lower())) < self.min_words:
+            decision = RouteDecision(None, 0.0, "too short to route without context")
+        else:
+            evidence, reason = self.keyword_evidence(message)
+            probability = _sigmoid(self.model.log_odds(message, "excel", "research") + evidence)
+            reason = reason or "text model"
+            if probability >= self.excel_threshold:
+                decision = RouteDecision("excel", probability, reason)
+            elif 1 - probability >= self.research_threshold:
+                decision = RouteDecision("research", 1 - probability, reason)
+            else:
+                decision = RouteDecision(None, max(probability, 1 - probability), "below confidence threshold")
+        with self._lock:
+            self.counters[decision.target or "fallback"] += 1
+        return decision
+
+    def stats(self) -> dict:
+        decisions = sum(self.counters.values())
+        fast = decisions - self.counters["fallback"]
+        return {
+            "excel_threshold": self.excel_threshold,
+            "research_threshold": self.research_threshold,
+            "fast_path_excel": self.counters["excel"],
+            "fast_path_research": self.counters["research"],
+            "fallback": self.counters["fallback"],
+            "fast_path_rate": fast / decisions if decisions else 0.0,
+        }
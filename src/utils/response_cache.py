@@ -0,0 +1,116 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Sequence
+
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, ToolCallPart, UserPromptPart
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))
+# How many trailing conversation messages are part of the cache key
+RESPONSE_CACHE_CONTEXT_MESSAGES = int(os.getenv('RESPONSE_CACHE_CONTEXT_MESSAGES', '4'))
+# Bump when prompts change so stale answers are not served
+PROMPT_VERSION = os.getenv('PROMPT_VERSION', '1')
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the answer to a how-to question."""
+    return _WHITESPACE_RE.sub(" ", message).strip().rstrip("?!.").strip().lower()
+
+
+def context_fingerprint(history: Sequence[ModelMessage], last: int = RESPONSE_CACHE_CONTEXT_MESSAGES) -> str:
+    """Hash of the user prompts and text answers of the last messages of a conversation."""
+    digest = hashlib.sha256()
+    for message in history[-last:] if last else ():
+        for part in message.parts:
+            if isinstance(message, ModelRequest) and isinstance(part, UserPromptPart) and isinstance(part.content, str):
+                digest.update(b"U" + normalize_message(part.content).encode("utf-8"))
+            elif isinstance(message, ModelResponse) and isinstance(part, TextPart):
+                digest.update(b"A" + part.content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache(TTLCache):
+    """Cache of final /chat answers keyed on the normalized message, recent context and model/prompt version."""
+
+    def __init__(self, version: str, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 enabled: bool = RESPONSE_CACHE_ENABLED):
+        super().__init__(max_entries, ttl)
+        self.version = version
+        self.enabled = enabled
+
+    def key(self, message: str, history: Sequence[ModelMessage]) -> str:
+        raw = "\x1f".join((self.version, normalize_message(message), context_fingerprint(history)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def calls_tool(messages: Sequence[ModelMessage], *names: str) -> bool:
+    """Whether the model called one of the tools `names` in `messages`."""
+    return any(isinstance(message, ModelResponse) and isinstance(part, ToolCallPart) and part.tool_name in names
+               for message in messages for part in message.parts)
+
+
+def cache_bypassed(headers) -> bool:
+    """Clients skip the cache with `X-Cache-Bypass: 1` or `Cache-Control: no-cache`."""
+    if headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes"):
+        return True
+    return "no-cache" in headers.get("cache-control", "").lower()
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import functools
+import threading
+from typing import Any
+
+from pydantic_ai.tools import Tool
+
+from src.utils.response_cache import normalize_message
+
+SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SEARCH_CACHE_PATH = os.getenv('SEARCH_CACHE_PATH', os.path.join('.cache', 'search_cache.sqlite3'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', str(6 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '5000'))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    key TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    query TEXT NOT NULL,
+    results TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    latency REAL NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_accessed ON searches (accessed);
+"""
+
+
+def search_key(engine: str, query: str, options: dict[str, Any] | None = None) -> str:
+    """Cache key from the engine, the normalized query and any other search options."""
+    raw = json.dumps([engine, normalize_message(query), options or {}], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """Web search results in SQLite, shared by every agent run and kept across restarts.
+
+    Entries expire after `ttl` seconds; past `max_entries` or `max_bytes` the least recently
+    used ones are deleted.
+    """
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES, max_bytes: int = SEARCH_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # upstream time the hits would have cost, measured when the entries were stored
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT results, latency, expires FROM searches WHERE key = ?", (key,)).fetchone()
+            if row is None or row[2] < now:
+                if row is not None:
+                    connection.execute("DELETE FROM searches WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            connection.execute("UPDATE searches SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            self.saved_seconds += row[1]
+        return json.loads(row[0])
+
+    def put(self, key: str, engine: str, query: str, results, latency: float, ttl: float | None = None):
+        data = json.dumps(results, default=str)
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO searches (key, engine, query, results, size, latency, expires, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, engine, query, data, len(data), latency, expires, now),
+            )
+            self._evict(connection, now)
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        connection.execute("DELETE FROM searches WHERE expires < ?", (now,))
+        count, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM searches").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        removed_count = removed_size = 0
+        doomed = []
+        for key, entry_size in connection.execute("SELECT key, size FROM searches ORDER BY accessed"):
+            if count - removed_count <= self.max_entries and size - removed_size <= self.max_bytes:
+                break
+            doomed.append((key,))
+            removed_count += 1
+            removed_size += entry_size
+        connection.executemany("DELETE FROM searches WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM searches")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            count, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM searches").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+search_cache = SearchCache()
+
+
+def cached_search_tool(tool: Tool, engine: str, cache: SearchCache = search_cache) -> Tool:
+    """Wrap a search tool so identical queries to the same engine are answered from `cache`.
+
+    The wrapped tool keeps the name, description and parameters the model sees.
+    """
+    search = tool.function
+
+    @functools.wraps(search)
+    async def cached_search(query: str, **options):
+        key = search_key(engine, query, options)
+        results = await asyncio.to_thread(cache.get, key)
+        if results is not None:
+            return results
+        started = time.perf_counter()
+        results = await search(query, **options)
+        latency = time.perf_counter() - started
+        # an empty answer is often a throttled engine, try again next time
+        if results:
+            await asyncio.to_thread(cache.put, key, engine, query, results, latency)
+        return results
+
+    return Tool(cached_search, name=tool.name, description=tool.description)
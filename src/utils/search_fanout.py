@@ -0,0 +1,133 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Mapping
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Seconds one engine gets to answer one query before its results are left out
+SEARCH_TIMEOUT = float(os.getenv('SEARCH_TIMEOUT', '10'))
+SEARCH_MAX_QUERIES = int(os.getenv('SEARCH_MAX_QUERIES', '6'))
+FANOUT_MAX_RESULTS = int(os.getenv('FANOUT_MAX_RESULTS', '20'))
+# Results whose text shares at least this fraction of word 3-grams are treated as the same page
+NEAR_DUPLICATE_SIMILARITY = 0.8
+# Reciprocal rank fusion constant: higher values flatten the advantage of top ranks
+RRF_K = 60
+
+SearchEngine = Callable[[str], Awaitable[list[dict]]]
+
+logger = logging.getLogger(__name__)
+
+fanout_stats = {"searches": 0, "calls": 0, "timeouts": 0, "errors": 0, "duplicates_removed": 0}
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|ref|ref_src)$")
+_WORD_RE = re.compile(r"\w+")
+
+
+def canonical_url(url: str) -> str:
+    """Lowercased host without www, no fragment, tracking parameters or trailing slash."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if not _TRACKING_PARAMS.match(k)))
+    path = parts.path.rstrip("/") or ""
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme, host, path, query, ""))
+
+
+def normalize_result(result: Mapping[str, Any], engine: str) -> dict | None:
+    """Common shape for Tavily ({title, url, content}) and DuckDuckGo ({title, href, body}) results."""
+    url = result.get("url") or result.get("href")
+    if not url:
+        return None
+    return {
+        "title": result.get("title") or "",
+        "url": url,
+        "content": result.get("content") or result.get("body") or "",
+        "engines": [engine],
+    }
+
+
+def shingles(text: str, size: int = 3) -> frozenset:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return frozenset([" ".join(words)]) if words else frozenset()
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def merge_results(ranked_lists: list[list[dict]], limit: int | None = FANOUT_MAX_RESULTS,
+                  threshold: float = NEAR_DUPLICATE_SIMILARITY) -> list[dict]:
+    """Fuse per-(query, engine) result lists with reciprocal rank fusion, merging duplicate pages.
+
+    Duplicates are the same canonical URL or near-identical text (mirrors, syndicated articles);
+    their scores add up, so pages several engines or queries agree on rank first.
+    """
+    merged: list[dict] = []
+    by_url: dict[str, dict] = {}
+    for results in ranked_lists:
+        for rank, result in enumerate(results):
+            score = 1.0 / (RRF_K + rank + 1)
+            key = canonical_url(result["url"])
+            entry = by_url.get(key)
+            if entry is None:
+                fingerprint = shingles(result["content"])
+                entry = next((e for e in merged if similarity(e["_shingles"], fingerprint) >= threshold), None)
+                if entry is None:
+                    entry = {**result, "engines": list(result["engines"]), "score": 0.0, "_shingles": fingerprint}
+                    merged.append(entry)
+                by_url[key] = entry
+            entry["score"] += score
+            for engine in result["engines"]:
+                if engine not in entry["engines"]:
+                    entry["engines"].append(engine)
+            if len(result["content"]) > len(entry["content"]):
+                entry["content"] = result["content"]
+    merged.sort(key=lambda entry: entry["score"], reverse=True)
+    return [{k: v for k, v in entry.items() if k != "_shingles"} | {"score": round(entry["score"], 5)} for entry in merged[:limit]]
+
+
+class FanOutSearch:
+    """Runs every query against every engine concurrently and returns one merged, ranked list."""
+
+    def __init__(self, engines: Mapping[str, SearchEngine], timeout: float = SEARCH_TIMEOUT,
+                 max_queries: int = SEARCH_MAX_QUERIES, max_results: int = FANOUT_MAX_RESULTS, stats: dict | None = None):
+        self.engines = dict(engines)
+        self.timeout = timeout
+        self.max_queries = max_queries
+        self.max_results = max_results
+        self.stats = fanout_stats if stats is None else stats
+
+    async def _call(self, engine: str, query: str) -> list[dict]:
+        search = self.engines[engine]
+        try:
+            results = await asyncio.wait_for(search(query), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning("Search engine %s timed out for %r", engine, query)
+            return []
+        except Exception:
+            self.stats["errors"] += 1
+            logger.exception("Search engine %s failed for %r", engine, query)
+            return []
+        return [r for r in (normalize_result(result, engine) for result in results or []) if r]
+
+    async def search(self, queries: list[str]) -> dict[str, Any]:
+        queries = list(dict.fromkeys(q.strip() for q in queries if q.strip()))[:self.max_queries]
+        pairs = [(engine, query) for query in queries for engine in self.engines]
+        started = time.perf_counter()
+        ranked_lists = await asyncio.gather(*(self._call(engine, query) for engine, query in pairs))
+        self.stats["searches"] += 1
+        self.stats["calls"] += len(pairs)
+        merged = merge_results(ranked_lists, limit=None)
+        self.stats["duplicates_removed"] += sum(len(r) for r in ranked_lists) - len(merged)
+        return {
+            "queries": queries,
+            "engines": list(self.engines),
+            "results": merged[:self.max_results],
+            "seconds": round(time.perf_counter() - started, 3),
+        }
@@ -0,0 +1,261 @@
+import os
+import time
+import uuid
+import zlib
+import asyncio
+import logging
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps sessions in the worker process; "sqlite" shares them between workers and restarts.
+# Only conversations are shared: uploaded tables, blocks and excel workbooks stay in the worker that
+# created them, so with several workers each user must be routed to the same worker (sticky by user id).
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', os.path.join('.cache', 'sessions.sqlite3'))
+# Sessions untouched for this long are deleted
+SESSION_IDLE_SECONDS = float(os.getenv('SESSION_IDLE_SECONDS', str(24 * 3600)))
+# How long a request waits for another request of the same user to finish
+SESSION_LOCK_WAIT = float(os.getenv('SESSION_LOCK_WAIT', '120'))
+# A lock not renewed for this long (e.g. held by a crashed worker) is taken over; live holders renew it
+SESSION_LOCK_LEASE = float(os.getenv('SESSION_LOCK_LEASE', '600'))
+
+
+class SessionLockTimeout(TimeoutError):
+    """Raised when a session stays locked by another request for longer than SESSION_LOCK_WAIT."""
+
+
+@dataclass
+class ConversationState:
+    summary: str | None = None
+    messages: list[ModelMessage] = field(default_factory=list)
+
+
+def serialize_messages(messages: list[ModelMessage]) -> bytes:
+    return zlib.compress(ModelMessagesTypeAdapter.dump_json(messages), 6)
+
+
+def deserialize_messages(data: bytes) -> list[ModelMessage]:
+    return ModelMessagesTypeAdapter.validate_json(zlib.decompress(data))
+
+
+class SessionStore:
+    """Where conversation state lives. Callers hold `lock(user_id)` around load/modify/save."""
+
+    async def load(self, user_id: str) -> ConversationState | None:
+        raise NotImplementedError
+
+    async def save(self, user_id: str, state: ConversationState):
+        raise NotImplementedError
+
+    async def delete(self, user_id: str):
+        raise NotImplementedError
+
+    async def expire(self, idle_seconds: float = SESSION_IDLE_SECONDS) -> int:
+        """Delete sessions idle for longer than `idle_seconds`; returns how many were removed."""
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    def lock(self, user_id: str):
+        raise NotImplementedError
+
+
+class _LocalLocks:
+    """One asyncio lock per user, so requests of a user in this process run one after the other."""
+
+    def __init__(self):
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def get(self, user_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(user_id, asyncio.Lock())
+
+    def discard(self, user_ids):
+        for user_id in user_ids:
+            lock = self._locks.get(user_id)
+            if lock is not None and not lock.locked():
+                del self._locks[user_id]
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in this process only; lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self._sessions: dict[str, tuple[ConversationState, float]] = {}
+        self._locks = _LocalLocks()
+
+    async def load(self, user_id: str) -> ConversationState | None:
+        entry = self._sessions.get(user_id)
+        return entry[0] if entry else None
+
+    async def save(self, user_id: str, state: ConversationState):
+        self._sessions[user_id] = (state, time.time())
+
+    async def delete(self, user_id: str):
+        self._sessions.pop(user_id, None)
+
+    async def expire(self, idle_seconds: float = SESSION_IDLE_SECONDS) -> int:
+        cutoff = time.time() - idle_seconds
+        idle = [user_id for user_id, (_, touched) in self._sessions.items() if touched < cutoff]
+        for user_id in idle:
+            del self._sessions[user_id]
+        self._locks.discard(idle)
+        return len(idle)
+
+    async def count(self) -> int:
+        return len(self._sessions)
+
+    @asynccontextmanager
+    async def lock(self, user_id: str):
+        lock = self._locks.get(user_id)
+        try:
+            await asyncio.wait_for(lock.acquire(), SESSION_LOCK_WAIT)
+        except asyncio.TimeoutError:
+            raise SessionLockTimeout(f"Session {user_id} is busy")
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT PRIMARY KEY,
+    summary TEXT,
+    messages BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+CREATE TABLE IF NOT EXISTS session_locks (
+    user_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite database in WAL mode, shared by every worker process on the host.
+
+    Per-user locks are leases in the same database, renewed while the request runs, so a long
+    request keeps its lock and a crashed worker cannot block a user forever.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, lock_wait: float = SESSION_LOCK_WAIT, lock_lease: float = SESSION_LOCK_LEASE):
+        self.path = path
+        self.lock_wait = lock_wait
+        self.lock_lease = lock_lease
+        self._connection = None
+        self._db_lock = threading.Lock()
+        self._locks = _LocalLocks()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql: str, parameters=()) -> list:
+        with self._db_lock:
+            return self._connect().execute(sql, parameters).fetchall()
+
+    async def load(self, user_id: str) -> ConversationState | None:
+        rows = await asyncio.to_thread(self._execute, "SELECT summary, messages FROM sessions WHERE user_id = ?", (user_id,))
+        if not rows:
+            return None
+        summary, messages = rows[0]
+        return ConversationState(summary=summary, messages=deserialize_messages(messages))
+
+    async def save(self, user_id: str, state: ConversationState):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO sessions (user_id, summary, messages, updated) VALUES (?, ?, ?, ?)",
+            (user_id, state.summary, serialize_messages(state.messages), time.time()),
+        )
+
+    async def delete(self, user_id: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    async def expire(self, idle_seconds: float = SESSION_IDLE_SECONDS) -> int:
+        cutoff = time.time() - idle_seconds
+        idle = await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE updated < ? RETURNING user_id", (cutoff,))
+        await asyncio.to_thread(self._execute, "DELETE FROM session_locks WHERE expires < ?", (time.time(),))
+        self._locks.discard([user_id for (user_id,) in idle])
+        return len(idle)
+
+    async def count(self) -> int:
+        (count,), = await asyncio.to_thread(self._execute, "SELECT COUNT(*) FROM sessions")
+        return count
+
+    def _try_lock(self, user_id: str, owner: str) -> bool:
+        now = time.time()
+        with self._db_lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT INTO session_locks (user_id, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE session_locks.expires < ?",
+                (user_id, owner, now + self.lock_lease, now),
+            )
+            row = connection.execute("SELECT owner FROM session_locks WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None and row[0] == owner
+
+    async def _keep_lease(self, user_id: str, owner: str):
+        """Extend the lease while its holder runs; stops (with a warning) if it was lost anyway."""
+        while True:
+            await asyncio.sleep(self.lock_lease / 3)
+            renewed = await asyncio.to_thread(
+                self._execute,
+                "UPDATE session_locks SET expires = ? WHERE user_id = ? AND owner = ? RETURNING owner",
+                (time.time() + self.lock_lease, user_id, owner),
+            )
+            if not renewed:
+                logger.warning("Session lock of %s expired while held; requests may interleave", user_id)
+                return
+
+    @asynccontextmanager
+    async def lock(self, user_id: str):
+        deadline = time.monotonic() + self.lock_wait
+        local = self._locks.get(user_id)
+        try:
+            await asyncio.wait_for(local.acquire(), self.lock_wait)
+        except asyncio.TimeoutError:
+            raise SessionLockTimeout(f"Session {user_id} is busy")
+        try:
+            owner = uuid.uuid4().hex
+            try:
+                while not await asyncio.to_thread(self._try_lock, user_id, owner):
+                    if time.monotonic() > deadline:
+                        raise SessionLockTimeout(f"Session {user_id} is busy in another worker")
+                    await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                # the lease may have been taken just before the cancellation arrived
+                self._execute("DELETE FROM session_locks WHERE user_id = ? AND owner = ?", (user_id, owner))
+                raise
+            renewal = asyncio.create_task(self._keep_lease(user_id, owner))
+            try:
+                yield
+            finally:
+                renewal.cancel()
+                await asyncio.to_thread(self._execute, "DELETE FROM session_locks WHERE user_id = ? AND owner = ?", (user_id, owner))
+        finally:
+            local.release()
+
+
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE {kind!r}, use 'memory' or 'sqlite'")
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable
+
+from pydantic_ai.tools import Tool
+
+from src.utils.search_cache import search_key
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one in-flight call instead of each making their own.
+
+    Unlike a cache nothing is kept once the call finishes: only requests that overlap in time
+    are merged, so it also removes duplicates while the caches are cold.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[str, _Flight] = {}
+        self._leaders: dict[str, asyncio.Future] = {}
+        self.stats = {"calls": 0, "saved_calls": 0, "in_flight": 0}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `call()`, shared with every caller that asks for `key` while it runs.
+
+        The call runs in its own task, so one caller going away does not cancel it for the
+        others; it is only cancelled once nobody is waiting for it any more.
+        """
+        self.stats["calls"] += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(call()))
+            self.stats["in_flight"] += 1
+            flight.task.add_done_callback(functools.partial(self._landed, key, flight))
+        else:
+            self.stats["saved_calls"] += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _landed(self, key: str, flight: _Flight, task: asyncio.Task):
+        self.stats["in_flight"] -= 1
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not task.cancelled():
+            # retrieved by the waiters, if any are left
+            task.exception()
+
+    @contextmanager
+    def leading(self, key: str):
+        """For calls the leader has to run itself (to stream it): register `key` and yield a `publish(result)`.
+
+        Callers that find the key with `follower` wait for what the leader publishes. If the block
+        ends without publishing (error, client gone) they are told to run the call themselves.
+        """
+        self.stats["calls"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._leaders[key] = future
+        self.stats["in_flight"] += 1
+        try:
+            yield future.set_result
+        finally:
+            self.stats["in_flight"] -= 1
+            if self._leaders.get(key) is future:
+                del self._leaders[key]
+            if not future.done():
+                future.cancel()
+
+    def follower(self, key: str) -> asyncio.Future | None:
+        """The future of the leader currently running `key`, if any."""
+        future = self._leaders.get(key)
+        if future is not None:
+            self.stats["calls"] += 1
+            self.stats["saved_calls"] += 1
+        return future
+
+
+single_flights: dict[str, SingleFlight] = {}
+
+
+def single_flight(name: str) -> SingleFlight:
+    """The process-wide SingleFlight group called `name`."""
+    if name not in single_flights:
+        single_flights[name] = SingleFlight(name)
+    return single_flights[name]
+
+
+def single_flight_stats() -> dict[str, dict[str, int]]:
+    return {name: dict(group.stats) for name, group in single_flights.items()}
+
+
+def coalesced_search_tool(tool: Tool, engine: str) -> Tool:
+    """Wrap a search tool so identical concurrent queries to the same engine make one upstream call.
+
+    The wrapped tool keeps the name, description and parameters the model sees.
+    """
+    search = tool.function
+    group = single_flight(f"search:{engine}")
+
+    @functools.wraps(search)
+    async def coalesced_search(query: str, **options):
+        return await group.do(search_key(engine, query, options), lambda: search(query, **options))
+
+    return Tool(coalesced_search, name=tool.name, description=tool.description)
@@ -0,0 +1,91 @@
+import json
+import asyncio
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable
+
+from pydantic_ai.messages import FunctionToolCallEvent, PartDeltaEvent, PartStartEvent, TextPart, TextPartDelta
+from pydantic_ai.run import AgentRunResultEvent
+
+# Where tools report what they are doing; set while a run is being streamed
+_progress: ContextVar[Callable[[tuple[str, Any]], None] | None] = ContextVar("progress", default=None)
+
+_DONE = object()
+
+
+def emit_event(kind: str, data: Any):
+    """Send a (kind, data) event to the client streaming this run (no-op when nobody is streaming).
+
+    Works from tools of nested agents too, since they run in the context of the outer run.
+    """
+    report = _progress.get()
+    if report is not None:
+        report((kind, data))
+
+
+def emit_progress(stage: str, **detail):
+    """Tell the client streaming this run what is happening, as a "status" event."""
+    emit_event("status", {"stage": stage, **detail})
+
+
+def _translate(event) -> tuple[str, Any] | None:
+    if isinstance(event, PartStartEvent) and isinstance(event.part, TextPart) and event.part.content:
+        return "token", event.part.content
+    if isinstance(event, PartDeltaEvent) and isinstance(event.delta, TextPartDelta) and event.delta.content_delta:
+        return "token", event.delta.content_delta
+    if isinstance(event, FunctionToolCallEvent):
+        return "tool", {"name": event.part.tool_name}
+    if isinstance(event, AgentRunResultEvent):
+        return "result", event.result
+    return None
+
+
+async def stream_run(agent, prompt: str, **run_kwargs) -> AsyncIterator[tuple[str, Any]]:
+    """Run `agent` and yield ("token", text), ("tool", {...}), ("status", {...}) and other events its tools emit,
+    and finally ("result", AgentRunResult).
+
+    Closing the iterator early (client gone) cancels the run.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async with agent.run_stream_events(prompt, **run_kwargs) as stream:
+                async for event in stream:
+                    item = _translate(event)
+                    if item is not None:
+                        queue.put_nowait(item)
+        except BaseException as e:
+            queue.put_nowait(("error", e))
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            queue.put_nowait(_DONE)
+
+    token = _progress.set(queue.put_nowait)
+    try:
+        # the task copies the current context, so tools see the progress reporter
+        task = asyncio.get_running_loop().create_task(pump())
+    finally:
+        _progress.reset(token)
+    try:
+        while (item := await queue.get()) is not _DONE:
+            if item[0] == "error":
+                raise item[1]
+            yield item
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def final_result(events: AsyncIterator[tuple[str, Any]]):
+    """Drain an event stream and return the data of its "result" event."""
+    result = None
+    async for kind, data in events:
+        if kind == "result":
+            result = data
+    return result
+
+
+def sse_event(kind: str, data: Any) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
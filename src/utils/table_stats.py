@@ -0,0 +1,257 @@
+import os
+import math
+from typing import Any, Iterable, Mapping
+
+import numpy as np
+
+# Number of grouped/pivoted rows sent back to the model before the result is truncated
+MAX_RESULT_ROWS = int(os.getenv('MAX_RESULT_ROWS', '200'))
+
+AGGREGATIONS = ("sum", "mean", "count", "min", "max", "median", "std")
+
+
+class TableError(ValueError):
+    """Raised for malformed tables or unknown columns/aggregations."""
+
+
+def column_array(values) -> np.ndarray:
+    """Float array (NaN for blanks) when every non-blank value is a number, object array (None for blanks) otherwise."""
+    if isinstance(values, np.ndarray) and values.dtype.kind in "iuf":
+        return values.astype(float, copy=False)
+    array = np.asarray(values)
+    if array.dtype.kind in "iuf":
+        return array.astype(float)
+    numeric = True
+    cleaned = []
+    for value in values:
+        if value is None or value == "" or (isinstance(value, float) and math.isnan(value)):
+            cleaned.append(None)
+        else:
+            numeric = numeric and isinstance(value, (int, float)) and not isinstance(value, bool)
+            cleaned.append(value)
+    if numeric:
+        return np.array([np.nan if v is None else v for v in cleaned], dtype=float)
+    result = np.empty(len(cleaned), dtype=object)
+    result[:] = cleaned
+    return result
+
+
+class Table:
+    """Named, equal-length columns. Numeric columns are float arrays with NaN for blank cells."""
+
+    def __init__(self, columns: Mapping[str, Any]):
+        self.columns = {str(name): column_array(values) for name, values in columns.items()}
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise TableError(f"All columns must have the same length, got {sorted(lengths)}")
+        self.rows = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_rows(cls, rows: list[list], header: bool = True) -> "Table":
+        """Build a table from a 2D range, using the first row as column names when `header` is set."""
+        if not rows:
+            return cls({})
+        if header:
+            names, rows = [str(name) for name in rows[0]], rows[1:]
+        else:
+            names = [f"Column{i + 1}" for i in range(len(rows[0]))]
+        width = len(names)
+        if any(len(row) != width for row in rows):
+            raise TableError("Every row must have the same number of cells as the header")
+        return cls({name: [row[i] for row in rows] for i, name in enumerate(names)})
+
+    def column(self, name: str) -> np.ndarray:
+        try:
+            return self.columns[name]
+        except KeyError:
+            # be forgiving about case, the model often changes it
+            for key, values in self.columns.items():
+                if key.lower() == str(name).lower():
+                    return values
+            raise TableError(f"Unknown column {name!r}; available columns: {list(self.columns)}")
+
+    def is_numeric(self, name: str) -> bool:
+        return self.column(name).dtype.kind == "f"
+
+
+def _json_number(value):
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+def describe(table: Table, columns: Iterable[str] | None = None) -> dict[str, dict[str, Any]]:
+    """Summary statistics per column (numeric: count/sum/mean/std/quantiles, text: count/unique/top)."""
+    summary = {}
+    for name in columns or table.columns:
+        values = table.column(name)
+        if values.dtype.kind == "f":
+            present = values[~np.isnan(values)]
+            stats = {"count": int(len(present)), "blank": int(table.rows - len(present))}
+            if len(present):
+                q25, q50, q75 = np.percentile(present, [25, 50, 75])
+                stats.update({
+                    "sum": _json_number(present.sum()),
+                    "mean": _json_number(present.mean()),
+                    "std": _json_number(present.std(ddof=1)) if len(present) > 1 else None,
+                    "min": _json_number(present.min()),
+                    "p25": _json_number(q25),
+                    "median": _json_number(q50),
+                    "p75": _json_number(q75),
+                    "max": _json_number(present.max()),
+                })
+        else:
+            present = [v for v in values if v is not None]
+            counts = {}
+            for value in present:
+                counts[value] = counts.get(value, 0) + 1
+            stats = {"count": len(present), "blank": table.rows - len(present), "unique": len(counts)}
+            if counts:
+                top = max(counts, key=counts.get)
+                stats.update({"top": top, "top_count": counts[top]})
+        summary[name] = stats
+    return summary
+
+
+def _label_order(value):
+    # numbers first, then text (case-insensitive), then TRUE/FALSE, blanks last
+    if value is None:
+        return (3, 0)
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, str):
+        return (1, value.lower())
+    if isinstance(value, (int, float)):
+        return (0, float(value))
+    return (1, str(value).lower())
+
+
+def _group_key(value):
+    # True == 1 in Python, but TRUE and 1 are different cells; 1 and 1.0 are the same number
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, (int, float)):
+        return ("number", value)
+    return (type(value).__name__, value)
+
+
+def factorize(values: np.ndarray) -> tuple[np.ndarray, list]:
+    """Integer codes per row and the distinct values, in sorted order (blanks last)."""
+    if values.dtype.kind == "f":
+        uniques, codes = np.unique(values, return_inverse=True)
+        return codes.reshape(-1), [None if math.isnan(v) else v for v in uniques.tolist()]
+    seen = {}
+    first = []
+    raw = np.empty(len(values), dtype=np.int64)
+    for i, value in enumerate(values):
+        key = _group_key(value)
+        code = seen.get(key)
+        if code is None:
+            code = seen[key] = len(first)
+            first.append(value)
+        raw[i] = code
+    # renumber so codes follow the sort order of the labels
+    order = sorted(range(len(first)), key=lambda code: _label_order(first[code]))
+    remap = np.empty(len(order), dtype=np.int64)
+    for new, code in enumerate(order):
+        remap[code] = new
+    return remap[raw] if len(raw) else raw, [first[code] for code in order]
+
+
+def _group_codes(table: Table, keys: list[str]) -> tuple[np.ndarray, list[tuple]]:
+    """Combine several key columns into one group code per row, and the key tuple of every group."""
+    if not keys:
+        return np.zeros(table.rows, dtype=np.int64), [()]
+    combined = np.zeros(table.rows, dtype=np.int64)
+    labels = []
+    for key in keys:
+        codes, uniques = factorize(table.column(key))
+        combined = combined * len(uniques) + codes
+        labels.append(uniques)
+    group_ids, codes = np.unique(combined, return_inverse=True)
+    codes = codes.reshape(-1)
+    groups = []
+    for group_id in group_ids.tolist():
+        parts = []
+        for uniques in reversed(labels):
+            group_id, index = divmod(group_id, len(uniques))
+            parts.append(uniques[index])
+        groups.append(tuple(reversed(parts)))
+    return codes, groups
+
+
+def aggregate(values: np.ndarray, codes: np.ndarray, groups: int, how: str) -> list:
+    """Aggregate `values` per group code with NumPy; blanks are ignored, empty groups give None."""
+    if how not in AGGREGATIONS:
+        raise TableError(f"Unknown aggregation {how!r}; choose from {AGGREGATIONS}")
+    if values.dtype.kind != "f":
+        if how != "count":
+            raise TableError(f"Aggregation {how!r} needs a numeric column")
+        present = np.array([v is not None for v in values], dtype=bool)
+        return np.bincount(codes[present], minlength=groups).astype(float).tolist()
+
+    present = ~np.isnan(values)
+    counts = np.bincount(codes[present], minlength=groups).astype(float)
+    if how == "count":
+        return counts.tolist()
+    filled = np.where(present, values, 0.0)
+    sums = np.bincount(codes, weights=filled, minlength=groups)
+    if how == "sum":
+        return sums.tolist()
+    empty = counts == 0
+    with np.errstate(all="ignore"):
+        if how == "mean":
+            result = sums / counts
+        elif how == "std":
+            # two passes: squares of deviations from the group mean, not Σx² − (Σx)²/n, which cancels
+            # to nothing for large values with small spread
+            means = sums / counts
+            deviations = np.where(present, values - means[codes], 0.0)
+            squares = np.bincount(codes, weights=deviations * deviations, minlength=groups)
+            result = np.sqrt(squares / (counts - 1))
+            empty = counts < 2
+        elif how in ("min", "max"):
+            result = np.full(groups, np.inf if how == "min" else -np.inf)
+            ufunc = np.minimum if how == "min" else np.maximum
+            ufunc.at(result, codes[present], values[present])
+        else:
+            order = np.lexsort((values, codes))
+            ordered_codes, ordered_values = codes[order], values[order]
+            keep = ~np.isnan(ordered_values)
+            ordered_codes, ordered_values = ordered_codes[keep], ordered_values[keep]
+            starts = np.searchsorted(ordered_codes, np.arange(groups))
+            result = np.full(groups, np.nan)
+            for group in np.flatnonzero(~empty):
+                size = int(counts[group])
+                segment = ordered_values[starts[group]:starts[group] + size]
+                result[group] = (segment[(size - 1) // 2] + segment[size // 2]) / 2
+    return [None if missing else _json_number(value) for missing, value in zip(empty.tolist(), result.tolist())]
+
+
+def group_by(table: Table, keys: list[str], aggregations: Mapping[str, list[str]], limit: int = MAX_RESULT_ROWS) -> dict[str, Any]:
+    """Group rows by `keys` and aggregate columns, e.g. {"Sales": ["sum", "mean"]}."""
+    codes, groups = _group_codes(table, list(keys))
+    header = list(keys)
+    results = []
+    for column, functions in aggregations.items():
+        values = table.column(column)
+        for how in functions:
+            header.append(f"{how}({column})")
+            results.append(aggregate(values, codes, len(groups), how))
+    rows = [list(group) + [result[i] for result in results] for i, group in enumerate(groups)]
+    return {"columns": header, "rows": rows[:limit], "total_groups": len(groups), "truncated": len(rows) > limit}
+
+
+def pivot(table: Table, index: str, columns: str, values: str, how: str = "sum", limit: int = MAX_RESULT_ROWS) -> dict[str, Any]:
+    """Pivot table: one row per `index` value, one column per `columns` value, cells aggregated from `values`."""
+    row_codes, row_labels = factorize(table.column(index))
+    col_codes, col_labels = factorize(table.column(columns))
+    width = len(col_labels)
+    codes, size = row_codes * width + col_codes, len(row_labels) * width
+    cells = aggregate(table.column(values), codes, size, how)
+    if how in ("count", "sum"):
+        # no values for a combination (no rows, or only blanks) means an empty cell, not zero
+        counts = aggregate(table.column(values), codes, size, "count")
+        cells = [cell if count else None for cell, count in zip(cells, counts)]
+    rows = [[label] + cells[i * width:(i + 1) * width] for i, label in enumerate(row_labels)]
+    header = [index] + col_labels
+    return {"columns": header, "rows": rows[:limit], "total_groups": len(rows), "truncated": len(rows) > limit}
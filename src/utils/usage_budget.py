@@ -0,0 +1,138 @@
+import os
+import json
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from pydantic_ai.exceptions import UsageLimitExceeded
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.usage import RequestUsage
+
+# Budget of one chat request (or one batch row) per tier, across every agent it runs:
+# {"tier": {"request_limit": ..., "input_tokens_limit": ..., "output_tokens_limit": ..., "total_tokens_limit": ...}}
+USAGE_BUDGETS = json.loads(os.getenv('USAGE_BUDGETS', '{"default": {"request_limit": 60, "total_tokens_limit": 400000}}'))
+# Tier of each user id; users not listed get "default"
+USAGE_USER_TIERS = json.loads(os.getenv('USAGE_USER_TIERS', '{}'))
+
+# Meter of the request being answered; set around it, read by MeteredModel on every model call
+_meter: ContextVar["UsageMeter | None"] = ContextVar("usage_meter", default=None)
+
+usage_totals: dict[str, dict[str, int]] = {}
+
+
+@dataclass
+class UsageBudget:
+    request_limit: int | None = None
+    input_tokens_limit: int | None = None
+    output_tokens_limit: int | None = None
+    total_tokens_limit: int | None = None
+
+
+def budget_for(tier: str) -> UsageBudget | None:
+    limits = USAGE_BUDGETS.get(tier, USAGE_BUDGETS.get("default"))
+    return UsageBudget(**limits) if limits else None
+
+
+def tier_for(user_id: str) -> str:
+    return USAGE_USER_TIERS.get(user_id, "default")
+
+
+class UsageMeter:
+    """Model requests and tokens of one chat request, summed over all the agents it runs."""
+
+    def __init__(self, tier: str = "default", budget: UsageBudget | None = None):
+        self.tier = tier
+        self.budget = budget
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.models: dict[str, int] = {}
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def before_request(self):
+        """Refuse a model request once the request limit is reached."""
+        limit = self.budget and self.budget.request_limit
+        if limit is not None and self.requests >= limit:
+            self._exceeded(f"The next request would exceed the request_limit of {limit} for tier {self.tier!r}")
+        self.requests += 1
+
+    def record(self, model_name: str, usage: RequestUsage):
+        """Add the tokens of a finished model request, failing the run once a token limit is passed."""
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.models[model_name] = self.models.get(model_name, 0) + 1
+        if self.budget is None:
+            return
+        for name, used in (("input_tokens_limit", self.input_tokens), ("output_tokens_limit", self.output_tokens),
+                           ("total_tokens_limit", self.total_tokens)):
+            limit = getattr(self.budget, name)
+            if limit is not None and used > limit:
+                self._exceeded(f"Exceeded the {name} of {limit} ({name.removesuffix('_limit')}={used}) for tier {self.tier!r}")
+
+    def _exceeded(self, message: str):
+        totals = usage_totals.setdefault(self.tier, _empty_totals())
+        totals["budget_exceeded"] += 1
+        raise UsageLimitExceeded(message)
+
+    def report(self) -> dict[str, Any]:
+        return {"requests": self.requests, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens,
+                "total_tokens": self.total_tokens}
+
+
+def _empty_totals() -> dict[str, int]:
+    return {"chat_requests": 0, "model_requests": 0, "input_tokens": 0, "output_tokens": 0, "budget_exceeded": 0}
+
+
+def current_meter() -> UsageMeter | None:
+    return _meter.get()
+
+
+@contextmanager
+def metered(user_id: str = "0", tier: str | None = None):
+    """Meter (and budget) the model calls made inside this block, including nested agents and tasks it starts."""
+    tier = tier or tier_for(user_id)
+    meter = UsageMeter(tier, budget_for(tier))
+    token = _meter.set(meter)
+    try:
+        yield meter
+    finally:
+        try:
+            _meter.reset(token)
+        except ValueError:
+            # an async generator closed from another context; that context never saw the meter
+            pass
+        totals = usage_totals.setdefault(tier, _empty_totals())
+        totals["chat_requests"] += 1
+        totals["model_requests"] += meter.requests
+        totals["input_tokens"] += meter.input_tokens
+        totals["output_tokens"] += meter.output_tokens
+
+
+class MeteredModel(WrapperModel):
+    """Counts every request and its tokens against the current meter, if any.
+
+    Wraps the outermost model, so a hedged call counts once, with the tokens of the answer used.
+    """
+
+    async def request(self, *args, **kwargs):
+        meter = _meter.get()
+        if meter is not None:
+            meter.before_request()
+        response = await super().request(*args, **kwargs)
+        if meter is not None:
+            meter.record(response.model_name or self.model_name, response.usage)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, *args, **kwargs) -> AsyncIterator:
+        meter = _meter.get()
+        if meter is not None:
+            meter.before_request()
+        async with super().request_stream(*args, **kwargs) as response:
+            yield response
+        if meter is not None:
+            meter.record(response.model_name or self.model_name, response.usage)
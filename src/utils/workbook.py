@@ -0,0 +1,172 @@
+import threading
+from collections import deque
+from typing import Any, Iterable, Mapping
+
+from src.utils.formula_engine import (
+    CompiledFormula,
+    ERROR_CODES,
+    ExcelError,
+    compile_formula,
+    normalize_name,
+    to_output,
+)
+
+
+class CircularReferenceError(ValueError):
+    """Raised when a formula would make a cell depend on itself."""
+
+
+class Workbook:
+    """Cells, formulas and the dependency graph between them.
+
+    Changing a cell only recomputes the formulas downstream of it, in topological order.
+    Cells are addressed by A1-style reference or by any other name (e.g. "rate").
+    The public methods hold `lock`, so tools running on different threads can share a workbook;
+    hold it yourself to make several calls in a row atomic.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.values: dict[str, Any] = {}
+        self.formulas: dict[str, CompiledFormula] = {}
+        self.precedents: dict[str, frozenset[str]] = {}
+        self.dependents: dict[str, set[str]] = {}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.values.keys() | self.formulas.keys())
+
+    def get_cell(self, name: str):
+        with self.lock:
+            return self.values.get(normalize_name(name))
+
+    def get_formula(self, name: str) -> str | None:
+        with self.lock:
+            formula = self.formulas.get(normalize_name(name))
+        return f"={formula.formula.lstrip('=')}" if formula else None
+
+    def set_cell(self, name: str, content) -> list[str]:
+        return self.set_cells({name: content})
+
+    def set_cells(self, cells: Mapping[str, Any]) -> list[str]:
+        """Set values or formulas ("=..." strings) and return the cells that were recalculated."""
+        with self.lock:
+            changed = []
+            try:
+                for name, content in cells.items():
+                    name = normalize_name(name)
+                    if isinstance(content, str) and content.startswith("="):
+                        self._set_formula(name, compile_formula(content))
+                    else:
+                        self._clear_formula(name)
+                        if isinstance(content, str) and content in ERROR_CODES:
+                            content = ExcelError(content)
+                        self.values[name] = content
+                    changed.append(name)
+            finally:
+                # keep the workbook consistent with whatever was applied, even if a later cell failed
+                recalculated = self.recalculate(changed)
+            return recalculated
+
+    def _set_formula(self, name: str, formula: CompiledFormula):
+        references = formula.references
+        if name in references or self._reaches(name, references):
+            raise CircularReferenceError(f"Formula for {name} creates a circular reference")
+        self._clear_formula(name)
+        self.formulas[name] = formula
+        self.precedents[name] = references
+        for reference in references:
+            self.dependents.setdefault(reference, set()).add(name)
+
+    def _clear_formula(self, name: str):
+        if self.formulas.pop(name, None) is None:
+            return
+        for reference in self.precedents.pop(name, ()):
+            dependents = self.dependents.get(reference)
+            if dependents:
+                dependents.discard(name)
+                if not dependents:
+                    del self.dependents[reference]
+
+    def _reaches(self, start: str, targets: Iterable[str]) -> bool:
+        """Whether any of `targets` depends, directly or not, on `start`."""
+        targets = set(targets)
+        seen = {start}
+        stack = [start]
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                if dependent in targets:
+                    return True
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+        return False
+
+    def downstream(self, names: Iterable[str]) -> set[str]:
+        """All cells whose value depends on any of `names` (including formula cells in `names`)."""
+        with self.lock:
+            dirty = {name for name in names if name in self.formulas}
+            queue = deque(names)
+            seen = set(names)
+            while queue:
+                for dependent in self.dependents.get(queue.popleft(), ()):
+                    if dependent not in seen:
+                        seen.add(dependent)
+                        dirty.add(dependent)
+                        queue.append(dependent)
+            return dirty
+
+    def recalculate(self, changed: Iterable[str]) -> list[str]:
+        """Recompute the formulas downstream of `changed` in dependency order."""
+        with self.lock:
+            changed = [normalize_name(name) for name in changed]
+            dirty = self.downstream(changed)
+            pending = {name: sum(1 for p in self.precedents[name] if p in dirty) for name in dirty}
+            ready = deque(name for name, count in pending.items() if count == 0)
+            order = []
+            while ready:
+                name = ready.popleft()
+                self.values[name] = self.formulas[name].evaluate(self.values, normalized=True)
+                order.append(name)
+                for dependent in self.dependents.get(name, ()):
+                    if dependent in pending:
+                        pending[dependent] -= 1
+                        if pending[dependent] == 0:
+                            ready.append(dependent)
+            return order
+
+    def what_if(self, changes: Mapping[str, Any], targets: Iterable[str]) -> dict[str, tuple[Any, Any]]:
+        """Evaluate `targets` under temporary `changes` and restore the workbook afterwards.
+
+        Returns {target: (value before, value after)}; the cost is proportional to the cells affected.
+        """
+        with self.lock:
+            targets = [normalize_name(target) for target in targets]
+            before = {target: self.values.get(target) for target in targets}
+            names = [normalize_name(name) for name in changes]
+            saved_values = {name: self.values.get(name) for name in names}
+            saved_formulas = {name: self.formulas.get(name) for name in names}
+            affected = self.downstream(names)
+            saved_values.update({name: self.values.get(name) for name in affected})
+            try:
+                self.set_cells(changes)
+                after = {target: self.values.get(target) for target in targets}
+            finally:
+                for name in names:
+                    self._clear_formula(name)
+                for name, formula in saved_formulas.items():
+                    if formula is not None:
+                        self._set_formula(name, formula)
+                for name, value in saved_values.items():
+                    if value is None and name not in self.formulas:
+                        self.values.pop(name, None)
+                    else:
+                        self.values[name] = value
+            return {target: (before[target], after[target]) for target in targets}
+
+    def snapshot(self, names: Iterable[str] | None = None) -> dict[str, Any]:
+        """JSON-friendly values for `names` (or every cell)."""
+        with self.lock:
+            if names is None:
+                names = self.values.keys()
+            return {normalize_name(name): to_output(self.values.get(normalize_name(name))) for name in names}
@@ -0,0 +1,113 @@
+import json
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+# Requests one socket may have in flight at the same time
+MAX_REQUESTS_PER_SOCKET = 8
+
+logger = logging.getLogger(__name__)
+
+# Protocol, one JSON object per message:
+#   client -> server  {"type": "chat", "id": "r1", "message": "...", "user_id"?, "table_handles"?}
+#                     {"type": "cancel", "id": "r1"}
+#   server -> client  {"type": "status" | "tool" | "token" | "route" | "report_outline" | "report_section", "id": "r1", "data": ...}
+#                     {"type": "done", "id": "r1", "data": {"reply": ...}}
+#                     {"type": "error", "id": "r1", "data": {"detail": ...}}
+#                     {"type": "cancelled", "id": "r1"}
+Handler = Callable[[dict], AsyncIterator[tuple[str, Any]]]
+
+ws_stats = {"connections": 0, "requests": 0, "in_flight": 0, "cancelled": 0, "failed": 0}
+
+
+class SocketSession:
+    """Runs several tagged requests concurrently over one WebSocket.
+
+    Each request is a task; cancelling it (explicitly or because the socket closed) cancels the
+    agent runs underneath, including nested sub-agent runs and their HTTP calls.
+    """
+
+    def __init__(self, websocket: WebSocket, handler: Handler, max_requests: int = MAX_REQUESTS_PER_SOCKET):
+        self.websocket = websocket
+        self.handler = handler
+        self.max_requests = max_requests
+        self.tasks: dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, kind: str, request_id: str | None, data: Any = None):
+        message = {"type": kind, "id": request_id}
+        if data is not None:
+            message["data"] = data
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def serve(self):
+        ws_stats["connections"] += 1
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                try:
+                    message = json.loads(text)
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    await self.send("error", None, {"detail": "Messages must be JSON objects"})
+                    continue
+                await self.dispatch(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            ws_stats["connections"] -= 1
+            await self.cancel_all()
+
+    async def dispatch(self, message: dict):
+        kind, request_id = message.get("type"), message.get("id")
+        if not isinstance(request_id, str) or not request_id:
+            await self.send("error", None, {"detail": "Every message needs a string id"})
+        elif kind == "cancel":
+            task = self.tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+        elif kind == "chat":
+            if request_id in self.tasks:
+                await self.send("error", request_id, {"detail": "A request with this id is already running"})
+            elif len(self.tasks) >= self.max_requests:
+                await self.send("error", request_id, {"detail": f"At most {self.max_requests} requests per connection"})
+            else:
+                self.tasks[request_id] = asyncio.create_task(self._run(request_id, message))
+        else:
+            await self.send("error", request_id, {"detail": f"Unknown message type {kind!r}"})
+
+    async def _run(self, request_id: str, message: dict):
+        ws_stats["requests"] += 1
+        ws_stats["in_flight"] += 1
+        try:
+            # aclosing: a cancel that lands while sending still shuts the run down right away
+            async with aclosing(self.handler(message)) as events:
+                async for kind, data in events:
+                    await self.send(kind, request_id, data)
+        except asyncio.CancelledError:
+            ws_stats["cancelled"] += 1
+            try:
+                await self.send("cancelled", request_id)
+            except Exception:
+                pass
+        except Exception as e:
+            ws_stats["failed"] += 1
+            logger.exception("WebSocket request %s failed", request_id)
+            try:
+                await self.send("error", request_id, {"detail": str(e)})
+            except Exception:
+                pass
+        finally:
+            ws_stats["in_flight"] -= 1
+            self.tasks.pop(request_id, None)
+
+    async def cancel_all(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
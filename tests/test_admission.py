@@ -0,0 +1,99 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from src.utils.admission import AdmissionRejected, ConcurrencyLimiter, LimitedModel
+
+
+async def hold(limiter, seconds, log=None, name=None):
+    async with limiter.slot():
+        if log is not None:
+            log.append(name)
+        await asyncio.sleep(seconds)
+
+
+def test_waiters_are_served_in_order_within_the_limit():
+    limiter = ConcurrencyLimiter("test", 2)
+    order = []
+
+    async def run():
+        await asyncio.gather(*(hold(limiter, 0.02, order, i) for i in range(5)))
+
+    asyncio.run(run())
+    assert order == [0, 1, 2, 3, 4]
+    stats = limiter.stats()
+    assert (stats["active"], stats["queue_depth"], stats["admitted"], stats["queued"]) == (0, 0, 5, 3)
+    assert stats["max_queue_depth"] == 3
+
+
+def test_full_queue_is_rejected_with_429():
+    limiter = ConcurrencyLimiter("test", 1, max_queue=1, deadline=10)
+    limiter.service_seconds = 0.01
+
+    async def run():
+        tasks = [asyncio.ensure_future(hold(limiter, 0.05)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        await asyncio.gather(*tasks)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 429 and rejected.headers == {"Retry-After": "1"}
+
+
+def test_expected_wait_past_the_deadline_is_rejected_with_503_at_once():
+    limiter = ConcurrencyLimiter("test", 1, max_queue=10, deadline=1)
+    limiter.service_seconds = 5
+
+    async def run():
+        task = asyncio.ensure_future(hold(limiter, 0.05))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        await task
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 503 and rejected.retry_after == 5
+    assert limiter.stats()["rejected_deadline"] == 1
+
+
+def test_waiting_past_the_deadline_times_out_and_frees_the_queue():
+    limiter = ConcurrencyLimiter("test", 1, deadline=0.05)
+    limiter.service_seconds = 0.01
+
+    async def run():
+        task = asyncio.ensure_future(hold(limiter, 0.2))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        await task
+
+    asyncio.run(run())
+    assert limiter.stats()["timed_out"] == 1 and limiter.queue_depth == 0 and limiter.active == 0
+
+
+def test_model_calls_hold_an_upstream_slot():
+    limiter = ConcurrencyLimiter("upstream", 1)
+    peak = []
+
+    async def reply(messages, info: AgentInfo):
+        peak.append(limiter.active)
+        await asyncio.sleep(0.01)
+        return ModelResponse(parts=[TextPart("ok")])
+
+    agent = Agent(LimitedModel(FunctionModel(reply), limiter))
+
+    async def run():
+        return await asyncio.gather(*(agent.run("hi") for _ in range(3)))
+
+    assert [result.output for result in asyncio.run(run())] == ["ok"] * 3
+    assert peak == [1, 1, 1] and limiter.stats()["queued"] == 2
@@ -0,0 +1,133 @@
+import sys
+import os
+import json
+import struct
+import asyncio
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils import columnar
+from src.utils.columnar import (
+    ColumnarFormatError,
+    TableStore,
+    UploadTooLargeError,
+    decode_columnar,
+    encode_columnar,
+    receive_table,
+)
+from src.utils.block_store import BlockStore, BlockIntegrityError, MissingBlocksError, encode_blocks, read_block
+from src.utils.table_stats import Table
+
+
+async def chunked(data: bytes, size: int = 4096):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def test_round_trip_with_blanks():
+    payload = encode_columnar({
+        "Region": ["West", None, "Ünïcode"],
+        "Sales": [1.5, None, 3],
+        "Flag": [True, False, None],
+        "Ids": np.arange(3),
+    })
+    table = decode_columnar(bytearray(payload))
+    assert table.rows == 3
+    assert table.columns["Region"].tolist() == ["West", None, "Ünïcode"]
+    assert np.isnan(table.columns["Sales"][1]) and table.columns["Sales"][2] == 3.0
+    assert table.columns["Flag"].tolist() == [True, False, None]
+    assert table.columns["Ids"].tolist() == [0.0, 1.0, 2.0]
+
+
+def test_float_columns_are_views_over_the_upload():
+    buffer = bytearray(encode_columnar({"x": np.linspace(0, 1, 100)}))
+    column = decode_columnar(buffer).columns["x"]
+    assert np.shares_memory(column, np.frombuffer(buffer, dtype=np.uint8))
+
+
+def test_invalid_payloads_are_rejected():
+    with pytest.raises(ColumnarFormatError):
+        decode_columnar(b"not a table")
+    truncated = encode_columnar({"x": np.arange(1000)})[:200]
+    with pytest.raises(ColumnarFormatError):
+        decode_columnar(truncated)
+
+
+@pytest.mark.parametrize("columns", [
+    ["x"],
+    [{"type": "f8", "offset": 0}],
+    [{"name": "x", "offset": 0}],
+    [{"name": "x", "type": ["f8"], "offset": 0}],
+    [{"name": "x", "type": {"kind": "f8"}, "offset": 0}],
+    [{"name": "x", "type": "f8", "offset": 10 ** 30}],
+    [{"name": "x", "type": "f8", "offset": 0, "nulls": {"offset": 10 ** 30}}],
+    [{"name": "x", "type": "f8", "offset": "start"}],
+    [{"name": "x", "type": "f8", "offset": 0, "nulls": {"length": 1}}],
+    {"x": "f8"},
+])
+def test_malformed_column_specs_are_format_errors(columns):
+    header = json.dumps({"rows": 1, "columns": columns}).encode()
+    payload = columnar.MAGIC + struct.pack("<I", len(header)) + header + b"\x00" * 16
+    with pytest.raises(ColumnarFormatError):
+        decode_columnar(payload)
+
+
+def test_large_uploads_spill_to_a_memory_map(monkeypatch):
+    monkeypatch.setattr(columnar, "SPILL_THRESHOLD", 1024)
+    store = TableStore()
+    payload = encode_columnar({"x": np.arange(10_000)})
+    handle, table = asyncio.run(receive_table(chunked(payload), store=store))
+    assert store.get(handle) is table
+    assert table.columns["x"][-1] == 9999.0
+    store.remove(handle)
+    assert len(store) == 0 and store.bytes == 0
+
+
+def test_store_evicts_least_recently_used():
+    store = TableStore(max_bytes=100)
+    first = store.add(Table({"a": [1]}), 60)
+    second = store.add(Table({"a": [2]}), 30)
+    store.get(first)
+    store.add(Table({"a": [3]}), 30)
+    assert first in store and second not in store
+
+
+def test_delta_upload_only_sends_missing_blocks():
+    store = BlockStore(tables=TableStore())
+    values = list(range(100))
+    manifest, blocks = encode_blocks({"a": values, "b": [str(v) for v in values]}, block_rows=40)
+    with pytest.raises(MissingBlocksError):
+        store.assemble(manifest)
+    for digest in store.missing(blocks):
+        store.put(digest, blocks[digest])
+    handle, table = store.assemble(manifest)
+    assert table.columns["a"].tolist() == [float(v) for v in values]
+    assert table.columns["b"][-1] == "99"
+    assert store.assemble(manifest)[0] == handle
+
+    # changing one row only invalidates the block of each column that contains it
+    values[95] = -1
+    changed, changed_blocks = encode_blocks({"a": values, "b": [str(v) for v in values]}, block_rows=40)
+    assert len(store.missing(changed_blocks)) == 2
+
+
+def test_blocks_are_verified_and_evicted():
+    store = BlockStore(max_bytes=1, tables=TableStore())
+    _, blocks = encode_blocks({"a": list(range(10))}, block_rows=5)
+    first, second = blocks
+    with pytest.raises(BlockIntegrityError):
+        store.put(first, blocks[second])
+    store.put(first, blocks[first])
+    store.put(second, blocks[second])
+    assert first not in store and second in store
+
+
+def test_oversized_block_uploads_are_refused():
+    _, blocks = encode_blocks({"a": list(range(1000))})
+    (payload,) = blocks.values()
+    assert asyncio.run(read_block(chunked(payload, 100))) == payload
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(read_block(chunked(payload, 100), max_bytes=len(payload) - 1))
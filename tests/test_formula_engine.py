@@ -0,0 +1,87 @@
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.formula_engine import (
+    compile_formula,
+    evaluate_formula,
+    ExcelError,
+    FormulaSyntaxError,
+)
+
+
+@pytest.mark.parametrize("formula, inputs, expected", [
+    ("SUM(a, b, c)", {"a": 1, "b": 2, "c": 3}, 6.0),
+    ("a * b + c", {"a": 2, "b": 3, "c": 4}, 10.0),
+    ("=AVERAGE(10, 20, 30)", {}, 20.0),
+    ("SUM(A1:A3)", {"A1": 1, "A2": "text", "A3": 5}, 6.0),
+    ("-2^2", {}, 4.0),
+    ("2^3^2", {}, 64.0),
+    ("50%*a", {"a": 4}, 2.0),
+    ("ROUND(2.5, 0)", {}, 3.0),
+    ("ROUND(1.005, 2)", {}, 1.01),
+    ("ROUND(-2.675, 2)", {}, -2.68),
+    ("ROUND(1250, -2)", {}, 1300.0),
+    ("ROUND(1e27, 2)", {}, 1e27),
+    ("ROUND(12345678901234, 15)", {}, 12345678901234.0),
+    ("ROUND(1.5e20, -400)", {}, 0.0),
+    ("ROUND(6e307, -308)", {}, 1e308),
+    ("MOD(-3, 2)", {}, 1.0),
+    ("$A$1+A$2+$A3", {"A1": 1, "A2": 2, "A3": 3}, 6.0),
+    ("SUM($A$1:$A$3)", {"A1": 1, "A2": 2, "A3": 3}, 6.0),
+    ("DATE(2025, 10, 5)", {}, 45935.0),
+    ("YEAR(DATE(2025, 14, 1))", {}, 2026.0),
+    ("YEAR(1e10)", {}, "#NUM!"),
+    ("DAY(3e6)", {}, "#NUM!"),
+    ("YEAR(-1)", {}, "#NUM!"),
+    ("YEAR(2958465)", {}, 9999.0),
+    ("INT(1e400)", {}, "#NUM!"),
+    ("MOD(1e308, 1e-308)", {}, "#NUM!"),
+])
+def test_arithmetic_and_functions(formula, inputs, expected):
+    assert evaluate_formula(formula, inputs) == pytest.approx(expected)
+
+
+def test_variable_prefix_does_not_clobber_longer_names():
+    # the old str.replace implementation turned "ab" into "2b"
+    assert evaluate_formula("a * ab + b", {"a": 2, "ab": 10, "b": 1}) == 21.0
+
+
+def test_text_logic_and_lookup():
+    assert evaluate_formula('IF(A1 > 10, "High", "Low")', {"A1": 11}) == "High"
+    assert evaluate_formula('IF(A1 > 10, "High", "Low")', {"A1": 3}) == "Low"
+    assert evaluate_formula('CONCAT("Hello", " ", 3)', {}) == "Hello 3"
+    assert evaluate_formula('A1 = "alice"', {"A1": "Alice"}) is True
+    table = [["Alice", 10], ["Bob", 20]]
+    assert evaluate_formula('VLOOKUP("Bob", t, 2, FALSE)', {"t": table}) == 20
+    assert evaluate_formula('VLOOKUP(15, t, 2, TRUE)', {"t": [[10, 1], [20, 2]]}) == 1
+
+
+def test_errors_are_returned_as_codes():
+    assert evaluate_formula("1/0", {}) == "#DIV/0!"
+    assert evaluate_formula("missing + 1", {}) == "#NAME?"
+    assert evaluate_formula("IFERROR(1/0, -1)", {}) == -1.0
+    assert [evaluate_formula(f, {}) for f in ('LEFT("abc",-1)', 'RIGHT("abc",-1)', 'MID("abc",1,-1)')] == ["#VALUE!"] * 3
+    assert evaluate_formula('LEFT("abc",0)&RIGHT("abc",5)', {}) == "abc"
+    assert evaluate_formula('VLOOKUP("x", t, 2, FALSE)', {"t": [["a", 1]]}) == "#N/A"
+    assert isinstance(compile_formula("1/0").evaluate({}), ExcelError)
+
+
+def test_syntax_errors_raise():
+    with pytest.raises(FormulaSyntaxError):
+        compile_formula("SUM(1,")
+    with pytest.raises(FormulaSyntaxError):
+        compile_formula("NOSUCHFUNCTION(1)")
+    for formula in ("$rate*2", "SUM$1(2)", "IF(1,2,3,4)", "IF()", "IFERROR(1)", "IFNA(1,2,3)"):
+        with pytest.raises(FormulaSyntaxError):
+            compile_formula(formula)
+
+
+def test_compiled_formulas_are_cached():
+    first = compile_formula("x * 2 + y")
+    assert compile_formula("x * 2 + y") is first
+    assert first.references == {"X", "Y"}
+    assert [first.evaluate({"x": i, "y": 1}) for i in range(3)] == [1.0, 3.0, 5.0]
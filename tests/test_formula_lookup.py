@@ -0,0 +1,69 @@
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.formula_engine import Range, evaluate_formula
+from src.utils.formula_lookup import key_positions, range_index
+
+TABLE = [["Alice", 10, "x"], ["Bob", 20, "y"], ["carol", 30, "x"], ["Bob", 40, "z"]]
+COLUMNS = {
+    "names": [row[0] for row in TABLE],
+    "amounts": [row[1] for row in TABLE],
+    "codes": [row[2] for row in TABLE],
+    "t": TABLE,
+}
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ('VLOOKUP("bob", t, 2, FALSE)', 20),
+    ('VLOOKUP("c*", t, 2, FALSE)', 30),
+    ('VLOOKUP("nobody", t, 2, FALSE)', "#N/A"),
+    ('VLOOKUP("Alice", t, 4, FALSE)', "#REF!"),
+    ('MATCH("Bob", names, 0)', 2.0),
+    ('INDEX(t, MATCH("carol", names, 0), 2)', 30),
+    ('XLOOKUP("Bob", names, amounts)', 20),
+    ('XLOOKUP("Bob", names, amounts, , 0, -1)', 40),
+    ('XLOOKUP("zz", names, amounts, "none")', "none"),
+    ('XLOOKUP(25, amounts, names, , 1)', "carol"),
+    ('SUMIFS(amounts, names, "bob")', 60.0),
+    ('SUMIFS(amounts, codes, "x", amounts, ">15")', 30.0),
+    ('COUNTIFS(codes, "<>x")', 2.0),
+    ('COUNTIF(names, "?ob")', 2.0),
+    ('AVERAGEIF(amounts, ">=20")', 30.0),
+    ('MAXIFS(amounts, codes, "x")', 30.0),
+])
+def test_lookup_and_conditional_functions(formula, expected):
+    assert evaluate_formula(formula, COLUMNS) == expected
+
+
+def test_approximate_match_uses_sorted_index():
+    bands = [[0, "F"], [50, "C"], [70, "B"], [90, "A"]]
+    assert evaluate_formula("VLOOKUP(75, t, 2)", {"t": bands}) == "B"
+    assert evaluate_formula("VLOOKUP(-1, t, 2, TRUE)", {"t": bands}) == "#N/A"
+    assert evaluate_formula("MATCH(89, v, 1)", {"v": [0, 50, 70, 90]}) == 3.0
+    assert evaluate_formula("SUMIF(A1:A3, \">1\")", {"A1": 1, "A2": 2, "A3": 3}) == 5.0
+
+
+def test_indexes_are_built_once_and_reused():
+    rows = [[f"key{i}", i] for i in range(1000)]
+    rng = Range.from_value(rows)
+    index = range_index(rng, "col", 0)
+    assert range_index(rng, "col", 0) is index
+    # a fresh Range over the same content shares the positions through the content-keyed cache
+    assert range_index(Range.from_value(rows), "col", 0).positions is index.positions
+    hits = key_positions.cache_info().hits
+    evaluate_formula('VLOOKUP("key500", t, 2, FALSE)', {"t": rows})
+    assert key_positions.cache_info().hits == hits + 1
+
+
+def test_true_and_one_do_not_share_an_index():
+    flags = [[True, "flag"], [2, "two"]]
+    numbers = [[1, "one"], [2, "two"]]
+    # (True, 2) == (1, 2) in Python, so a cache keyed by raw values would hand one column the other's index
+    assert evaluate_formula("VLOOKUP(TRUE, t, 2, FALSE)", {"t": flags}) == "flag"
+    assert evaluate_formula("VLOOKUP(1, t, 2, FALSE)", {"t": numbers}) == "one"
+    assert evaluate_formula("VLOOKUP(1, t, 2, FALSE)", {"t": flags}) == "#N/A"
+    assert evaluate_formula("VLOOKUP(TRUE, t, 2, FALSE)", {"t": numbers}) == "#N/A"
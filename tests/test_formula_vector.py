@@ -0,0 +1,70 @@
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.formula_engine import evaluate_formula
+from src.utils.formula_vector import compile_vector_formula, summarize_vector
+
+
+def evaluate(formula, columns, constants=None):
+    return compile_vector_formula(formula).evaluate(columns, constants).to_list()
+
+
+def test_arithmetic_broadcasts_constants_and_treats_blanks_as_zero():
+    assert evaluate("SUM(a, b) + rate", {"a": [1, None], "b": [2, 3]}, {"rate": 10}) == [13.0, 13.0]
+    assert evaluate("a * 2", {"a": [1.5, None, 4]}) == [3.0, 0.0, 8.0]
+
+
+def test_errors_are_tracked_per_cell():
+    result = compile_vector_formula("IF(a > 10, a * 2, b / c)").evaluate(
+        {"a": [1, 20, 3, None], "b": [1, 2, 3, 4], "c": [0, 1, 2, "x"]})
+    assert result.to_list() == ["#DIV/0!", 40.0, 1.5, "#VALUE!"]
+    summary, error_counts = summarize_vector(result)
+    assert error_counts == {"#DIV/0!": 1, "#VALUE!": 1}
+    assert summary["count"] == 2.0 and summary["sum"] == 41.5
+    assert evaluate('IFERROR(a / b, "bad")', {"a": [1, 2], "b": [0, 4]}) == ["bad", 0.5]
+    assert evaluate("a + 1", {"a": ["#N/A", 1]}) == ["#N/A", 2.0]
+
+
+def test_text_and_fallback_functions():
+    assert evaluate('CONCAT(n, "-", a)', {"n": ["x", "y"], "a": [1, 2.5]}) == ["x-1", "y-2.5"]
+    assert evaluate('a = "x"', {"a": ["X", "y", None]}) == [True, False, False]
+    table = [["a", 1], ["b", 2]]
+    assert evaluate("VLOOKUP(k, t, 2, FALSE)", {"k": ["a", "b", "z"]}, {"t": table}) == [1, 2, "#N/A"]
+
+
+@pytest.mark.parametrize("formula", [
+    "ROUND(a * b, 1)",
+    "AVERAGE(a, b)",
+    "MAX(a, b) - MIN(a, b)",
+    "MOD(a, 3)",
+    "IF(AND(a > 1, NOT(b > 5)), -a^2, SQRT(b))",
+])
+def test_vectorized_results_match_scalar_engine(formula):
+    a = [1.25, 2, -3, 4.5, 0]
+    b = [2, 6, 0.5, 9, 3]
+    expected = [evaluate_formula(formula, {"a": x, "b": y}) for x, y in zip(a, b)]
+    assert evaluate(formula, {"a": a, "b": b}) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("formula", ["AND(a, b)", "OR(a, b)", "AND(a > 0, b)", "IF(OR(a, b), 1, 2)"])
+def test_logical_functions_skip_blanks_like_the_scalar_engine(formula):
+    a = [None, None, True, False, None, 0]
+    b = [True, False, None, None, None, 1]
+    expected = [evaluate_formula(formula, {"a": x, "b": y}) for x, y in zip(a, b)]
+    assert evaluate(formula, {"a": a, "b": b}) == expected
+
+
+def test_round_matches_scalar_engine_on_halves():
+    values = [1.005, -2.675, 1.015, 0.125, 2.5, -0.5, 1234.5678]
+    for digits in (0, 1, 2, 3):
+        expected = [evaluate_formula(f"ROUND(a, {digits})", {"a": x}) for x in values]
+        assert evaluate(f"ROUND(a, {digits})", {"a": values}) == expected
+
+
+def test_mismatched_column_lengths_are_rejected():
+    with pytest.raises(ValueError):
+        compile_vector_formula("a + b").evaluate({"a": [1, 2], "b": [1]})
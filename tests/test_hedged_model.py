@@ -0,0 +1,73 @@
+import sys
+import os
+import time
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from src.utils import hedged_model
+from src.utils.hedged_model import HedgedModel
+
+
+@pytest.fixture(autouse=True)
+def short_delays(monkeypatch):
+    monkeypatch.setattr(hedged_model, "HEDGE_DEFAULT_DELAY", 0.1)
+    monkeypatch.setattr(hedged_model, "HEDGE_MIN_DELAY", 0.01)
+
+
+def model(name, delay=0.0, fail=False, calls=None):
+    async def reply(messages, info: AgentInfo):
+        if calls is not None:
+            calls.append(name)
+        await asyncio.sleep(delay)
+        if fail:
+            raise ModelHTTPError(429, name)
+        return ModelResponse(parts=[TextPart(f"from {name}")])
+
+    async def stream(messages, info: AgentInfo):
+        await asyncio.sleep(delay)
+        yield f"streamed from {name}"
+
+    return FunctionModel(reply, stream_function=stream, model_name=name)
+
+
+def test_slow_model_is_hedged_and_overtaken():
+    hedged = HedgedModel(model("slow", delay=2), model("fast", delay=0.05))
+    started = time.perf_counter()
+    result = Agent(hedged).run_sync("hi")
+    assert result.output == "from fast" and time.perf_counter() - started < 1
+    stats = hedged.stats()
+    assert stats["hedges"] == 1
+    assert stats["models"]["slow"]["cancelled"] == 1 and stats["models"]["fast"]["wins"] == 1
+
+
+def test_fast_model_is_not_hedged():
+    calls = []
+    hedged = HedgedModel(model("primary", calls=calls), model("secondary", calls=calls))
+    assert Agent(hedged).run_sync("hi").output == "from primary"
+    assert calls == ["primary"] and hedged.hedges == 0
+
+
+def test_failures_fall_back_and_demote_the_model():
+    hedged = HedgedModel(model("limited", fail=True), model("healthy"))
+    assert Agent(hedged).run_sync("hi").output == "from healthy"
+    assert hedged.stats()["models"]["limited"]["error_rate"] == 1.0
+    assert [m.model_name for m in hedged.ranked()] == ["healthy", "limited"]
+
+
+def test_streams_are_hedged_on_the_first_chunk():
+    hedged = HedgedModel(model("slow", delay=2), model("fast", delay=0.05))
+
+    async def run():
+        async with Agent(hedged).run_stream("hi") as response:
+            return await response.get_output()
+
+    started = time.perf_counter()
+    assert asyncio.run(run()) == "streamed from fast"
+    assert time.perf_counter() - started < 1
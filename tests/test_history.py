@@ -0,0 +1,66 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai.messages import ModelRequest, ModelResponse, SystemPromptPart, TextPart, ToolCallPart, ToolReturnPart, UserPromptPart
+
+from src.utils.history import HistoryManager, estimate_tokens, split_recent, trim_tool_payloads
+
+
+def turn(i: int, size: int = 400):
+    return [
+        ModelRequest(parts=[UserPromptPart(content=f"question {i} " + "q" * size)]),
+        ModelResponse(parts=[ToolCallPart(tool_name="excel_queries", args={"content": "x" * size}, tool_call_id=f"c{i}")]),
+        ModelRequest(parts=[ToolReturnPart(tool_name="excel_queries", content="y" * size, tool_call_id=f"c{i}")]),
+        ModelResponse(parts=[TextPart(content=f"answer {i}")]),
+    ]
+
+
+def test_tool_payloads_are_trimmed():
+    (trimmed_call,), (trimmed_return,) = [m.parts for m in trim_tool_payloads(turn(0, 5000)[1:3], limit=100)]
+    assert len(trimmed_call.args_as_json_str()) < 300
+    assert trimmed_return.content.endswith("characters trimmed]")
+    assert trimmed_return.tool_call_id == "c0"
+
+
+def test_split_keeps_whole_turns():
+    messages = turn(0) + turn(1) + turn(2)
+    start = split_recent(messages, estimate_tokens(turn(2)) + 10)
+    assert start == 8
+
+
+def test_old_turns_are_summarized_in_the_background():
+    seen = []
+
+    async def summarizer(text: str) -> str:
+        seen.append(text)
+        await asyncio.sleep(0)
+        return f"summary of {text.count('User:')} questions"
+
+    async def scenario():
+        manager = HistoryManager(summarizer=summarizer, budget=1000, keep_recent=400)
+        for i in range(6):
+            await manager.append("u", turn(i))
+        await manager.drain()
+        return manager, await manager.get("u")
+
+    manager, history = asyncio.run(scenario())
+    assert isinstance(history[0].parts[0], SystemPromptPart) and "summary of" in history[0].parts[0].content
+    assert "question 0" in seen[0]
+    assert manager.stats["compactions"] >= 1
+    assert estimate_tokens(history) <= manager.hard_limit
+
+
+def test_without_a_summarizer_the_oldest_turns_are_dropped():
+    manager = HistoryManager(summarizer=None, budget=500, keep_recent=300)
+
+    async def scenario():
+        for i in range(5):
+            await manager.append("u", turn(i))
+        return await manager.get("u")
+
+    history = asyncio.run(scenario())
+    assert isinstance(history[0].parts[0], UserPromptPart) and history[0].parts[0].content.startswith("question 4")
+    assert manager.stats["dropped_messages"] == 16
@@ -0,0 +1,44 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.load_utils import HttpClientPool
+
+
+def test_clients_are_shared_per_service_and_configured_from_the_pool():
+    pool = HttpClientPool(http2=False, max_connections=3, connect_timeout=1.5, read_timeout=30)
+    client = pool.get("openrouter")
+    assert pool.get("openrouter") is client and pool.get("tavily") is not client
+    assert client.timeout.connect == 1.5 and client.timeout.read == 30
+    asyncio.run(pool.aclose())
+    assert pool.clients == {}
+
+
+def test_requests_reuse_one_keep_alive_connection():
+    async def handle(reader, writer):
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = HttpClientPool(http2=False)
+        client = pool.get("local")
+        try:
+            for _ in range(3):
+                response = await client.get(f"http://127.0.0.1:{port}/")
+                assert response.text == "ok"
+        finally:
+            await pool.aclose()
+            server.close()
+        return pool.stats()
+
+    stats = asyncio.run(run())["services"]["local"]
+    assert stats["requests"] == 3 and stats["connections_opened"] == 1 and stats["reused_connections"] == 2
+    assert stats["in_flight"] == 0 and stats["errors"] == 0
@@ -0,0 +1,66 @@
+import sys
+import os
+import time
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.map_reduce import MapReduceSummarizer, chunk_text
+
+PARAGRAPH = "The committee met on Tuesday to review the budget. " * 10
+
+
+def document(paragraphs: int) -> str:
+    return "\n\n".join(f"Section {i}. {PARAGRAPH.strip()}" for i in range(paragraphs))
+
+
+class FakeSummarizer:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.prompts = []
+        self.running = self.peak = 0
+
+    async def __call__(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return f"summary {len(self.prompts)}"
+
+
+def test_chunks_follow_paragraphs_and_respect_the_size():
+    text = document(12)
+    chunks = chunk_text(text, max_tokens=400)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 400 * 4 for chunk in chunks)
+    assert all(chunk.startswith("Section") for chunk in chunks)
+    assert "\n\n".join(chunks) == text
+
+
+def test_short_content_is_one_call():
+    fake = FakeSummarizer(delay=0)
+    assert asyncio.run(MapReduceSummarizer(fake, chunk_tokens=1000)("short text")) == "summary 1"
+    assert fake.prompts == ["short text"]
+
+
+def test_chunks_are_summarized_in_parallel_then_combined():
+    fake = FakeSummarizer()
+    summarizer = MapReduceSummarizer(fake, chunk_tokens=200, concurrency=8, max_calls=100)
+    started = time.perf_counter()
+    summary = asyncio.run(summarizer(document(8)))
+    elapsed = time.perf_counter() - started
+
+    maps = [p for p in fake.prompts if p.startswith("This is part")]
+    assert len(maps) == 8 and fake.peak == 8
+    assert summary == f"summary {len(fake.prompts)}"
+    # one map level and one reduce level, not eight sequential calls
+    assert elapsed < 0.05 * 4
+
+
+def test_concurrency_and_total_calls_are_bounded():
+    fake = FakeSummarizer(delay=0.01)
+    summarizer = MapReduceSummarizer(fake, chunk_tokens=100, concurrency=3, max_calls=7)
+    asyncio.run(summarizer(document(40)))
+    assert fake.peak <= 3
+    assert len(fake.prompts) <= 7
@@ -0,0 +1,67 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai.tools import Tool
+
+from src.utils.passage_ranking import BM25Index, passage_index, passage_tokens, ranked_search_tool, select_passages, split_passages
+
+FILLER = "Visitors enjoy the old town, the river walks and the many cafes along the waterfront. " * 6
+
+RESULTS = [
+    {"title": "City guide", "href": "https://guide.example.com/lisbon",
+     "body": FILLER + "The population of Lisbon is about 545,000 people in the city proper."},
+    {"title": "Travel blog", "href": "https://blog.example.com/trip", "body": FILLER},
+    {"title": "Census", "href": "https://census.example.org/pt",
+     "body": "The 2021 census counted the population of the Lisbon metropolitan area at 2.9 million."},
+]
+
+
+def test_split_passages_keeps_whole_sentences():
+    passages = split_passages("One two three. Four five six. Seven eight nine.", max_words=6)
+    assert passages == ["One two three. Four five six.", "Seven eight nine."]
+
+
+def test_bm25_prefers_passages_with_rare_query_terms():
+    index = BM25Index()
+    documents = [index.add(text) for text in ["the river and the cafes", "lisbon population census", "lisbon river cafes"]]
+    scores = [index.score("lisbon population", document) for document in documents]
+    assert scores.index(max(scores)) == 1 and scores[0] == 0
+
+
+def test_only_relevant_passages_within_the_budget_are_kept():
+    ranked = select_passages("population of Lisbon", RESULTS, top_k=3, token_budget=200)
+    assert [entry["url"] for entry in ranked] == ["https://census.example.org/pt", "https://guide.example.com/lisbon"]
+    assert all("population" in entry["content"] for entry in ranked)
+    assert sum(passage_tokens(entry["content"]) for entry in ranked) <= 200
+
+
+def test_unmatched_queries_keep_the_engine_order():
+    results = [{"title": "Markets", "href": "https://news.example.com/nvidia",
+                "body": "Nvidia shares closed at $120 on Friday. " + FILLER}] + RESULTS[1:]
+    for query in ("NVDA stock price", "what is it"):
+        ranked = select_passages(query, results, top_k=2, token_budget=200)
+        assert ranked[0]["url"] == "https://news.example.com/nvidia"
+        assert ranked[0]["content"].startswith("Nvidia shares closed at $120")
+        assert sum(passage_tokens(entry["content"]) for entry in ranked) <= 200
+
+
+def test_searches_in_one_run_share_the_index_and_skip_repeated_passages():
+    async def search(query: str):
+        return RESULTS
+
+    tool = ranked_search_tool(Tool(search), "duckduckgo")
+
+    async def run():
+        with passage_index() as index:
+            first = await tool.function("population of Lisbon")
+            second = await tool.function("population of Lisbon")
+        return index, first, second
+
+    index, first, second = asyncio.run(run())
+    assert len(index) > len(split_passages(RESULTS[0]["body"]))
+    seen = {entry["content"] for entry in first}
+    assert first and not seen & {entry["content"] for entry in second}
+    assert first[0]["engines"] == ["duckduckgo"]
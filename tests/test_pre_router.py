@@ -0,0 +1,52 @@
+import sys
+import os
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.pre_router import NaiveBayes, PreRouter
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+EXAMPLES = os.path.join(ROOT, "src/agent/knowledge/router_examples.yaml")
+KNOWLEDGE = os.path.join(ROOT, "src/agent/knowledge/excel_kb.yaml")
+
+
+def load(tmp_path, **thresholds):
+    return PreRouter.load(model_path=str(tmp_path / "model.json"), examples_path=EXAMPLES, knowledge_path=KNOWLEDGE, **thresholds)
+
+
+def test_obvious_requests_take_the_fast_path(tmp_path):
+    router = load(tmp_path)
+    assert router.classify("Why does =VLOOKUP(A2, B:C, 2, FALSE) return #N/A?").target == "excel"
+    assert router.classify("How do I use SUMIFS with two conditions?").target == "excel"
+    assert router.classify("Who is the current president of France?").target == "research"
+    assert router.classify("what about 2024?").target is None
+    stats = router.stats()
+    assert (stats["fast_path_excel"], stats["fast_path_research"], stats["fallback"]) == (2, 1, 1)
+
+
+def test_follow_ups_go_to_the_llm_router(tmp_path):
+    router = load(tmp_path)
+    history = [object()]
+    assert router.classify("What about the other one you mentioned?").target == "research"
+    decision = router.classify("What about the other one you mentioned?", history)
+    assert decision.target is None and not decision.fast_path
+    assert router.classify("Who is the current president of France?", history).target is None
+
+
+def test_thresholds_control_the_fallback(tmp_path):
+    router = load(tmp_path, excel_threshold=1.0, research_threshold=1.0)
+    decision = router.classify("How do I merge two tables by key?")
+    assert decision.target is None and decision.confidence < 1.0
+
+
+def test_model_is_stored_and_retrained_when_examples_change(tmp_path):
+    load(tmp_path)
+    with open(tmp_path / "model.json") as f:
+        stored = json.load(f)
+    assert NaiveBayes.from_dict(stored["model"]).vocabulary > 0
+
+    examples = tmp_path / "examples.yaml"
+    examples.write_text("excel:\n  - pivot my numbers\nresearch:\n  - news about rockets\n")
+    router = PreRouter.load(model_path=str(tmp_path / "model.json"), examples_path=str(examples), knowledge_path=KNOWLEDGE)
+    assert router.model.vocabulary < NaiveBayes.from_dict(stored["model"]).vocabulary
@@ -0,0 +1,74 @@
+import sys
+import os
+import time
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.models.test import TestModel
+
+from src.agent.report_generation_agent import FinalReport, ReportOutline, generate_report, stream_report
+from src.utils.streaming import stream_run
+
+OUTLINE = {
+    "title": "Solar adoption",
+    "sections": [
+        {"heading": "Executive summary", "brief": "Key findings"},
+        {"heading": "Costs", "brief": "Price trends"},
+        {"heading": "Outlook", "brief": "Next five years"},
+    ],
+}
+# the first section is the slowest, later ones must still come out after it
+DELAYS = {"Executive summary": 0.3, "Costs": 0.1, "Outlook": 0.2}
+
+
+def section_agent():
+    async def write(messages, info: AgentInfo):
+        prompt = messages[-1].parts[-1].content
+        heading = prompt.split('Write only the section "', 1)[1].split('"', 1)[0]
+        await asyncio.sleep(DELAYS.get(heading, 0.1))
+        return ModelResponse(parts=[TextPart(f"text of {heading}")])
+
+    return Agent(FunctionModel(write))
+
+
+def test_sections_are_written_concurrently_and_streamed_in_order():
+    outline_agent = Agent(TestModel(custom_output_args=OUTLINE), output_type=ReportOutline)
+
+    async def run():
+        started = time.perf_counter()
+        events = [event async for event in stream_report(outline_agent, section_agent(), "data", concurrency=8)]
+        return events, time.perf_counter() - started
+
+    events, elapsed = asyncio.run(run())
+    headings = [data["heading"] for kind, data in events if kind == "section"]
+    assert headings == ["Executive summary", "Costs", "Outlook", "Next steps", "Agent actions"]
+    assert elapsed < 0.6  # the slowest section, not the sum of all of them
+
+    report = events[-1][1]
+    assert isinstance(report, FinalReport)
+    assert report.report.startswith("# Solar adoption\n\n## Executive summary\n\ntext of Executive summary")
+    assert "## Outlook" in report.report and "Next steps" not in report.report
+    assert (report.next_steps, report.agent_actions) == ("text of Next steps", "text of Agent actions")
+
+
+def test_streamed_runs_receive_the_report_section_by_section():
+    outline_agent = Agent(TestModel(custom_output_args=OUTLINE), output_type=ReportOutline)
+    agent = Agent(TestModel(call_tools=["write_report"], custom_output_text="done"))
+
+    @agent.tool_plain
+    async def write_report(content: str) -> str:
+        return (await generate_report(outline_agent, section_agent(), content, concurrency=8)).report
+
+    async def run():
+        return [event async for event in stream_run(agent, "go")]
+
+    events = asyncio.run(run())
+    outline = next(data for kind, data in events if kind == "report_outline")
+    assert outline == {"title": "Solar adoption", "sections": ["Executive summary", "Costs", "Outlook"]}
+    sections = [data for kind, data in events if kind == "report_section"]
+    assert [section["heading"] for section in sections] == ["Executive summary", "Costs", "Outlook", "Next steps", "Agent actions"]
+    assert sections[0]["text"] == "text of Executive summary"
@@ -0,0 +1,65 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, ToolCallPart, UserPromptPart
+
+from src.utils import response_cache
+from src.utils.response_cache import ResponseCache, TTLCache, cache_bypassed, calls_tool, normalize_message
+
+
+def turn(question: str, answer: str):
+    return [ModelRequest(parts=[UserPromptPart(content=question)]), ModelResponse(parts=[TextPart(content=answer)])]
+
+
+def test_normalized_messages_share_a_key():
+    cache = ResponseCache(version="m:1")
+    assert normalize_message("  How do I use  VLOOKUP? ") == "how do i use vlookup"
+    assert cache.key("How do I use VLOOKUP?", []) == cache.key("how do i use   vlookup", [])
+
+
+def test_key_depends_on_context_and_version():
+    cache = ResponseCache(version="m:1")
+    first = cache.key("and for columns?", turn("How do I sum a row?", "Use SUM(A1:Z1)"))
+    other = cache.key("and for columns?", turn("How do I average a row?", "Use AVERAGE(A1:Z1)"))
+    assert first != other
+    assert first != ResponseCache(version="m:2").key("and for columns?", turn("How do I sum a row?", "Use SUM(A1:Z1)"))
+
+
+def test_lru_eviction_and_counters():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (3, 1, 1, 2)
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=10, ttl=5)
+    cache.set("a", 1)
+    now[0] += 4
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_bypass_headers():
+    assert cache_bypassed({"x-cache-bypass": "1"})
+    assert cache_bypassed({"cache-control": "no-cache"})
+    assert not cache_bypassed({})
+
+
+def test_calls_tool_finds_sub_agent_calls():
+    routed = [ModelRequest(parts=[UserPromptPart(content="what is in B2?")]),
+              ModelResponse(parts=[ToolCallPart("excel_queries", {"content": "what is in B2?"})])]
+    assert calls_tool(routed, "excel_queries")
+    assert not calls_tool(routed, "deep_research")
+    assert not calls_tool(turn("hi", "hello"), "excel_queries")
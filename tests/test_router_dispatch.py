@@ -0,0 +1,52 @@
+import sys
+import os
+import asyncio
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.models.test import TestModel
+
+from src.agent.router_agent import dispatch, generate_dispatch_router, run_sub_agent_once
+
+logger = logging.getLogger()
+
+
+def echo_agent(prompts):
+    # sub-agents are streamed for chat and run directly for batches
+    async def stream(messages, info: AgentInfo):
+        prompt = messages[-1].parts[-1].content
+        prompts.append(prompt)
+        yield f"answer to {prompt}"
+
+    async def reply(messages, info: AgentInfo):
+        prompt = messages[-1].parts[-1].content
+        prompts.append(prompt)
+        return ModelResponse(parts=[TextPart(f"answer to {prompt}")])
+
+    return Agent(FunctionModel(reply, stream_function=stream))
+
+
+def test_dispatch_runs_the_chosen_agent_with_the_rewritten_query():
+    router = generate_dispatch_router(TestModel(custom_output_args={"target": "research", "query": "population of Lisbon 2024"}), logger=logger)
+    research_prompts, excel_prompts = [], []
+    output, exchange, decision = asyncio.run(dispatch(
+        router, "and how many people live there?", [], "0", echo_agent(research_prompts), echo_agent(excel_prompts)))
+
+    assert decision.target == "research"
+    assert research_prompts == ["population of Lisbon 2024"] and excel_prompts == []
+    assert output == "answer to population of Lisbon 2024"
+    # history keeps what the user actually asked, followed by the answer returned as-is
+    assert isinstance(exchange[0], ModelRequest) and exchange[0].parts[0].content == "and how many people live there?"
+    assert exchange[1].parts[0].content == output
+
+
+def test_run_sub_agent_once_reports_the_reply_and_usage():
+    research_prompts, excel_prompts = [], []
+    reply, usage = asyncio.run(run_sub_agent_once(
+        "excel", "Classify: great product", "0", echo_agent(research_prompts), echo_agent(excel_prompts)))
+    assert reply == "answer to Classify: great product" and excel_prompts == ["Classify: great product"]
+    assert usage.requests == 1 and research_prompts == []
@@ -0,0 +1,65 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai.tools import Tool
+
+from src.utils.search_cache import SearchCache, cached_search_tool, search_key
+
+
+def counting_tool():
+    calls = []
+
+    async def fake_search(query: str, topic: str = "general") -> list[dict]:
+        """Searches the fake engine.
+
+        Args:
+            query: The search query.
+            topic: The category of the search.
+        """
+        calls.append((query, topic))
+        return [{"url": f"https://example.com/{len(calls)}", "content": query}]
+
+    return Tool(fake_search, name="fake_search", description="Searches the fake engine."), calls
+
+
+def test_identical_queries_hit_the_cache(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "search.sqlite3"))
+    tool, calls = counting_tool()
+    cached = cached_search_tool(tool, "fake", cache)
+    assert cached.name == "fake_search"
+
+    first = asyncio.run(cached.function("Excel  XLOOKUP examples?"))
+    second = asyncio.run(cached.function("excel xlookup examples"))
+    assert first == second and len(calls) == 1
+    asyncio.run(cached.function("excel xlookup examples", topic="news"))
+    assert len(calls) == 2
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    assert stats["saved_seconds"] >= 0
+
+
+def test_cache_survives_restart_and_expires(tmp_path):
+    path = str(tmp_path / "search.sqlite3")
+    key = search_key("fake", "q")
+    SearchCache(path=path).put(key, "fake", "q", [{"url": "u"}], latency=1.5)
+    reopened = SearchCache(path=path)
+    assert reopened.get(key) == [{"url": "u"}]
+    assert reopened.stats()["saved_seconds"] == 1.5
+
+    reopened.put(key, "fake", "q", [{"url": "u"}], latency=1.0, ttl=-1)
+    assert reopened.get(key) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "search.sqlite3"), max_entries=2)
+    for query in ("a", "b"):
+        cache.put(search_key("fake", query), "fake", query, [query], latency=0.1)
+    cache.get(search_key("fake", "a"))
+    cache.put(search_key("fake", "c"), "fake", "c", ["c"], latency=0.1)
+    assert cache.get(search_key("fake", "b")) is None
+    assert cache.get(search_key("fake", "a")) == ["a"]
+    assert cache.stats()["entries"] == 2
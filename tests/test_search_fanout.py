@@ -0,0 +1,61 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.search_fanout import FanOutSearch, canonical_url, fanout_stats, merge_results
+
+ARTICLE = "The central bank raised interest rates by a quarter point on Thursday citing persistent inflation in services"
+
+
+def test_canonical_url_ignores_tracking_and_cosmetics():
+    assert canonical_url("http://www.Example.com/news/?utm_source=x&id=3#top") == canonical_url("https://example.com/news?id=3")
+
+
+def test_duplicates_by_url_and_content_are_merged_and_ranked_first():
+    tavily = [
+        {"title": "Rates", "url": "https://news.example.com/rates", "content": ARTICLE, "engines": ["tavily"]},
+        {"title": "Other", "url": "https://other.example.com/", "content": "Something else entirely", "engines": ["tavily"]},
+    ]
+    ddg = [
+        {"title": "Other", "url": "http://www.other.example.com", "content": "Something else entirely", "engines": ["duckduckgo"]},
+        {"title": "Mirror", "url": "https://mirror.example.org/a", "content": ARTICLE + " reports said", "engines": ["duckduckgo"]},
+    ]
+    merged = merge_results([tavily, ddg])
+    assert len(merged) == 2
+    assert {tuple(entry["engines"]) for entry in merged} == {("tavily", "duckduckgo")}
+    assert merged[0]["score"] >= merged[1]["score"]
+    # the longer text of a near-duplicate is kept
+    assert any(entry["content"].endswith("reports said") for entry in merged)
+
+
+def test_fan_out_runs_concurrently_and_skips_slow_or_failing_engines():
+    calls = []
+
+    async def fast(query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return [{"title": query, "url": f"https://fast.example.com/{query}", "content": f"{query} result text"}]
+
+    async def slow(query):
+        await asyncio.sleep(5)
+        return []
+
+    async def broken(query):
+        raise RuntimeError("rate limited")
+
+    search = FanOutSearch({"fast": fast, "slow": slow, "broken": broken}, timeout=0.2, stats=dict.fromkeys(fanout_stats, 0))
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await search.search(["alpha", "beta", "alpha", "gamma"])
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result["queries"] == ["alpha", "beta", "gamma"]
+    assert sorted(calls) == ["alpha", "beta", "gamma"]
+    assert elapsed < 1.0
+    assert [r["url"].rsplit("/", 1)[1] for r in result["results"]] == ["alpha", "beta", "gamma"]
+    assert (search.stats["timeouts"], search.stats["errors"], search.stats["calls"]) == (3, 3, 9)
@@ -0,0 +1,113 @@
+import sys
+import os
+import asyncio
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, ToolCallPart, UserPromptPart
+
+from src.utils.history import HistoryManager
+from src.utils.session_store import (
+    ConversationState,
+    MemorySessionStore,
+    SessionLockTimeout,
+    SQLiteSessionStore,
+    deserialize_messages,
+    serialize_messages,
+)
+
+MESSAGES = [
+    ModelRequest(parts=[UserPromptPart(content="Sum A1:A10")]),
+    ModelResponse(parts=[ToolCallPart(tool_name="compute_formula", args={"formula": "=SUM(A1:A10)"}, tool_call_id="c1")]),
+    ModelResponse(parts=[TextPart(content="The sum is 55")]),
+]
+
+
+def test_messages_round_trip_compactly():
+    data = serialize_messages(MESSAGES * 20)
+    assert deserialize_messages(data) == MESSAGES * 20
+    assert len(data) < len(repr(MESSAGES * 20)) / 10
+
+
+def test_sqlite_store_is_shared_between_instances_and_expires(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    async def scenario():
+        first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+        await first.save("alice", ConversationState(summary="earlier", messages=MESSAGES))
+        loaded = await second.load("alice")
+        assert loaded.summary == "earlier" and loaded.messages == MESSAGES
+        assert await second.expire(idle_seconds=3600) == 0
+        assert await second.expire(idle_seconds=-1) == 1
+        assert await first.load("alice") is None
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_requests_of_one_user_do_not_interleave(tmp_path, kind):
+    order = []
+
+    async def request(store, name):
+        async with store.lock("alice"):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.05)
+            order.append(f"{name} end")
+
+    async def scenario():
+        if kind == "memory":
+            first = second = MemorySessionStore()
+        else:
+            # two stores on one file stand in for two worker processes
+            first, second = SQLiteSessionStore(str(tmp_path / "s.sqlite3")), SQLiteSessionStore(str(tmp_path / "s.sqlite3"))
+        await asyncio.gather(request(first, "a"), request(second, "b"), store_other_user(second))
+
+    async def store_other_user(store):
+        async with store.lock("bob"):
+            order.append("bob")
+
+    asyncio.run(scenario())
+    alice = [event for event in order if event != "bob"]
+    assert alice in (["a start", "a end", "b start", "b end"], ["b start", "b end", "a start", "a end"])
+    assert order.index("bob") < 3
+
+
+def test_lock_wait_times_out(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+
+    async def scenario():
+        holder, waiter = SQLiteSessionStore(path), SQLiteSessionStore(path, lock_wait=0.1)
+        async with holder.lock("alice"):
+            with pytest.raises(SessionLockTimeout):
+                async with waiter.lock("alice"):
+                    pass
+
+    asyncio.run(scenario())
+
+
+def test_lease_is_renewed_while_the_lock_is_held(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+
+    async def scenario():
+        holder, waiter = SQLiteSessionStore(path, lock_lease=0.3), SQLiteSessionStore(path, lock_wait=1.0)
+        async with holder.lock("alice"):
+            # held for more than three leases; another worker must not take it over
+            with pytest.raises(SessionLockTimeout):
+                async with waiter.lock("alice"):
+                    pass
+        async with waiter.lock("alice"):
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_history_manager_persists_through_the_store(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+
+    async def scenario():
+        await HistoryManager(store=SQLiteSessionStore(path)).append("alice", MESSAGES)
+        return await HistoryManager(store=SQLiteSessionStore(path)).get("alice")
+
+    assert asyncio.run(scenario()) == MESSAGES
@@ -0,0 +1,96 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai.tools import Tool
+
+from src.utils.single_flight import SingleFlight, coalesced_search_tool
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return f"result {key}"
+
+    group = SingleFlight("test")
+
+    async def run():
+        return await asyncio.gather(*(group.do(key, lambda key=key: fetch(key)) for key in ["a", "a", "b", "a"]))
+
+    assert asyncio.run(run()) == ["result a", "result a", "result b", "result a"]
+    assert sorted(calls) == ["a", "b"]
+    assert group.stats == {"calls": 4, "saved_calls": 2, "in_flight": 0}
+
+
+def test_a_caller_leaving_does_not_cancel_the_call_for_the_others():
+    group = SingleFlight("test")
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        finished.append(True)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(group.do("k", slow))
+        second = asyncio.ensure_future(group.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done" and finished == [True]
+
+
+def test_errors_reach_every_waiter_and_nothing_is_kept():
+    group = SingleFlight("test")
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        results = await asyncio.gather(group.do("k", failing), group.do("k", failing), return_exceptions=True)
+        again = await asyncio.gather(group.do("k", failing), return_exceptions=True)
+        return results + again
+
+    assert [str(result) for result in asyncio.run(run())] == ["upstream down"] * 3
+    assert len(attempts) == 2
+
+
+def test_followers_get_the_leaders_result_or_run_themselves():
+    group = SingleFlight("test")
+
+    async def run():
+        with group.leading("k") as publish:
+            shared = group.follower("k")
+            publish("answer")
+        published = await shared
+        with group.leading("k"):
+            abandoned = group.follower("k")
+        return published, abandoned.cancelled(), group.follower("k")
+
+    assert asyncio.run(run()) == ("answer", True, None)
+
+
+def test_search_tool_is_coalesced_per_engine_and_options():
+    queries = []
+
+    async def search(query: str, topic: str = "general"):
+        queries.append((query, topic))
+        await asyncio.sleep(0.02)
+        return [{"title": query}]
+
+    tool = coalesced_search_tool(Tool(search), "test-engine")
+
+    async def run():
+        return await asyncio.gather(tool.function("Solar panels"), tool.function("solar panels?"), tool.function("solar panels", topic="news"))
+
+    results = asyncio.run(run())
+    assert results[0] == results[1] and len(queries) == 2
@@ -0,0 +1,61 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+
+from src.utils.streaming import emit_progress, final_result, sse_event, stream_run
+
+
+def test_tokens_tool_calls_and_nested_progress_are_streamed():
+    inner = Agent(TestModel(custom_output_text="inner"))
+    outer = Agent(TestModel(custom_output_text="final answer", call_tools=["ask_inner"]))
+
+    @inner.tool_plain
+    def lookup() -> str:
+        emit_progress("searching", query="q")
+        return "found"
+
+    @outer.tool_plain
+    async def ask_inner(question: str) -> str:
+        return (await inner.run(question)).output
+
+    async def collect():
+        return [event async for event in stream_run(outer, "hi")]
+
+    events = asyncio.run(collect())
+    kinds = [kind for kind, _ in events]
+    assert ("tool", {"name": "ask_inner"}) in events
+    assert ("status", {"stage": "searching", "query": "q"}) in events
+    assert "".join(data for kind, data in events if kind == "token") == "final answer"
+    assert kinds[-1] == "result" and events[-1][1].output == "final answer"
+
+
+def test_closing_the_stream_cancels_the_run():
+    started, finished = asyncio.Event(), []
+    agent = Agent(TestModel(call_tools=["slow"]))
+
+    @agent.tool_plain
+    async def slow() -> str:
+        started.set()
+        await asyncio.sleep(10)
+        finished.append(True)
+        return "done"
+
+    async def scenario():
+        events = stream_run(agent, "hi")
+        assert (await events.__anext__())[0] == "tool"
+        await started.wait()
+        await events.aclose()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert finished == []
+
+
+def test_final_result_and_sse_format():
+    agent = Agent(TestModel(custom_output_text="ok"))
+    assert asyncio.run(final_result(stream_run(agent, "hi"))).output == "ok"
+    assert sse_event("token", "a\nb") == 'event: token\ndata: "a\\nb"\n\n'
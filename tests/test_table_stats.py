@@ -0,0 +1,66 @@
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.table_stats import Table, TableError, describe, group_by, pivot
+
+ROWS = [
+    ["Region", "Rep", "Sales"],
+    ["West", "a", 100],
+    ["East", "b", 200],
+    ["West", "b", 50],
+    ["East", "a", None],
+    ["West", "a", 30],
+]
+
+
+def test_describe_numeric_and_text_columns():
+    summary = describe(Table.from_rows(ROWS))
+    assert summary["Sales"]["count"] == 4 and summary["Sales"]["blank"] == 1
+    assert summary["Sales"]["sum"] == 380.0 and summary["Sales"]["median"] == 75.0
+    assert summary["Region"] == {"count": 5, "blank": 0, "unique": 2, "top": "West", "top_count": 3}
+
+
+def test_group_by_ignores_blanks():
+    result = group_by(Table.from_rows(ROWS), ["Region"], {"Sales": ["sum", "mean", "count", "min", "max", "median"]})
+    assert result["columns"] == ["Region", "sum(Sales)", "mean(Sales)", "count(Sales)", "min(Sales)", "max(Sales)", "median(Sales)"]
+    assert result["rows"] == [
+        ["East", 200.0, 200.0, 1.0, 200.0, 200.0, 200.0],
+        ["West", 180.0, 60.0, 3.0, 30.0, 100.0, 50.0],
+    ]
+    multi = group_by(Table.from_rows(ROWS), ["Region", "Rep"], {"Sales": ["sum"]}, limit=2)
+    assert multi["total_groups"] == 4 and multi["truncated"]
+    assert multi["rows"] == [["East", "a", 0.0], ["East", "b", 200.0]]
+
+
+def test_std_is_exact_for_large_values():
+    table = Table({"k": ["x"] * 4, "v": [1e9 + 1, 1e9 + 2, 1e9 + 3, 1e9 + 4]})
+    [[_, std]] = group_by(table, ["k"], {"v": ["std"]})["rows"]
+    assert std == pytest.approx(1.2909944, rel=1e-6)
+
+
+def test_pivot():
+    result = pivot(Table.from_rows(ROWS), "Rep", "Region", "Sales", "sum")
+    assert result["columns"] == ["Rep", "East", "West"]
+    # a's East sales are all blank: an empty cell, as in Excel
+    assert result["rows"] == [["a", None, 130.0], ["b", 200.0, 50.0]]
+
+
+def test_booleans_and_numbers_are_different_groups():
+    table = Table({"k": [True, 1, 1.0, "x", False, None], "v": [1, 2, 3, 4, 5, 6]})
+    result = group_by(table, ["k"], {"v": ["sum"]})
+    assert result["rows"] == [[1, 5.0], ["x", 4.0], [False, 5.0], [True, 1.0], [None, 6.0]]
+    assert [type(row[0]) for row in result["rows"][2:4]] == [bool, bool]
+
+
+def test_errors():
+    table = Table.from_rows(ROWS)
+    with pytest.raises(TableError):
+        group_by(table, ["Nope"], {"Sales": ["sum"]})
+    with pytest.raises(TableError):
+        group_by(table, ["Region"], {"Rep": ["sum"]})
+    with pytest.raises(TableError):
+        Table.from_rows([["a", "b"], [1]])
@@ -0,0 +1,95 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.exceptions import UsageLimitExceeded
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.usage import RequestUsage
+
+from src.utils.usage_budget import MeteredModel, UsageBudget, UsageMeter, current_meter, metered, usage_totals
+import src.utils.usage_budget as usage_budget
+
+
+def answer(messages, info: AgentInfo):
+    return ModelResponse(parts=[TextPart("done")], usage=RequestUsage(input_tokens=100, output_tokens=10))
+
+
+def delegate(messages, info: AgentInfo):
+    # calls the nested agent once, then answers
+    if any(isinstance(part, ToolReturnPart) for message in messages for part in message.parts):
+        return ModelResponse(parts=[TextPart("summary")], usage=RequestUsage(input_tokens=200, output_tokens=20))
+    return ModelResponse(parts=[ToolCallPart("research", {"query": "q"})], usage=RequestUsage(input_tokens=50, output_tokens=5))
+
+
+def nested_agents():
+    inner = Agent(MeteredModel(FunctionModel(answer)))
+    outer = Agent(MeteredModel(FunctionModel(delegate)))
+
+    @outer.tool_plain
+    async def research(query: str) -> str:
+        return (await inner.run(query)).output
+
+    return outer
+
+
+def test_meter_sums_usage_across_nested_agents(monkeypatch):
+    monkeypatch.setattr(usage_budget, "USAGE_BUDGETS", {})
+    monkeypatch.setitem(usage_totals, "default", usage_budget._empty_totals())
+
+    async def run():
+        with metered("7") as meter:
+            result = await nested_agents().run("go")
+        return result, meter
+
+    result, meter = asyncio.run(run())
+    assert result.output == "summary"
+    assert meter.report() == {"requests": 3, "input_tokens": 350, "output_tokens": 35, "total_tokens": 385}
+    # the outer run's own usage misses the nested agent
+    assert result.usage.requests == 2
+    assert usage_totals["default"]["chat_requests"] == 1 and usage_totals["default"]["input_tokens"] == 350
+
+
+def test_budget_stops_the_run_across_agents(monkeypatch):
+    monkeypatch.setattr(usage_budget, "USAGE_BUDGETS", {"default": {"request_limit": 10}, "free": {"request_limit": 2}})
+    monkeypatch.setattr(usage_budget, "USAGE_USER_TIERS", {"alice": "free"})
+
+    async def run(user_id):
+        with metered(user_id):
+            return await nested_agents().run("go")
+
+    # the nested agent's request is the third one of the request
+    with pytest.raises(UsageLimitExceeded):
+        asyncio.run(run("alice"))
+    assert asyncio.run(run("bob")).output == "summary"
+
+
+def test_token_limits():
+    meter = UsageMeter(budget=UsageBudget(total_tokens_limit=150))
+    meter.before_request()
+    meter.record("m", RequestUsage(input_tokens=100, output_tokens=10))
+    with pytest.raises(UsageLimitExceeded):
+        meter.record("m", RequestUsage(input_tokens=30, output_tokens=20))
+    assert meter.total_tokens == 160
+
+
+def test_streamed_requests_are_metered():
+    async def stream(messages, info: AgentInfo):
+        yield "hello "
+        yield "world"
+
+    agent = Agent(MeteredModel(FunctionModel(stream_function=stream)))
+
+    async def run():
+        with metered() as meter:
+            async with agent.run_stream("hi") as result:
+                await result.get_output()
+        return meter
+
+    meter = asyncio.run(run())
+    assert meter.requests == 1 and meter.output_tokens > 0
+    assert current_meter() is None
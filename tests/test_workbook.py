@@ -0,0 +1,87 @@
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.workbook import Workbook, CircularReferenceError
+
+
+def build_workbook():
+    workbook = Workbook()
+    workbook.set_cells({
+        "A1": 10, "A2": 20, "rate": 2,
+        "B1": "=A1*2",
+        "B2": "=SUM(A1:A2)+B1",
+        "C1": "=B2/rate",
+        "D1": "=A2+1",
+    })
+    return workbook
+
+
+def test_values_and_formulas_are_evaluated():
+    workbook = build_workbook()
+    assert workbook.snapshot(["B1", "B2", "C1", "D1"]) == {"B1": 20.0, "B2": 50.0, "C1": 25.0, "D1": 21.0}
+    assert workbook.get_formula("b2") == "=SUM(A1:A2)+B1"
+
+
+def test_only_downstream_cells_are_recalculated_in_order():
+    workbook = build_workbook()
+    assert workbook.set_cell("A1", 5) == ["B1", "B2", "C1"]
+    assert workbook.get_cell("C1") == 17.5
+    assert workbook.set_cell("rate", 5) == ["C1"]
+    assert workbook.set_cell("Z9", 1) == []
+
+
+def test_names_defined_later_resolve_dependents():
+    workbook = Workbook()
+    workbook.set_cell("total", "=price*qty")
+    assert workbook.snapshot(["total"]) == {"TOTAL": "#NAME?"}
+    workbook.set_cells({"price": 3, "qty": 4})
+    assert workbook.get_cell("total") == 12.0
+
+
+def test_what_if_restores_the_workbook():
+    workbook = build_workbook()
+    before = workbook.snapshot()
+    assert workbook.what_if({"A1": 100}, ["C1"]) == {"C1": (25.0, 160.0)}
+    assert workbook.what_if({"B1": "=A1*10"}, ["C1"]) == {"C1": (25.0, 65.0)}
+    assert workbook.snapshot() == before
+    assert workbook.get_formula("B1") == "=A1*2"
+    workbook.set_cell("A1", 1)
+    assert workbook.get_cell("B1") == 2.0
+
+
+def test_what_if_is_not_seen_by_concurrent_readers():
+    workbook = build_workbook()
+    before = workbook.snapshot()
+
+    def scenarios():
+        for _ in range(2000):
+            workbook.what_if({"A1": 100}, ["C1"])
+
+    def reads():
+        return {workbook.snapshot(["C1"])["C1"] for _ in range(2000)}
+
+    # switch threads often so an unlocked scenario would be caught half-applied
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(scenarios), pool.submit(scenarios), pool.submit(reads), pool.submit(reads)]
+            seen = set().union(*(future.result() or set() for future in futures))
+    finally:
+        sys.setswitchinterval(interval)
+    assert seen == {25.0}
+    assert workbook.snapshot() == before
+
+
+def test_circular_references_are_rejected():
+    workbook = build_workbook()
+    with pytest.raises(CircularReferenceError):
+        workbook.set_cell("A1", "=C1")
+    with pytest.raises(CircularReferenceError):
+        workbook.set_cell("E1", "=E1+1")
+    assert workbook.get_cell("A1") == 10
@@ -0,0 +1,79 @@
+import sys
+import os
+import asyncio
+
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+
+from src.utils.streaming import emit_progress, stream_run
+from src.utils.ws_sessions import SocketSession
+
+
+def make_app(state):
+    inner = Agent(TestModel(call_tools=["fetch"]))
+    outer = Agent(TestModel(custom_output_text="outer done", call_tools=["ask_inner"]))
+
+    @inner.tool_plain
+    async def fetch() -> str:
+        # stands in for a slow upstream HTTP call of a nested agent
+        state["fetch_started"] = True
+        emit_progress("fetching")
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            state["fetch_cancelled"] = True
+            raise
+        return "late"
+
+    @outer.tool_plain
+    async def ask_inner(question: str) -> str:
+        return (await inner.run(question)).output
+
+    app = FastAPI()
+
+    @app.websocket("/ws")
+    async def ws(websocket: WebSocket):
+        await websocket.accept()
+
+        async def handle(message):
+            async for kind, data in stream_run(outer, message["message"]):
+                if kind == "result":
+                    yield "done", {"reply": data.output}
+                else:
+                    yield kind, data
+
+        await SocketSession(websocket, handle).serve()
+
+    return app
+
+
+def receive_until(ws, predicate):
+    messages = []
+    while not messages or not predicate(messages[-1]):
+        messages.append(ws.receive_json())
+    return messages
+
+
+def test_cancel_stops_the_nested_run():
+    state = {}
+    with TestClient(make_app(state)).websocket_connect("/ws") as ws:
+        ws.send_json({"type": "chat", "id": "r1", "message": "hi"})
+        receive_until(ws, lambda m: m["type"] == "status" and m["data"]["stage"] == "fetching")
+        ws.send_json({"type": "cancel", "id": "r1"})
+        assert receive_until(ws, lambda m: m["type"] in ("cancelled", "done"))[-1] == {"type": "cancelled", "id": "r1"}
+    assert state == {"fetch_started": True, "fetch_cancelled": True}
+
+
+def test_duplicate_ids_and_bad_messages_are_rejected():
+    with TestClient(make_app({})).websocket_connect("/ws") as ws:
+        ws.send_text("not json")
+        assert ws.receive_json()["data"]["detail"] == "Messages must be JSON objects"
+        ws.send_json({"type": "chat", "id": "r1", "message": "hi"})
+        ws.send_json({"type": "chat", "id": "r1", "message": "hi"})
+        error = receive_until(ws, lambda m: m["type"] == "error")[-1]
+        assert error["id"] == "r1" and "already running" in error["data"]["detail"]